@@ -1,15 +1,46 @@
-import io, os, tempfile, base64, subprocess, shutil
+import io, base64, time
+from typing import TYPE_CHECKING
+_t_imports = time.perf_counter()
 import numpy as np
-import soundfile as sf
-import librosa
+import librosa  # lazy-loading package: submodules load on first use
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from music21 import stream, note, meter, tempo, key as m21key, interval, pitch, clef
-from pydub import AudioSegment            
-from gameJudger import analyze_single_player  
+from decoding import DecodeError, FfmpegNotFound, decode_to_array
+from gameJudger import SPLIT_MIN_REGION_SEC, split_executor
+from gameService import AnalysisService
+from jobQueue import JobQueue
+from workerPool import JobError
+from metrics import configure_logging, count_audio, stage
+from responseFormat import check_encoding, render, to_columns
+from scoreWriter import SCORE_WRITER, NoteEvent, Score, detect_key, export_score, midi_to_name, parse_key_text, transpose_semitones
+if TYPE_CHECKING:  # music21 itself is only imported on the SCORE_WRITER=music21 path
+    from music21 import note, stream
+IMPORTS_SEC = round(time.perf_counter() - _t_imports, 3)
+
+configure_logging()
+
+def warm_up_transcriber():
+    """
+    Extra worker warm-up for /api/transcribe-and-transpose: a synthetic clip
+    through analyze_to_score and the active score writer (analyze_to_stream
+    and the first music21 import when SCORE_WRITER=music21).
+    """
+    from workerPool import synthetic_clip
+
+    _, _, wav_bytes = synthetic_clip()
+    if SCORE_WRITER == "music21":
+        s, _, _, _ = analyze_to_stream(wav_bytes)
+        export_stream(s)
+    else:
+        export_score(analyze_to_score(wav_bytes))
+
+# pool, cache, metrics and the game endpoints (shared with server.py)
+service = AnalysisService(warm_ups=[warm_up_transcriber], imports_sec=IMPORTS_SEC)
+# background jobs on the same pool + cache: submit, poll / SSE, fetch (jobQueue)
+jobs = JobQueue(service.pool, service.cache)
+service.attach_jobs(jobs)
 
-app = FastAPI()
+app = FastAPI(lifespan=service.lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,8 +55,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+service.mount(app)
 
-def note_to_name_octave(n: note.Note) -> tuple[str, int]:
+def note_to_name_octave(n: "note.Note") -> tuple[str, int]:
     step = n.pitch.step
     acc = n.pitch.accidental
     octv = n.pitch.octave
@@ -51,28 +83,24 @@ def sanitize_note_name(name: str) -> str:
             .replace("♭", "b")
     )
 
-def ensure_ffmpeg():
-    if not shutil.which("ffmpeg"):
-        raise HTTPException(
-            status_code=500,
-            detail="ffmpeg not found. Install it (e.g., `brew install ffmpeg`) and restart."
-        )
+def transcode_to_wav_bytes(raw_bytes: bytes, in_ext: str = "", target_sr: int = 22050) -> bytes:
+    """
+    Upload -> 16-bit mono WAV at target_sr, in memory. The container is
+    sniffed from the bytes (decoding.decode_to_array picks the decoder), so
+    `in_ext` is only kept for callers that still pass it.
+    """
+    import soundfile as sf
 
-def transcode_to_wav_bytes(raw_bytes: bytes, in_ext: str, target_sr: int = 22050) -> bytes:
-    ensure_ffmpeg()
     try:
-        with tempfile.TemporaryDirectory() as tmp:
-            inp = os.path.join(tmp, f"in.{in_ext}")
-            out = os.path.join(tmp, "out.wav")
-            with open(inp, "wb") as f:
-                f.write(raw_bytes)
-            cmd = ["ffmpeg", "-y", "-i", inp, "-ar", str(target_sr), "-ac", "1", out]
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            with open(out, "rb") as f:
-                return f.read()
-    except subprocess.CalledProcessError as e:
-        err = e.stderr.decode(errors="ignore")[:600]
-        raise HTTPException(status_code=400, detail=f"ffmpeg failed: {err}")
+        with stage("transcode"):
+            y, sr = decode_to_array(raw_bytes, target_sr=target_sr)
+            buf = io.BytesIO()
+            sf.write(buf, y, sr, format="WAV", subtype="PCM_16")
+    except FfmpegNotFound as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except DecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return buf.getvalue()
 
 # ---------- RHYTHM POLICY: only these note values, no ties ----------
 ALLOWED_DURS = [4.0, 2.0, 1.5, 1.0]   # whole, half, dotted-quarter, quarter
@@ -117,23 +145,126 @@ def split_across_measures_no_tie(qlen: float, pos_in_measure: float) -> list[tup
 
     return out
 
+# ---------- shared analysis front-end ----------
+YIN_FMIN_NOTE, YIN_FMAX_NOTE = "G3", "E7"
+YIN_HOP = 512
+MEL_N_FFT = 2048
+
+def remix_frame_ranges(intervals: np.ndarray, sr: int, n_frames: int, hop_length: int = 512) -> list[tuple[int, int]]:
+    """
+    Frame ranges [k0, k1) covering the clip librosa.effects.remix built
+    from `intervals`, cut at the joins where a silence was taken out and
+    at least SPLIT_MIN_REGION_SEC long each (ANALYSIS_SPLIT_WORKERS).
+    """
+    min_frames = int(SPLIT_MIN_REGION_SEC * sr / hop_length)
+    joins = np.cumsum(intervals[:, 1] - intervals[:, 0])[:-1]
+    bounds = [0]
+    for k in np.round(joins / hop_length).astype(int):
+        if k - bounds[-1] >= min_frames and n_frames - k >= min_frames:
+            bounds.append(int(k))
+    bounds.append(n_frames)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def map_frame_ranges(fn, frame_ranges: list[tuple[int, int]], executor, *args) -> np.ndarray:
+    """
+    fn(*args, k0, k1) for every frame range, in parallel on `executor`,
+    joined along the frame (last) axis in order.
+    """
+    futures = [executor.submit(fn, *args, k0, k1) for k0, k1 in frame_ranges]
+    return np.concatenate([f.result() for f in futures], axis=-1)
+
+def _mel_frames(y_pad: np.ndarray, sr: int, hop_length: int, k0: int, k1: int) -> np.ndarray:
+    return librosa.feature.melspectrogram(
+        y=y_pad[k0 * hop_length:(k1 - 1) * hop_length + MEL_N_FFT],
+        sr=sr, n_fft=MEL_N_FFT, hop_length=hop_length, center=False,
+    )
+
+def onset_envelopes(y: np.ndarray, sr: int, hop_length: int = 512, frame_ranges=None, executor=None):
+    """
+    (beat envelope, onset envelope) from ONE mel spectrogram.
+
+    beat_track and onset_detect each build their own mel spectrogram when
+    given `y`; they only differ in how the mel bands are combined (median
+    for beats, mean for onsets), so both come from the same spectrogram here
+    and the results are identical to calling them with `y`.
+
+    With an executor the spectrogram's frame ranges are computed in
+    parallel (same frames as center=True); dB scaling and the envelopes
+    still see the whole clip.
+    """
+    if executor is not None and frame_ranges and len(frame_ranges) > 1:
+        y_pad = np.pad(y, (MEL_N_FFT // 2, MEL_N_FFT // 2))  # center=True, pad_mode="constant"
+        S = map_frame_ranges(_mel_frames, frame_ranges, executor, y_pad, sr, hop_length)
+    else:
+        S = librosa.feature.melspectrogram(y=y, sr=sr, n_fft=MEL_N_FFT, hop_length=hop_length)
+    S_db = librosa.power_to_db(S)
+    beat_env = librosa.onset.onset_strength(S=S_db, sr=sr, hop_length=hop_length, aggregate=np.median)
+    onset_env = librosa.onset.onset_strength(S=S_db, sr=sr, hop_length=hop_length)
+    return beat_env, onset_env
+
+def segment_median_hz(y: np.ndarray, sr: int, cuts: list[float], executor=None) -> list[float | None]:
+    """
+    Median YIN f0 of every cuts[i]..cuts[i+1] segment (None = rest): one
+    librosa.yin call per segment, zero-padded at both segment edges. With
+    an executor the segments run in parallel, same values.
+    """
+    fmin, fmax = librosa.note_to_hz(YIN_FMIN_NOTE), librosa.note_to_hz(YIN_FMAX_NOTE)
+    bounds = [(int(cuts[i] * sr), int(cuts[i + 1] * sr)) for i in range(len(cuts) - 1)]
+    min_len = int(0.01 * sr)
+
+    def median_hz(a, b):
+        if b - a < min_len:
+            return None
+        f0 = librosa.yin(y[a:b], fmin=fmin, fmax=fmax, sr=sr)
+        f0 = f0[np.isfinite(f0)]
+        return float(np.median(f0)) if f0.size else None
+
+    if executor is not None and len(bounds) > 1:
+        return [f.result() for f in [executor.submit(median_hz, a, b) for a, b in bounds]]
+    return [median_hz(a, b) for a, b in bounds]
+
 # ---------- analysis (PITCH UNCHANGED, RHYTHM REWRITTEN) ----------
-def analyze_to_stream(
+LOWEST_MIDI = 55  # G3, the violin's open G string
+
+def analyze_to_score(
     wav_bytes: bytes,
     quantize_divisions: int = 8,          # ignored (kept for compatibility)
     quantize_strategy: str = "nearest",   # "nearest" | "floor" | "ceil"
     bpm_override: float | None = None,    # optional tempo spelling
-):
-    y, sr = sf.read(io.BytesIO(wav_bytes))
-    if y.ndim > 1:
-        y = y[:, 0]
-
-    # cleanup
-    y = librosa.util.normalize(y)
-    y = librosa.effects.remix(y, intervals=librosa.effects.split(y, top_db=30))
+    executor=None,                        # None = gameJudger.split_executor()
+) -> Score:
+    """
+    Audio -> scoreWriter.Score (note/rest events, tempo, Krumhansl key).
 
-    # tempo detection
-    tempo_est, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
+    Long clips run the mel spectrogram for their silence-separated regions
+    and the per-segment YIN calls in parallel on `executor`
+    (ANALYSIS_SPLIT_WORKERS); the result is the same as the serial one.
+    """
+    import soundfile as sf
+
+    with stage("load"):
+        y, sr = sf.read(io.BytesIO(wav_bytes))
+        if y.ndim > 1:
+            y = y[:, 0]
+        count_audio(len(y) / sr)
+
+        # cleanup
+        y = librosa.util.normalize(y)
+        intervals = librosa.effects.split(y, top_db=30)
+        y = librosa.effects.remix(y, intervals=intervals)
+
+    # regions between removed silences, analysed in parallel when enabled
+    executor = executor or split_executor()
+    frame_ranges = None
+    if executor is not None and len(intervals) > 1:
+        frame_ranges = remix_frame_ranges(intervals, sr, 1 + len(y) // YIN_HOP, YIN_HOP)
+
+    with stage("onsets"):
+        # one mel spectrogram feeds both tempo and onset detection
+        beat_env, onset_env = onset_envelopes(y, sr, YIN_HOP, frame_ranges, executor)
+
+        # tempo detection
+        tempo_est, beat_frames = librosa.beat.beat_track(onset_envelope=beat_env, sr=sr)
     beats_t = librosa.frames_to_time(beat_frames, sr=sr)
     if beats_t.size >= 2:
         ibI = np.diff(beats_t)
@@ -145,10 +276,11 @@ def analyze_to_stream(
     q_sec = 60.0 / tempo_used
 
     # onsets (preserve segmentation; no snapping/merging)
-    on_frames = librosa.onset.onset_detect(
-        y=y, sr=sr, units="frames", backtrack=True,
-        pre_max=30, post_max=30, pre_avg=40, post_avg=40, delta=0.07, wait=12
-    )
+    with stage("onsets"):
+        on_frames = librosa.onset.onset_detect(
+            onset_envelope=onset_env, sr=sr, units="frames", backtrack=True,
+            pre_max=30, post_max=30, pre_avg=40, post_avg=40, delta=0.07, wait=12
+        )
     on_times = librosa.frames_to_time(on_frames, sr=sr)
     total_t = librosa.get_duration(y=y, sr=sr)
 
@@ -157,73 +289,94 @@ def analyze_to_stream(
     cuts = [t for t in cuts if 0.0 <= t <= total_t + 1e-6]
     cuts.sort()
 
-    # stream: treble, 4/4, allowed durations, NO ties
-    s = stream.Stream()
-    s.append(tempo.MetronomeMark(number=tempo_used))
-    s.append(meter.TimeSignature("4/4"))
-    s.append(clef.TrebleClef())
+    # events: 4/4, allowed durations, NO ties
+    events = []
 
     pos_in_measure = 0.0 
 
-    for i in range(len(cuts) - 1):
-        t0, t1 = cuts[i], cuts[i + 1]
-        seg = y[int(t0 * sr):int(t1 * sr)]
+    # pitch of every segment (rests come back as None)
+    with stage("yin"):
+        seg_hz = segment_median_hz(y, sr, cuts, executor)
 
-        dur_q_raw = (t1 - t0) / q_sec
-        qlen_allowed = pick_allowed_duration(dur_q_raw, quantize_strategy)
+    with stage("segmentation"):
+        for i in range(len(cuts) - 1):
+            t0, t1 = cuts[i], cuts[i + 1]
 
-        if len(seg) < int(0.01 * sr):
-            pieces = split_across_measures_no_tie(qlen_allowed, pos_in_measure)
-            for _, ql in pieces:
-                s.append(note.Rest(quarterLength=ql))
-                pos_in_measure = (pos_in_measure + ql) % 4.0
-            continue
+            dur_q_raw = (t1 - t0) / q_sec
+            qlen_allowed = pick_allowed_duration(dur_q_raw, quantize_strategy)
 
-        f0 = librosa.yin(seg, fmin=librosa.note_to_hz("G3"), fmax=librosa.note_to_hz("E7"), sr=sr)
-        f0 = f0[np.isfinite(f0)]
+            if seg_hz[i] is None:
+                pieces = split_across_measures_no_tie(qlen_allowed, pos_in_measure)
+                for _, ql in pieces:
+                    events.append(NoteEvent(None, ql))
+                    pos_in_measure = (pos_in_measure + ql) % 4.0
+            else:
+                # nearest semitone (same rounding as librosa.hz_to_note), nothing below G3
+                midi = max(int(np.round(librosa.hz_to_midi(seg_hz[i]))), LOWEST_MIDI)
 
-        if f0.size == 0:
-            pieces = split_across_measures_no_tie(qlen_allowed, pos_in_measure)
-            for _, ql in pieces:
-                s.append(note.Rest(quarterLength=ql))
-                pos_in_measure = (pos_in_measure + ql) % 4.0
-        else:
-            hz = float(np.median(f0))
-            pname = sanitize_note_name(librosa.hz_to_note(hz))
-            try:
-                if note.Note(pname).pitch.midi < note.Note("G3").pitch.midi:
-                    pname = "G3"
-            except Exception:
-                pname = "G3"
-
-            pieces = split_across_measures_no_tie(qlen_allowed, pos_in_measure)
-            for kind, ql in pieces:
-                if kind == "rest":
-                    s.append(note.Rest(quarterLength=ql))
-                else:
-                    s.append(note.Note(pname, quarterLength=ql))  # NO ties added
-                pos_in_measure = (pos_in_measure + ql) % 4.0
+                pieces = split_across_measures_no_tie(qlen_allowed, pos_in_measure)
+                for kind, ql in pieces:
+                    events.append(NoteEvent(None if kind == "rest" else midi, ql))  # NO ties added
+                    pos_in_measure = (pos_in_measure + ql) % 4.0
 
     # key detection
-    try:
-        k = s.analyze("Krumhansl")
-        s.insert(0, m21key.Key(k.tonic.name, k.mode))
-        key_text = f"{k.tonic.name} {k.mode}"
-    except Exception:
-        s.insert(0, m21key.Key("C", "major"))
-        key_text = "C major"
+    with stage("key_analysis"):
+        tonic, mode = detect_key(events)
+    return Score(events, tempo_used, tonic=tonic, mode=mode)
 
-    s.makeMeasures(inPlace=True)
-    s.makeNotation(inPlace=True, meterStream=s.recurse().getElementsByClass(meter.TimeSignature))
+# ---------- music21 path (SCORE_WRITER=music21) ----------
+def score_to_stream(score: Score):
+    """
+    music21 Stream for a Score, keyed by music21's own Krumhansl analysis.
+    Returns (stream, key_text).
+    """
+    from music21 import stream, note, meter, tempo, key as m21key, clef
+
+    with stage("music21_build"):
+        s = stream.Stream()
+        s.append(tempo.MetronomeMark(number=score.bpm))
+        s.append(meter.TimeSignature("4/4"))
+        s.append(clef.TrebleClef())
+        for e in score.events:
+            if e.midi is None:
+                s.append(note.Rest(quarterLength=e.quarter_length))
+            else:
+                s.append(note.Note(midi_to_name(e.midi), quarterLength=e.quarter_length))
+
+    with stage("key_analysis"):
+        try:
+            k = s.analyze("Krumhansl")
+            s.insert(0, m21key.Key(k.tonic.name, k.mode))
+            key_text = f"{k.tonic.name} {k.mode}"
+        except Exception:
+            s.insert(0, m21key.Key("C", "major"))
+            key_text = "C major"
 
+    with stage("music21_build"):
+        s.makeMeasures(inPlace=True)
+        s.makeNotation(inPlace=True, meterStream=s.recurse().getElementsByClass(meter.TimeSignature))
+    return s, key_text
+
+def analyze_to_stream(
+    wav_bytes: bytes,
+    quantize_divisions: int = 8,
+    quantize_strategy: str = "nearest",
+    bpm_override: float | None = None,
+):
+    score = analyze_to_score(wav_bytes, quantize_divisions, quantize_strategy, bpm_override)
+    s, key_text = score_to_stream(score)
+    return s, key_text, score.bpm, stream_notes_list(s)
+
+NOTE_COLUMNS = ("note", "octave", "duration_q")  # the transcriber's "notes" table
+
+def stream_notes_list(s) -> list[dict]:
     notes_list = []
     for el in s.flat.notes:
         nm, oc = note_to_name_octave(el)
         notes_list.append({"note": nm, "octave": oc, "duration_q": float(el.quarterLength)})
+    return notes_list
 
-    return s, key_text, float(tempo_used), notes_list
-
-def export_stream(s: stream.Stream):
+def export_stream(s: "stream.Stream"):
     xml_path = s.write("musicxml")
     midi_path = s.write("midi")
     with open(xml_path, "rb") as f:
@@ -238,6 +391,7 @@ def compute_transpose_interval(from_key_text: str, to_key_text: str):
         tk_parts = to_key_text.split()
         fk_tonic = fk_parts[0]
         tk_tonic = tk_parts[0]
+        from music21 import interval, pitch
         i = interval.Interval(pitch.Pitch(fk_tonic), pitch.Pitch(tk_tonic))
         return i
     except Exception as e:
@@ -251,41 +405,23 @@ def root():
         "endpoints": [
             "/api/transcribe-and-transpose",
             "/analyzeSinglePlayer",
+            "/identifySong",
+            "/analyzeBatch",
+            "/ws/judge",
+            "/cacheStats",
+            "/metrics",
+            "/ready",
             "/docs",
         ],
     }
 
 
-@app.post("/api/transcribe-and-transpose")
-async def transcribe_and_transpose(
-    audio: UploadFile = File(...),
-    target_key: str = Form(default=""),
-    semitones: int = Form(default=0),
-    # rhythm controls
-    quantize_divisions: int = Form(default=8),        # kept for compatibility; ignored
-    quantize_strategy: str = Form(default="nearest"), # "nearest" | "floor" | "ceil"
-    bpm_override: float | None = Form(default=None),
-):
-    raw = await audio.read()
-
-    # detect extension
-    ext = "webm"
-    if audio.filename and "." in audio.filename:
-        ext = audio.filename.rsplit(".", 1)[1].lower()
-    elif audio.content_type and "/" in audio.content_type:
-        ext = audio.content_type.split("/", 1)[1].lower()
-
-    wav_bytes = transcode_to_wav_bytes(raw, ext)
-    base_stream, detected_key, bpm, notes_list = analyze_to_stream(
-        wav_bytes,
-        quantize_divisions=quantize_divisions,
-        quantize_strategy=quantize_strategy,
-        bpm_override=bpm_override,
-    )
-
-    orig_xml, orig_midi = export_stream(base_stream)
+def transpose_music21(base_stream, detected_key: str, target_key: str, semitones: int):
+    """
+    SCORE_WRITER=music21: transposed copy of the stream + its key text.
+    """
+    from music21 import key as m21key
 
-    # transposed
     if target_key:
         i = compute_transpose_interval(detected_key, target_key)
         transposed_stream = base_stream.transpose(i)
@@ -293,88 +429,189 @@ async def transcribe_and_transpose(
         tk_tonic = tk_parts[0]
         tk_mode = tk_parts[1] if len(tk_parts) > 1 else "major"
         transposed_stream.insert(0, m21key.Key(tk_tonic, tk_mode))
-        t_key_text = target_key
-    elif semitones != 0:
-        transposed_stream = base_stream.transpose(semitones)
-        t_key_text = f"{detected_key} ({'+' if semitones > 0 else ''}{semitones} st)"
-    else:
-        transposed_stream = base_stream
-        t_key_text = detected_key
+        return transposed_stream, target_key
+    if semitones != 0:
+        return base_stream.transpose(semitones), f"{detected_key} ({'+' if semitones > 0 else ''}{semitones} st)"
+    return base_stream, detected_key
 
-    trans_xml, trans_midi = export_stream(transposed_stream)
+def transpose_score(score: Score, target_key: str, semitones: int):
+    """
+    Event-level transposed Score + its key text + the shift in semitones
+    (MIDI numbers move, spelling follows the new key signature; no stream copies).
+    """
+    if target_key:
+        try:
+            tk_tonic, tk_mode = parse_key_text(target_key)
+            shift = transpose_semitones(score.key_text, target_key)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Could not compute transpose interval: {e}")
+        return score.transposed(shift, tonic=tk_tonic, mode=tk_mode), target_key, shift
+    if semitones != 0:
+        return score.transposed(semitones), f"{score.key_text} ({'+' if semitones > 0 else ''}{semitones} st)", semitones
+    return score, score.key_text, 0
+
+MAX_TARGET_KEYS = 12
+
+def parse_target_keys(target_keys: str) -> list[str]:
+    """
+    "Bb major, Eb major, +2" -> ["Bb major", "Eb major", "+2"].
+    Entries are key names or signed semitone shifts.
+    """
+    items = [t.strip() for t in target_keys.replace(";", ",").split(",") if t.strip()]
+    if len(items) > MAX_TARGET_KEYS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TARGET_KEYS} target_keys per request")
+    return items
 
-    return JSONResponse({
+def transpose_many(score: Score, targets: list[str]) -> list[dict]:
+    """
+    One export per target key / semitone shift, all from the same events.
+    """
+    out = []
+    for target in targets:
+        if target.lstrip("+-").isdigit():
+            transposed, key_text, shift = transpose_score(score, "", int(target))
+        else:
+            transposed, key_text, shift = transpose_score(score, target, 0)
+        with stage("export"):
+            xml, midi = export_score(transposed)
+        out.append({"target": target, "targetKey": key_text, "semitones": shift, "musicxml": xml, "midiB64": midi})
+    return out
+
+def run_transcription(
+    raw: bytes,
+    ext: str,
+    target_key: str = "",
+    semitones: int = 0,
+    quantize_divisions: int = 8,
+    quantize_strategy: str = "nearest",
+    bpm_override: float | None = None,
+    target_keys: list[str] | None = None,
+) -> dict:
+    """
+    Whole transcribe-and-transpose pipeline; runs inside an AnalysisPool worker.
+    Scores are written by scoreWriter, or by music21 when SCORE_WRITER=music21.
+    `target_keys` (see parse_target_keys) adds a "transpositions" list; they
+    are always transposed at the event level, whichever writer is active.
+    "notes" is kept column-wise (NOTE_COLUMNS); the endpoint renders it.
+    """
+    try:
+        wav_bytes = transcode_to_wav_bytes(raw, ext)
+
+        score = analyze_to_score(
+            wav_bytes,
+            quantize_divisions=quantize_divisions,
+            quantize_strategy=quantize_strategy,
+            bpm_override=bpm_override,
+        )
+
+        if SCORE_WRITER == "music21":
+            base_stream, detected_key = score_to_stream(score)
+            bpm, notes = score.bpm, to_columns(stream_notes_list(base_stream), NOTE_COLUMNS)
+            with stage("export"):
+                orig_xml, orig_midi = export_stream(base_stream)
+            with stage("music21_build"):
+                transposed_stream, t_key_text = transpose_music21(base_stream, detected_key, target_key, semitones)
+            with stage("export"):
+                trans_xml, trans_midi = export_stream(transposed_stream)
+        else:
+            detected_key, bpm, notes = score.key_text, score.bpm, score.note_columns()
+            with stage("export"):
+                orig_xml, orig_midi = export_score(score)
+            transposed, t_key_text, _ = transpose_score(score, target_key, semitones)
+            if transposed is score:
+                trans_xml, trans_midi = orig_xml, orig_midi
+            else:
+                with stage("export"):
+                    trans_xml, trans_midi = export_score(transposed)
+
+        transpositions = transpose_many(score, target_keys) if target_keys else None
+    except HTTPException as e:
+        raise JobError(e.status_code, e.detail)
+
+    payload = {
         "detectedKey": detected_key,
         "targetKey": t_key_text,
         "bpm": bpm,
         "timeSignature": "4/4",
-        "notes": notes_list,
+        "notes": notes,
         "original": {"musicxml": orig_xml, "midiB64": orig_midi},
         "transposed": {"musicxml": trans_xml, "midiB64": trans_midi},
-    })
-
-# --- Game endpoint (from your server.py) ---
-@app.post("/analyzeSinglePlayer")
-async def analyze_single_player_endpoint(
-    song_key: str = Form(...),
-    player_audio: UploadFile = File(...),
-):
-    ensure_ffmpeg()  # pydub also needs ffmpeg
+    }
+    if transpositions is not None:
+        payload["transpositions"] = transpositions
+    return payload
 
-    # 1) write upload to temp webm
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp_in:
-        raw_bytes = await player_audio.read()
-        tmp_in.write(raw_bytes)
-        webm_path = tmp_in.name
+def upload_ext(audio: UploadFile) -> str:
+    # detect extension
+    ext = "webm"
+    if audio.filename and "." in audio.filename:
+        ext = audio.filename.rsplit(".", 1)[1].lower()
+    elif audio.content_type and "/" in audio.content_type:
+        ext = audio.content_type.split("/", 1)[1].lower()
+    return ext
+
+def transcription_job(
+    audio: UploadFile,
+    target_key: str,
+    semitones: int,
+    target_keys: str,
+    quantize_divisions: int,
+    quantize_strategy: str,
+    bpm_override: float | None,
+) -> tuple[list, dict]:
+    """
+    (run_transcription args after the upload, result-cache params), shared
+    by the direct endpoint and the job queue so both hit the same cache entries.
+    """
+    targets = parse_target_keys(target_keys)
+    args = [upload_ext(audio), target_key, semitones, quantize_divisions, quantize_strategy, bpm_override, targets]
+    params = dict(
+        target_key=target_key, semitones=semitones, target_keys=targets,
+        quantize_strategy=quantize_strategy, bpm_override=bpm_override,
+    )
+    return args, params
 
-    # 2) make temp wav path
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_out:
-        wav_path = tmp_out.name
+@app.post("/api/transcribe-and-transpose")
+async def transcribe_and_transpose(
+    audio: UploadFile = File(...),
+    target_key: str = Form(default=""),
+    semitones: int = Form(default=0),
+    target_keys: str = Form(default=""),              # "Bb major, Eb major, +2": several exports at once
+    # rhythm controls
+    quantize_divisions: int = Form(default=8),        # kept for compatibility; ignored
+    quantize_strategy: str = Form(default="nearest"), # "nearest" | "floor" | "ceil"
+    bpm_override: float | None = Form(default=None),
+    encoding: str = Form(default="json"),             # "json" | "columnar" | "msgpack"
+):
+    check_encoding(encoding)
+    args, params = transcription_job(
+        audio, target_key, semitones, target_keys, quantize_divisions, quantize_strategy, bpm_override,
+    )
+    raw = await audio.read()
 
-    # 3) transcode webm -> wav (mono, 22050)
-    try:
-        audio_seg = AudioSegment.from_file(webm_path, format="webm")
-        audio_seg = audio_seg.set_channels(1).set_frame_rate(22050)
-        audio_seg.export(wav_path, format="wav")
-    except Exception as e:
-        try: os.remove(webm_path)
-        except: pass
-        try: os.remove(wav_path)
-        except: pass
-        raise e
+    payload, _ = await service.cached_job("transcribe-and-transpose", raw, run_transcription, *args, **params)
+    return render(payload, encoding, tables=("notes",))
 
-    # 4) run your analyzer
-    try:
-        result = analyze_single_player(wav_path, song_key=song_key)
+# run as a background job through POST /api/transcribe-jobs
+jobs.register("transcribe-and-transpose", run_transcription, tables=("notes",))
 
-        # optional debug
-        try:
-            audio_data, sr = sf.read(wav_path)
-            dur_sec = float(len(audio_data) / sr)
-        except Exception:
-            dur_sec = -1.0
-
-        print("---- analyzeSinglePlayer DEBUG ----")
-        print(f"song_key: {song_key}")
-        print(f"uploaded filename: {player_audio.filename}")
-        print(f"raw upload size (bytes): {len(raw_bytes)}")
-        print(f"temp webm path: {webm_path}")
-        print(f"temp wav  path: {wav_path}")
-        print(f"audio duration (sec): {dur_sec:.3f}")
-        print(f"analysis.notes: {result.get('notes')}")
-        print(f"analysis.accuracy: {result.get('accuracy')}")
-        print(f"analysis.score: {result.get('score')}")
-        print("-----------------------------------")
-    finally:
-        # 5) clean up temps
-        try: os.remove(webm_path)
-        except: pass
-        try: os.remove(wav_path)
-        except: pass
-
-    # 6) return JSON
-    return {
-        "notes": result["notes"],
-        "accuracy": result["accuracy"],
-        "score": result["score"],
-    }
+@app.post("/api/transcribe-jobs", status_code=202)
+async def submit_transcription_job(
+    audio: UploadFile = File(...),
+    target_key: str = Form(default=""),
+    semitones: int = Form(default=0),
+    target_keys: str = Form(default=""),
+    quantize_divisions: int = Form(default=8),
+    quantize_strategy: str = Form(default="nearest"),
+    bpm_override: float | None = Form(default=None),
+):
+    """
+    /api/transcribe-and-transpose as a background job: answers right away
+    with the job's status/events/result URLs (see jobQueue).
+    """
+    args, params = transcription_job(
+        audio, target_key, semitones, target_keys, quantize_divisions, quantize_strategy, bpm_override,
+    )
+    raw = await audio.read()
+    cache_key = service.cache.make_key(raw, "transcribe-and-transpose", **params)
+    return jobs.links(await jobs.submit("transcribe-and-transpose", raw, args, cache_key))
@@ -0,0 +1,79 @@
+"""
+Accuracy vs speed of the gameJudger pitch backends and search bands.
+
+    cd myLabubu/backend
+    python -m benchmarks.pitch_backends
+
+For each backend x band ("full" = C3-A6, "song" = song_pitch_band): wall
+time, realtime factor, note accuracy against the synthetic ground truth
+(position-by-position, on collapsed repeats, and with the alignment scorer),
+and agreement with the current pyin/full output (on collapsed sequences).
+"""
+import os
+import tempfile
+import time
+
+import soundfile as sf
+
+from gameJudger import PITCH_BACKENDS, analyze_violin_notes, score_player, score_player_aligned, song_pitch_band
+from benchmarks.synth import collapse_repeats, render_song
+
+FULL_BAND = {"fmin_note": "C3", "fmax_note": "A6", "low_ok_for_register": 200.0}
+
+
+def run(song_key="happy_birthday", repeats=(1, 4), sr=22050, rounds=3):
+    bands = {"full": FULL_BAND, "song": song_pitch_band(song_key)}
+    rows = []
+    for rep in repeats:
+        y, sr, truth = render_song(song_key, repeats=rep, sr=sr)
+        truth_notes = [t["note"] for t in truth]
+        clip_sec = len(y) / sr
+
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+            wav_path = tmp.name
+        sf.write(wav_path, y, sr)
+        try:
+            clip_rows = []
+            for backend in PITCH_BACKENDS:
+                for band_name, band in bands.items():
+                    best = float("inf")
+                    for _ in range(rounds):
+                        t0 = time.perf_counter()
+                        segs = analyze_violin_notes(wav_path, pitch_backend=backend, **band)
+                        best = min(best, time.perf_counter() - t0)
+                    notes = [s["note"] for s in segs]
+                    clip_rows.append({
+                        "clip_sec": clip_sec,
+                        "backend": backend,
+                        "band": band_name,
+                        "sec": best,
+                        "rtf": best / clip_sec,
+                        "acc_truth": score_player(notes, truth_notes),
+                        "acc_collapsed": score_player(collapse_repeats(notes), collapse_repeats(truth_notes)),
+                        "acc_aligned": score_player_aligned(notes, truth_notes, [s["dur_s"] for s in segs]),
+                        "n_notes": len(notes),
+                        "notes": notes,
+                    })
+            reference = collapse_repeats(clip_rows[0]["notes"])  # pyin / full band
+            for row in clip_rows:
+                row["agree_pyin"] = score_player(collapse_repeats(row.pop("notes")), reference)
+            rows.extend(clip_rows)
+        finally:
+            os.remove(wav_path)
+    return rows
+
+
+def print_report(rows):
+    print(
+        f"{'clip_s':>7} {'backend':>8} {'band':>5} {'time_s':>8} {'rtf':>7} "
+        f"{'acc_truth':>9} {'acc_coll':>8} {'acc_align':>9} {'agree_pyin':>10} {'notes':>6}"
+    )
+    for r in rows:
+        print(
+            f"{r['clip_sec']:7.1f} {r['backend']:>8} {r['band']:>5} {r['sec']:8.3f} {r['rtf']:7.3f} "
+            f"{r['acc_truth']:9.3f} {r['acc_collapsed']:8.3f} {r['acc_aligned']:9.3f} {r['agree_pyin']:10.3f} {r['n_notes']:6d}"
+        )
+
+
+if __name__ == "__main__":
+    print_report(run())
@@ -0,0 +1,153 @@
+"""
+Score building + MusicXML/MIDI export for /api/transcribe-and-transpose:
+scoreWriter (SCORE_WRITER=fast, default) vs the music21 Stream path.
+
+    cd myLabubu/backend
+    python -m benchmarks.score_export
+
+Both writers get the same events (app.analyze_to_score on a synthetic take)
+and produce original + transposed MusicXML and MIDI, like run_transcription
+("fast x6": original + six target_keys at once).
+"warm" is steady-state time per request (best of N); "cold" runs one export
+in a fresh interpreter and reports import time and the RSS the writer adds.
+"""
+import importlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+_COLD_CHILD = "--cold-child"
+
+
+def _score(repeats):
+    import soundfile as sf
+    import app
+    from benchmarks.synth import render_song
+
+    y, sr, _ = render_song("happy_birthday", repeats=repeats)
+    buf = io.BytesIO()
+    sf.write(buf, y, sr, format="WAV")
+    return app.analyze_to_score(buf.getvalue())
+
+
+def _export_fast(score):
+    from scoreWriter import export_score
+
+    orig = export_score(score)
+    trans = export_score(score.transposed(2))
+    return orig, trans
+
+
+def _export_music21(score):
+    import app
+
+    s, key_text = app.score_to_stream(score)
+    orig = app.export_stream(s)
+    t, _ = app.transpose_music21(s, key_text, "", 2)
+    trans = app.export_stream(t)
+    return orig, trans
+
+
+INSTRUMENT_TARGETS = ["+2", "+9", "-5", "B- major", "E- major", "F major"]
+
+
+def _export_many(score):
+    # original + 6 transpositions in one request (target_keys)
+    import app
+    from scoreWriter import export_score
+
+    orig = export_score(score)
+    return orig, app.transpose_many(score, INSTRUMENT_TARGETS)
+
+
+def _warm(repeats_list=(1, 4, 16), rounds=5):
+    rows = []
+    for repeats in repeats_list:
+        score = _score(repeats)
+        for name, fn in (("fast", _export_fast), ("fast x6", _export_many), ("music21", _export_music21)):
+            fn(score)
+            best = float("inf")
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                (xml, midi), _ = fn(score)
+                best = min(best, time.perf_counter() - t0)
+            rows.append({
+                "writer": name,
+                "events": len(score.events),
+                "sec": best,
+                "xml_kb": len(xml) / 1024,
+                "midi_b64_kb": len(midi) / 1024,
+            })
+    return rows
+
+
+def _rss_mb():
+    # current resident set (Linux); ru_maxrss only ever shows the peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _cold_child(writer):
+    # runs in a fresh interpreter: import cost + first export + added RSS,
+    # on top of the app itself (librosa, fastapi, ...) which both paths load
+    importlib.import_module("app")
+    from scoreWriter import NoteEvent, Score
+
+    events = [NoteEvent(62 + (i * 5) % 12 if i % 7 else None, 1.0) for i in range(200)]
+    score = Score(events, 90.0, tonic="D", mode="major")
+    before = _rss_mb()
+    t0 = time.perf_counter()
+    if writer == "fast":
+        _export_fast(score)
+    else:
+        importlib.import_module("music21")
+        t_import = time.perf_counter() - t0
+        _export_music21(score)
+    total = time.perf_counter() - t0
+    after = _rss_mb()
+    print(json.dumps({
+        "writer": writer,
+        "import_sec": t_import if writer != "fast" else 0.0,
+        "first_export_sec": total,
+        "rss_added_mb": after - before,
+    }))
+
+
+def _cold():
+    rows = []
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for writer in ("fast", "music21"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.score_export", _COLD_CHILD, writer],
+            cwd=here, capture_output=True, text=True, check=True,
+        )
+        rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return rows
+
+
+def run():
+    return {"warm": _warm(), "cold": _cold()}
+
+
+def print_report(result):
+    print(f"{'writer':>8} {'events':>6} {'time_ms':>9} {'xml_kb':>7} {'midi_kb':>8}")
+    for r in result["warm"]:
+        print(f"{r['writer']:>8} {r['events']:6d} {1000 * r['sec']:9.2f} {r['xml_kb']:7.1f} {r['midi_b64_kb']:8.2f}")
+    print()
+    print(f"{'writer':>8} {'import_s':>9} {'first_export_s':>15} {'rss_added_mb':>13}")
+    for r in result["cold"]:
+        print(f"{r['writer']:>8} {r['import_sec']:9.3f} {r['first_export_sec']:15.3f} {r['rss_added_mb']:13.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == _COLD_CHILD:
+        _cold_child(sys.argv[2])
+    else:
+        print_report(run())
@@ -0,0 +1,95 @@
+"""
+Song identification (songIndex.IntervalIndex) on growing synthetic catalogs.
+
+    cd myLabubu/backend
+    python -m benchmarks.song_index
+
+Catalogs are random stepwise melodies (mostly seconds and thirds, some
+leaps, some repeated notes). Queries are 16-note excerpts of a random
+song, transposed by a random amount, with 0-2 notes replaced by a
+neighbouring semitone. Reports build time, index size, query latency
+(p50 / p99) and top-1 accuracy.
+"""
+import time
+
+import numpy as np
+
+from songLibrary import SongLibrary
+
+_STEPS = np.array([-7, -5, -4, -3, -2, -1, 0, 1, 2, 3, 4, 5, 7])
+_STEP_P = np.array([1, 2, 3, 6, 14, 12, 10, 12, 14, 6, 3, 2, 1], dtype=float)
+_STEP_P /= _STEP_P.sum()
+
+
+def random_catalog(n_songs, rng, min_len=24, max_len=96):
+    lib = SongLibrary()
+    for i in range(n_songs):
+        steps = rng.choice(_STEPS, size=int(rng.integers(min_len, max_len)), p=_STEP_P)
+        midi = [67]
+        for step in steps:
+            # bounce off the violin-ish range instead of sticking to its edges
+            if not 55 <= midi[-1] + step <= 93:
+                step = -step
+            midi.append(midi[-1] + int(step))
+        lib.register(f"song_{i}", midi)
+    return lib
+
+
+def make_query(lib, rng, length=16, wrong_notes=1):
+    song = lib.song_at(int(rng.integers(len(lib))))
+    midi = song.midi.astype(np.int64)
+    start = int(rng.integers(0, max(1, midi.size - length)))
+    q = midi[start:start + length] + int(rng.integers(-7, 8))
+    for i in rng.choice(q.size, size=min(wrong_notes, q.size), replace=False):
+        q[i] += int(rng.choice([-1, 1]))
+    return song.key, q
+
+
+def run(sizes=(100, 1000, 5000, 20000), n_queries=500, wrong_notes=(0, 1, 2), seed=0):
+    rows = []
+    for n_songs in sizes:
+        rng = np.random.default_rng(seed)
+        lib = random_catalog(n_songs, rng)
+
+        t0 = time.perf_counter()
+        index = lib.interval_index()
+        build_sec = time.perf_counter() - t0
+        index_bytes = index.keys.nbytes + index.starts.nbytes + index.songs.nbytes + index.idf.nbytes
+        library_bytes = lib.midi.nbytes + lib.beats.nbytes + lib.intervals.nbytes + lib.offsets.nbytes
+
+        for wrong in wrong_notes:
+            queries = [make_query(lib, rng, wrong_notes=wrong) for _ in range(n_queries)]
+            for _, q in queries[:20]:
+                index.query(q)  # warm caches
+
+            lat, hits = [], 0
+            for key, q in queries:
+                t = time.perf_counter()
+                res = index.query(q, top_k=5)
+                lat.append(time.perf_counter() - t)
+                hits += bool(res) and res[0]["song_key"] == key
+
+            rows.append({
+                "songs": n_songs,
+                "wrong": wrong,
+                "build_sec": build_sec,
+                "index_kb": index_bytes / 1024,
+                "library_kb": library_bytes / 1024,
+                "p50_ms": 1000 * float(np.percentile(lat, 50)),
+                "p99_ms": 1000 * float(np.percentile(lat, 99)),
+                "top1": hits / n_queries,
+            })
+    return rows
+
+
+def print_report(rows):
+    print(f"{'songs':>6} {'wrong':>5} {'build_s':>8} {'index_kb':>9} {'lib_kb':>7} {'p50_ms':>7} {'p99_ms':>7} {'top1':>6}")
+    for r in rows:
+        print(
+            f"{r['songs']:6d} {r['wrong']:5d} {r['build_sec']:8.3f} {r['index_kb']:9.0f} {r['library_kb']:7.0f} "
+            f"{r['p50_ms']:7.3f} {r['p99_ms']:7.3f} {r['top1']:6.3f}"
+        )
+
+
+if __name__ == "__main__":
+    print_report(run())
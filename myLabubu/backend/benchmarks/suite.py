@@ -0,0 +1,457 @@
+"""
+End-to-end benchmark + accuracy gate for both pipelines on synthetic violin takes.
+
+    cd myLabubu/backend
+    python -m benchmarks.suite                        # in-process pipelines
+    python -m benchmarks.suite --http                 # + HTTP endpoints (uvicorn, ffmpeg)
+    python -m benchmarks.suite --save base.json       # record a baseline
+    python -m benchmarks.suite --compare base.json    # exit 1 on regressions
+    python -m benchmarks.suite --analysis-sr auto     # gameJudger.ANALYSIS_SR policy
+    python -m benchmarks.suite --block-memory         # + judge_upload, blocks vs whole clip
+    python -m benchmarks.suite --split-bench 4        # + judge split at silences, 0 vs 4 threads
+    python -m benchmarks.suite --music21              # + the SCORE_WRITER=music21 transcriber
+
+Corpus (benchmarks/synth.py, seeded): every SONG_LIBRARY song x lengths
+(song repeated 1x / 4x) x sample rates, each clean and with 10% wrong notes.
+
+Pipelines:
+  judge            gameJudger.analyze_single_player on the decoded array
+  transcribe       app.run_transcription on WAV bytes, as the endpoint's pool job
+                   runs it (decode, analyze_to_score, scoreWriter export)
+  transcribe_music21  app.analyze_to_stream: the music21 Stream path
+                   (SCORE_WRITER=music21), --music21 only, for comparison
+  upload_blocks    workerPool.judge_upload on WAV bytes, ANALYSIS_BLOCK_SEC=60
+  upload_whole     the same with ANALYSIS_BLOCK_SEC=0 (whole clip in memory)
+                   (--block-memory only: 1x / 4x / 16x song length, 22050 Hz)
+  split_<backend>_<n>  analyze_single_player with pyin / yin and
+                   ANALYSIS_SPLIT_WORKERS=n, on takes with 0.5 s pauses
+                   between repeats (--split-bench only; also reports how many
+                   results are identical to n=0)
+  http_judge       POST /analyzeSinglePlayer
+  http_transcribe  POST /api/transcribe-and-transpose
+
+One row per pipeline x sample rate x length x clean/wrong: latency
+p50/p95/max over clips x rounds, throughput (audio seconds per wall second),
+peak traced memory per call (tracemalloc, in-process only; HTTP rows report
+the server's worker RSS instead) and accuracy of the detected notes against
+the rendered ground truth (alignment scorer, repeats collapsed for the
+transcriber since it splits notes at barlines).
+
+--compare fails when a row's p50 grows more than --max-slowdown (default
+1.25x) or its accuracy drops more than --max-accuracy-drop (default 0.02)
+against the baseline. Baselines are machine-specific: record them on the
+box that runs the gate.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.synth import collapse_repeats, render_song
+
+LENGTHS = (1, 4)               # song repeats per clip
+BLOCK_LENGTHS = (1, 4, 16)     # --block-memory
+SPLIT_LENGTHS = (4, 16)        # --split-bench
+SPLIT_PAUSE_SEC = 0.5
+SAMPLE_RATES = (22050, 44100)
+WRONG_NOTE_RATE = 0.1
+SEEDS = (0, 1)
+
+
+########################################
+# CORPUS
+########################################
+
+def corpus(song_keys=None, lengths=LENGTHS, sample_rates=SAMPLE_RATES, seeds=SEEDS, pause_sec=0.0):
+    """
+    Synthetic takes with ground truth. Yields dicts with song_key, sr,
+    repeats, wrong (bool), y, wav (bytes), truth (note names), clip_sec.
+    pause_sec: silence between repeats (see synth.render_song).
+    """
+    from gameJudger import SONG_LIBRARY
+
+    for song_key in song_keys or SONG_LIBRARY.keys():
+        for sr in sample_rates:
+            for repeats in lengths:
+                for wrong in (False, True):
+                    for seed in seeds:
+                        y, sr, truth = render_song(
+                            song_key, repeats=repeats, sr=sr, seed=seed,
+                            wrong_note_rate=WRONG_NOTE_RATE if wrong else 0.0, pause_sec=pause_sec,
+                        )
+                        buf = io.BytesIO()
+                        sf.write(buf, y, sr, format="WAV")
+                        yield {
+                            "song_key": song_key,
+                            "sr": sr,
+                            "repeats": repeats,
+                            "wrong": wrong,
+                            "y": y,
+                            "wav": buf.getvalue(),
+                            "truth": [t["note"] for t in truth],
+                            "clip_sec": len(y) / sr,
+                        }
+
+
+def _group_key(clip):
+    return (clip["sr"], clip["repeats"], clip["wrong"])
+
+
+########################################
+# PIPELINES (one call -> detected note names)
+########################################
+
+def _judge(clip):
+    from gameJudger import analyze_single_player
+
+    return analyze_single_player(clip["y"], song_key=clip["song_key"], sr=clip["sr"])["notes"]
+
+
+def _transcribe(clip):
+    import app
+
+    notes = app.run_transcription(clip["wav"], "wav")["notes"]
+    return [f"{n}{o}" for n, o in zip(notes["note"], notes["octave"])]
+
+
+def _transcribe_music21(clip):
+    import app
+
+    _, _, _, notes = app.analyze_to_stream(clip["wav"])
+    return [f"{n['note']}{n['octave']}" for n in notes]
+
+
+def _accuracy(pipeline, notes, truth):
+    from gameJudger import score_player_aligned
+
+    if "transcribe" in pipeline:
+        notes, truth = collapse_repeats(notes), collapse_repeats(truth)
+    return score_player_aligned(notes, truth)
+
+
+def _judge_upload(block_sec):
+    def run(clip):
+        import workerPool
+
+        saved, workerPool.ANALYSIS_BLOCK_SEC = workerPool.ANALYSIS_BLOCK_SEC, block_sec
+        try:
+            result, _ = workerPool.judge_upload(clip["wav"], clip["song_key"])
+        finally:
+            workerPool.ANALYSIS_BLOCK_SEC = saved
+        return result["notes"]
+    return run
+
+
+@contextlib.contextmanager
+def _split_workers(n):
+    # gameJudger reads ANALYSIS_SPLIT_WORKERS at import; swap its thread pool
+    import gameJudger
+
+    saved = gameJudger.ANALYSIS_SPLIT_WORKERS, gameJudger._SPLIT_EXECUTOR
+    gameJudger.ANALYSIS_SPLIT_WORKERS, gameJudger._SPLIT_EXECUTOR = n, None
+    try:
+        yield
+    finally:
+        if gameJudger._SPLIT_EXECUTOR is not None:
+            gameJudger._SPLIT_EXECUTOR.shutdown()
+        gameJudger.ANALYSIS_SPLIT_WORKERS, gameJudger._SPLIT_EXECUTOR = saved
+
+
+def run_split(clips, workers, backends=("pyin", "yin"), rounds=3):
+    """
+    Rows for analyze_single_player with ANALYSIS_SPLIT_WORKERS=0 and
+    =`workers` per backend. Split rows carry "same_as_serial": the share of
+    clips whose notes and score equal the serial result.
+    """
+    from gameJudger import analyze_single_player
+
+    groups = {}
+    for clip in clips:
+        groups.setdefault(_group_key(clip), []).append(clip)
+
+    def judge(clip, backend):
+        return analyze_single_player(clip["y"], song_key=clip["song_key"], sr=clip["sr"], pitch_backend=backend)
+
+    rows = []
+    for backend in backends:
+        judge(clips[0], backend)  # numba JIT outside the measurements
+        for key, group in groups.items():
+            serial = None
+            for n in (0, workers):
+                with _split_workers(n):
+                    results = [judge(c, backend) for c in group]
+                    latencies = []
+                    for clip in group:
+                        for _ in range(rounds):
+                            t0 = time.perf_counter()
+                            judge(clip, backend)
+                            latencies.append(time.perf_counter() - t0)
+                accs = [_accuracy("judge", r["notes"], c["truth"]) for r, c in zip(results, group)]
+                row = _row(f"split_{backend}_{n}", key, group, latencies, sum(latencies), accs, None)
+                if serial is None:
+                    serial = results
+                else:
+                    row["same_as_serial"] = float(np.mean([
+                        a["notes"] == b["notes"] and a["score"] == b["score"] for a, b in zip(serial, results)
+                    ]))
+                rows.append(row)
+    return rows
+
+
+IN_PROCESS = {
+    "judge": _judge,
+    "transcribe": _transcribe,
+    "transcribe_music21": _transcribe_music21,
+    "upload_blocks": _judge_upload(60.0),
+    "upload_whole": _judge_upload(0.0),
+}
+
+
+def _row(pipeline, key, clips, latencies, wall_sec, accs, peak_mb):
+    sr, repeats, wrong = key
+    lat = np.asarray(latencies)
+    audio_sec = sum(c["clip_sec"] for c in clips) * len(latencies) / len(clips)
+    return {
+        "pipeline": pipeline,
+        "sr": sr,
+        "repeats": repeats,
+        "wrong": wrong,
+        "clip_sec": float(np.mean([c["clip_sec"] for c in clips])),
+        "n": len(latencies),
+        "p50": float(np.percentile(lat, 50)),
+        "p95": float(np.percentile(lat, 95)),
+        "max": float(lat.max()),
+        "audio_per_sec": audio_sec / wall_sec if wall_sec > 0 else 0.0,
+        "peak_mb": peak_mb,
+        "accuracy": float(np.mean(accs)),
+    }
+
+
+def run_in_process(clips, pipelines=("judge", "transcribe"), rounds=3):
+    groups = {}
+    for clip in clips:
+        groups.setdefault(_group_key(clip), []).append(clip)
+
+    rows = []
+    for pipeline in pipelines:
+        fn = IN_PROCESS[pipeline]
+        fn(clips[0])  # imports + numba JIT outside the measurements
+        for key, group in groups.items():
+            latencies, accs, peak = [], [], 0.0
+            for clip in group:
+                tracemalloc.start()
+                notes = fn(clip)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] / 2**20)
+                tracemalloc.stop()
+                accs.append(_accuracy(pipeline, notes, clip["truth"]))
+                for _ in range(rounds):
+                    t0 = time.perf_counter()
+                    fn(clip)
+                    latencies.append(time.perf_counter() - t0)
+            rows.append(_row(pipeline, key, group, latencies, sum(latencies), accs, peak))
+    return rows
+
+
+########################################
+# HTTP (uvicorn subprocess, as deployed)
+########################################
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server_rss_mb(pid):
+    # peak RSS of the server and its pool workers (Linux /proc only)
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+        total = 0
+        for p in pids:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+        return total / 1024
+    except OSError:
+        return None
+
+
+def start_server(workers=2, timeout=300):
+    """
+    uvicorn app:app on a free port with the result cache off (the corpus
+    repeats uploads). Returns (process, base_url) once /ready says 200.
+    """
+    import requests
+
+    port = _free_port()
+    env = dict(os.environ, RESULT_CACHE_MB="0", ANALYSIS_WORKERS=str(workers), LOG_LEVEL="WARNING")
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=here, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if requests.get(f"{base}/ready", timeout=2).status_code == 200:
+                return proc, base
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("server did not become ready in time")
+
+
+def _post(base, pipeline, clip):
+    import requests
+
+    files = {"player_audio" if pipeline == "http_judge" else "audio": ("take.wav", clip["wav"], "audio/wav")}
+    if pipeline == "http_judge":
+        r = requests.post(f"{base}/analyzeSinglePlayer", data={"song_key": clip["song_key"]}, files=files, timeout=600)
+        r.raise_for_status()
+        return r.json()["notes"]
+    r = requests.post(f"{base}/api/transcribe-and-transpose", files=files, timeout=600)
+    r.raise_for_status()
+    return [f"{n['note']}{n['octave']}" for n in r.json()["notes"]]
+
+
+def run_http(clips, pipelines=("http_judge", "http_transcribe"), rounds=3, concurrency=2, workers=2):
+    groups = {}
+    for clip in clips:
+        groups.setdefault(_group_key(clip), []).append(clip)
+
+    proc, base = start_server(workers=workers)
+    rows = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            for pipeline in pipelines:
+                for key, group in groups.items():
+                    accs = [_accuracy(pipeline, _post(base, pipeline, c), c["truth"]) for c in group]
+
+                    def timed(clip):
+                        t0 = time.perf_counter()
+                        _post(base, pipeline, clip)
+                        return time.perf_counter() - t0
+
+                    t0 = time.perf_counter()
+                    latencies = list(ex.map(timed, group * rounds))
+                    wall = time.perf_counter() - t0
+                    rows.append(_row(pipeline, key, group, latencies, wall, accs, _server_rss_mb(proc.pid)))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return rows
+
+
+########################################
+# GATE
+########################################
+
+def _row_id(r):
+    return f"{r['pipeline']}/{r['sr']}/{r['repeats']}x/{'wrong' if r['wrong'] else 'clean'}"
+
+
+def compare(rows, baseline, max_slowdown=1.25, max_accuracy_drop=0.02):
+    """
+    Regressions of `rows` against `baseline` rows, as human-readable strings.
+    Rows missing from either side are ignored.
+    """
+    base = {_row_id(r): r for r in baseline}
+    failures = []
+    for r in rows:
+        b = base.get(_row_id(r))
+        if b is None:
+            continue
+        if r["p50"] > b["p50"] * max_slowdown:
+            failures.append(f"{_row_id(r)}: p50 {b['p50']:.3f}s -> {r['p50']:.3f}s")
+        if r["accuracy"] < b["accuracy"] - max_accuracy_drop:
+            failures.append(f"{_row_id(r)}: accuracy {b['accuracy']:.3f} -> {r['accuracy']:.3f}")
+    return failures
+
+
+def print_report(rows):
+    print(
+        f"{'pipeline':>18} {'sr':>6} {'clip_s':>7} {'take':>5} {'n':>3} {'p50_s':>7} {'p95_s':>7} "
+        f"{'max_s':>7} {'audio_s/s':>9} {'peak_mb':>8} {'acc':>6}"
+    )
+    for r in rows:
+        peak = f"{r['peak_mb']:8.1f}" if r["peak_mb"] is not None else f"{'-':>8}"
+        print(
+            f"{r['pipeline']:>18} {r['sr']:6d} {r['clip_sec']:7.1f} {'wrong' if r['wrong'] else 'clean':>5} "
+            f"{r['n']:3d} {r['p50']:7.3f} {r['p95']:7.3f} {r['max']:7.3f} {r['audio_per_sec']:9.1f} "
+            f"{peak} {r['accuracy']:6.3f}" + (f"  same as serial {r['same_as_serial']:.3f}" if "same_as_serial" in r else "")
+        )
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--songs", nargs="*", help="song keys (default: whole library)")
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--http", action="store_true", help="also benchmark the HTTP endpoints")
+    p.add_argument("--concurrency", type=int, default=2, help="parallel HTTP requests")
+    p.add_argument("--workers", type=int, default=2, help="ANALYSIS_WORKERS for the HTTP server")
+    p.add_argument("--save", help="write rows as JSON baseline")
+    p.add_argument("--compare", help="baseline JSON to gate against")
+    p.add_argument("--max-slowdown", type=float, default=1.25)
+    p.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    p.add_argument("--analysis-sr", help="ANALYSIS_SR policy for the judge: native | auto | rate in Hz")
+    p.add_argument("--split-workers", type=int, help="ANALYSIS_SPLIT_WORKERS: threads per clip for silence-split regions")
+    p.add_argument("--music21", action="store_true", help="also time the music21 transcriber (transcribe_music21)")
+    p.add_argument(
+        "--split-bench", type=int, metavar="N",
+        help="also judge takes with pauses serially and with N split threads (pyin and yin)",
+    )
+    p.add_argument(
+        "--block-memory", action="store_true",
+        help="also judge_upload in blocks vs whole clip at 1x/4x/16x length (peak memory)",
+    )
+    args = p.parse_args(argv)
+    # read when gameJudger is imported (here and in the HTTP server)
+    if args.analysis_sr:
+        os.environ["ANALYSIS_SR"] = args.analysis_sr
+    if args.split_workers is not None:
+        os.environ["ANALYSIS_SPLIT_WORKERS"] = str(args.split_workers)
+
+    clips = list(corpus(args.songs))
+    pipelines = ("judge", "transcribe") + (("transcribe_music21",) if args.music21 else ())
+    rows = run_in_process(clips, pipelines=pipelines, rounds=args.rounds)
+    if args.block_memory:
+        long_clips = list(corpus(args.songs, lengths=BLOCK_LENGTHS, sample_rates=(22050,), seeds=SEEDS[:1]))
+        rows += run_in_process(long_clips, pipelines=("upload_blocks", "upload_whole"), rounds=1)
+    if args.split_bench:
+        paused = list(corpus(args.songs, lengths=SPLIT_LENGTHS, sample_rates=(22050,), pause_sec=SPLIT_PAUSE_SEC))
+        rows += run_split(paused, args.split_bench, rounds=args.rounds)
+    if args.http:
+        rows += run_http(clips, rounds=args.rounds, concurrency=args.concurrency, workers=args.workers)
+    print_report(rows)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(rows, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            failures = compare(rows, json.load(f), args.max_slowdown, args.max_accuracy_drop)
+        for line in failures:
+            print("REGRESSION", line)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Front-end cost of the transcriber (app.analyze_to_score): tempo + onset
+detection + per-segment pitch, old front-end vs the shared spectrogram.
+
+    cd myLabubu/backend
+    python -m benchmarks.transcription
+
+"separate": beat_track(y) and onset_detect(y), one mel spectrogram each.
+"shared":   one mel spectrogram for both detectors (app.onset_envelopes).
+Both then take one librosa.yin per onset-to-onset segment
+(app.segment_median_hz).
+
+Reports wall time, how many segment pitches agree with the old path, and
+how many match the ground-truth note covering most of the segment.
+"""
+import time
+
+import numpy as np
+import librosa
+
+import app
+from benchmarks.synth import render_song
+
+ONSET_KW = dict(units="frames", backtrack=True, pre_max=30, post_max=30, pre_avg=40, post_avg=40, delta=0.07, wait=12)
+
+
+def _front_end(y, sr, mode):
+    if mode == "separate":
+        librosa.beat.beat_track(y=y, sr=sr)
+        on_frames = librosa.onset.onset_detect(y=y, sr=sr, **ONSET_KW)
+    else:
+        beat_env, onset_env = app.onset_envelopes(y, sr)
+        librosa.beat.beat_track(onset_envelope=beat_env, sr=sr)
+        on_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, **ONSET_KW)
+    total_t = librosa.get_duration(y=y, sr=sr)
+    cuts = np.unique(np.concatenate([[0.0], librosa.frames_to_time(on_frames, sr=sr), [total_t]])).tolist()
+    return cuts, app.segment_median_hz(y, sr, cuts)
+
+
+def _majority_midi(truth, t0, t1):
+    best, overlap = None, 0.0
+    for t in truth:
+        o = min(t1, t["end_s"]) - max(t0, t["start_s"])
+        if o > overlap:
+            best, overlap = t["note"], o
+    return None if best is None else int(librosa.note_to_midi(best))
+
+
+def _midi(hz):
+    return None if hz is None else int(np.round(librosa.hz_to_midi(hz)))
+
+
+def run(cases=((90, 1), (90, 4), (160, 4)), seeds=(0, 1, 2), rounds=3):
+    rows = []
+    for bpm, repeats in cases:
+        stats = {m: {"sec": 0.0, "truth": 0} for m in ("separate", "shared")}
+        same = n_segments = 0
+        clip_sec = 0.0
+        for seed in seeds:
+            y, sr, truth = render_song("happy_birthday", repeats=repeats, bpm=bpm, seed=seed, wrong_note_rate=0.1)
+            y = y.astype(np.float64)
+            clip_sec += len(y) / sr
+            out = {}
+            for mode in ("separate", "shared"):
+                best = float("inf")
+                for _ in range(rounds):
+                    t0 = time.perf_counter()
+                    cuts, hz = _front_end(y, sr, mode)
+                    best = min(best, time.perf_counter() - t0)
+                out[mode] = [_midi(h) for h in hz]
+                majority = [_majority_midi(truth, cuts[i], cuts[i + 1]) for i in range(len(cuts) - 1)]
+                stats[mode]["sec"] += best
+                stats[mode]["truth"] += sum(m is not None and m == p for m, p in zip(majority, out[mode]))
+            same += sum(a == b for a, b in zip(out["separate"], out["shared"]))
+            n_segments += len(out["shared"])
+
+        for mode, st in stats.items():
+            rows.append({
+                "bpm": bpm,
+                "clip_sec": clip_sec / len(seeds),
+                "mode": mode,
+                "sec": st["sec"] / len(seeds),
+                "agree_separate": same / n_segments if mode == "shared" else 1.0,
+                "truth_match": st["truth"] / n_segments,
+                "segments": n_segments // len(seeds),
+            })
+    return rows
+
+
+def print_report(rows):
+    print(f"{'bpm':>4} {'clip_s':>7} {'mode':>8} {'time_s':>7} {'agree':>6} {'truth':>6} {'segs':>5}")
+    for r in rows:
+        print(
+            f"{r['bpm']:4d} {r['clip_sec']:7.1f} {r['mode']:>8} {r['sec']:7.3f} "
+            f"{r['agree_separate']:6.3f} {r['truth_match']:6.3f} {r['segments']:5d}"
+        )
+
+
+if __name__ == "__main__":
+    print_report(run())
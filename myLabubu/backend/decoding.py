@@ -0,0 +1,421 @@
+"""
+Upload decoding: compressed audio bytes -> mono float32 at a target rate.
+
+Each upload goes to the cheapest decoder that handles its container
+(sniffed from the first bytes, so filenames and content types don't matter):
+
+  wav / flac / ogg / mp3   libsndfile (soundfile), in-process
+  webm / mp4 / other       PyAV, in-process (pinned in requirements.txt; browsers
+                           upload webm/opus, so this is the common path)
+  anything else / errors   one ffmpeg subprocess, at most DECODE_FFMPEG_MAX at once
+
+open_blocks() does the same chunk by chunk for long recordings, with the
+same decoders in the same order (ffmpeg as a pipe), so the whole clip is
+never in memory at once. An ffmpeg pipe keeps its DECODE_FFMPEG_MAX slot
+until the last chunk has been read.
+
+In-process decoders resample with soxr; the ffmpeg fallback resamples itself.
+
+Config (env vars):
+  DECODE_FFMPEG_MAX   concurrent ffmpeg decodes across all AnalysisPool workers
+                      (default: CPU count; one shared semaphore, see set_ffmpeg_slots)
+  DECODE_BACKENDS     comma-separated decoders to allow, in fallback order
+                      (default: soundfile,pyav,ffmpeg; "ffmpeg" = old behaviour)
+"""
+import io
+import itertools
+import os
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+
+
+class DecodeError(Exception):
+    """ffmpeg could not decode the upload (bad/unsupported audio)."""
+
+
+class FfmpegNotFound(DecodeError):
+    """ffmpeg binary is not installed / not on PATH."""
+
+
+_FFMPEG_PATH = None
+
+
+def ensure_ffmpeg() -> str:
+    # looked up once per process; installing ffmpeg needs a restart anyway
+    global _FFMPEG_PATH
+    if _FFMPEG_PATH is None:
+        _FFMPEG_PATH = shutil.which("ffmpeg")
+        if not _FFMPEG_PATH:
+            raise FfmpegNotFound(
+                "ffmpeg not found. Install it (e.g., `brew install ffmpeg`) and restart."
+            )
+    return _FFMPEG_PATH
+
+
+########################################
+# CONTAINER SNIFFING
+########################################
+
+def sniff_format(raw_bytes: bytes) -> str | None:
+    """
+    "wav" | "flac" | "ogg" | "mp3" | "webm" | "mp4", or None if unknown.
+    """
+    head = raw_bytes[:12]
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"  # EBML: webm / matroska
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    return None
+
+
+SOUNDFILE_FORMATS = ("wav", "flac", "ogg", "mp3")
+
+
+########################################
+# DECODERS (raw bytes, target_sr) -> mono float32 at target_sr
+########################################
+
+def resample(y, sr, target_sr):
+    if sr == target_sr or y.size == 0:
+        return y.astype(np.float32, copy=False)
+    import soxr
+
+    return soxr.resample(y, sr, target_sr).astype(np.float32, copy=False)
+
+
+def _decode_soundfile(raw_bytes, target_sr):
+    import soundfile as sf
+
+    y, sr = sf.read(io.BytesIO(raw_bytes), dtype="float32", always_2d=True)
+    return resample(y.mean(axis=1), sr, target_sr)
+
+
+def _decode_pyav(raw_bytes, target_sr):
+    import av  # in requirements.txt; falls back to ffmpeg if missing
+
+    chunks = []
+    with av.open(io.BytesIO(raw_bytes)) as container:
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=target_sr)
+        for frame in container.decode(stream):
+            chunks.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(frame))
+        chunks.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(None))
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+
+FFMPEG_MAX = int(os.environ.get("DECODE_FFMPEG_MAX", os.cpu_count() or 1))
+
+# Held while an ffmpeg decode runs. This per-process default only limits the
+# threads of one process; AnalysisPool workers get one multiprocessing
+# semaphore shared by the whole pool instead (set_ffmpeg_slots).
+_FFMPEG_SLOTS = threading.BoundedSemaphore(FFMPEG_MAX)
+
+
+def set_ffmpeg_slots(slots):
+    """
+    Use `slots` (anything with acquire/release, e.g. a multiprocessing
+    BoundedSemaphore from the pool initializer) to bound ffmpeg decodes.
+    """
+    global _FFMPEG_SLOTS
+    _FFMPEG_SLOTS = slots
+
+
+def _decode_ffmpeg(raw_bytes, target_sr):
+    cmd = [
+        ensure_ffmpeg(),
+        "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", "1", "-ar", str(target_sr),
+        "pipe:1",
+    ]
+    with _FFMPEG_SLOTS:
+        proc = subprocess.run(cmd, input=raw_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        err = proc.stderr.decode(errors="ignore")[:600]
+        raise DecodeError(f"ffmpeg failed: {err}")
+    return np.frombuffer(proc.stdout, dtype="<f4")
+
+
+DECODERS = {
+    "soundfile": _decode_soundfile,
+    "pyav": _decode_pyav,
+    "ffmpeg": _decode_ffmpeg,
+}
+
+DECODE_BACKENDS = [
+    b.strip() for b in os.environ.get("DECODE_BACKENDS", "soundfile,pyav,ffmpeg").split(",") if b.strip() in DECODERS
+]
+
+
+def decoders_for(fmt: str | None) -> list[str]:
+    """
+    Decoder names to try, in order, for a sniffed container format.
+    """
+    order = []
+    for name in DECODE_BACKENDS:
+        if name == "soundfile" and fmt not in SOUNDFILE_FORMATS:
+            continue
+        order.append(name)
+    return order
+
+
+def decode_to_array(raw_bytes: bytes, target_sr: int = 22050) -> tuple[np.ndarray, int]:
+    """
+    Decode any container/codec we or ffmpeg understand (webm/opus, wav, mp3, ...)
+    straight from memory into a mono float32 array at `target_sr`.
+
+    Nothing touches the disk and the audio is decoded exactly once; see the
+    module docstring for which decoder handles what. The last decoder's
+    error is raised if none of them manage (FfmpegNotFound if ffmpeg was
+    needed but missing).
+    """
+    error = None
+    for name in decoders_for(sniff_format(raw_bytes)):
+        try:
+            return DECODERS[name](raw_bytes, target_sr), target_sr
+        except ImportError:
+            continue  # optional decoder not installed
+        except DecodeError as e:
+            error = e
+        except Exception as e:  # libsndfile / PyAV errors: try the next decoder
+            error = DecodeError(f"{name} failed: {e}")
+    raise error or DecodeError("No decoder available (check DECODE_BACKENDS)")
+
+
+########################################
+# BLOCK DECODING (long recordings, bounded memory)
+########################################
+
+def _soundfile_blocks(f, target_sr, chunk_samples):
+    with f:
+        rs = None
+        if target_sr != f.samplerate:
+            import soxr
+
+            rs = soxr.ResampleStream(f.samplerate, target_sr, 1, dtype="float32")
+        for block in f.blocks(blocksize=chunk_samples, dtype="float32", always_2d=True):
+            mono = block.mean(axis=1)
+            yield rs.resample_chunk(mono) if rs is not None else mono
+        if rs is not None:
+            yield rs.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def _pyav_blocks(container, target_sr, chunk_samples):
+    import av
+
+    with container:
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=target_sr)
+        pending, n = [], 0
+        try:
+            for frame in itertools.chain(container.decode(stream), [None]):  # None flushes the resampler
+                for out in resampler.resample(frame):
+                    pending.append(out.to_ndarray().reshape(-1))
+                    n += pending[-1].size
+                if n >= chunk_samples:
+                    yield np.concatenate(pending).astype(np.float32, copy=False)
+                    pending, n = [], 0
+        except Exception as e:  # corrupt stream past the header
+            raise DecodeError(f"pyav failed: {e}")
+        if pending:
+            yield np.concatenate(pending).astype(np.float32, copy=False)
+
+
+def _ffmpeg_blocks(source, target_sr, chunk_samples):
+    cmd = [
+        ensure_ffmpeg(),
+        "-hide_banner", "-loglevel", "error",
+        "-i", source if isinstance(source, str) else "pipe:0",
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", "1", "-ar", str(target_sr),
+        "pipe:1",
+    ]
+    # the slot is held for the life of the ffmpeg process, so DECODE_FFMPEG_MAX
+    # bounds live ffmpegs (it idles on a full stdout pipe between chunks)
+    slots = _FFMPEG_SLOTS
+    slots.acquire()
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL if isinstance(source, str) else subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+    except BaseException:
+        slots.release()
+        raise
+    stderr = []
+    threads = [threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)]
+    if proc.stdin is not None:
+        def feed():
+            try:
+                proc.stdin.write(source)
+            except BrokenPipeError:
+                pass  # ffmpeg gave up; its stderr says why
+            finally:
+                proc.stdin.close()
+        threads.append(threading.Thread(target=feed, daemon=True))
+    for t in threads:
+        t.start()
+    drained = False
+    try:
+        while True:
+            data = proc.stdout.read(4 * chunk_samples)
+            if not data:
+                drained = True
+                break
+            yield np.frombuffer(data[: len(data) // 4 * 4], dtype="<f4")
+    finally:
+        if not drained:
+            proc.kill()  # consumer stopped early
+        code = proc.wait()
+        for t in threads:
+            t.join()
+        slots.release()
+    if code != 0 and drained:
+        err = (stderr[0] if stderr else b"").decode(errors="ignore")[:600]
+        raise DecodeError(f"ffmpeg failed: {err}")
+
+
+def _open_blocks_with(name, source, target_sr, chunk_samples):
+    """
+    (sr, chunk iterator) from decoder `name`, or an exception if it can't
+    open `source`. Errors past the header surface while iterating.
+    """
+    if name == "soundfile":
+        import soundfile as sf
+
+        f = sf.SoundFile(source if isinstance(source, str) else io.BytesIO(source))
+        sr = target_sr or f.samplerate
+        return sr, _soundfile_blocks(f, sr, chunk_samples)
+    if name == "pyav":
+        import av  # in requirements.txt; falls back to ffmpeg if missing
+
+        container = av.open(source if isinstance(source, str) else io.BytesIO(source))
+        try:
+            sr = target_sr or container.streams.audio[0].rate
+        except Exception:
+            container.close()
+            raise
+        return sr, _pyav_blocks(container, sr, chunk_samples)
+    ensure_ffmpeg()  # fail here, not on the first chunk, so it is reported like decode_to_array
+    sr = target_sr or 22050
+    return sr, _ffmpeg_blocks(source, sr, chunk_samples)
+
+
+def open_blocks(source, target_sr=None, chunk_samples=65536):
+    """
+    Decode `source` (upload bytes or a file path) incrementally.
+
+    Returns (sr, iterator of mono float32 chunks). Only one chunk (plus the
+    resampler's state) is in memory at a time, whatever the clip length.
+    target_sr=None keeps the file's own rate in-process (22050 Hz through
+    ffmpeg). Decoders are tried in DECODE_BACKENDS order like
+    decode_to_array: libsndfile for wav/flac/ogg/mp3, PyAV when installed,
+    an ffmpeg pipe last. The fallback happens when a decoder can't open the
+    upload; an error further into the stream is raised from the iterator.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            fmt = sniff_format(f.read(12))
+    else:
+        fmt = sniff_format(source)
+
+    error = None
+    for name in decoders_for(fmt):
+        try:
+            return _open_blocks_with(name, source, target_sr, chunk_samples)
+        except ImportError:
+            continue  # optional decoder not installed
+        except DecodeError as e:
+            error = e
+        except Exception as e:  # libsndfile / PyAV errors: try the next decoder
+            error = DecodeError(f"{name} failed: {e}")
+    raise error or DecodeError("No decoder available (check DECODE_BACKENDS)")
+
+
+class StreamingDecoder:
+    """
+    Long-running ffmpeg process for one live connection: compressed chunks
+    (e.g. MediaRecorder webm/opus) go in with feed(), mono float32 samples at
+    `target_sr` come out of read_available() as ffmpeg produces them.
+
+    Uses asyncio subprocess pipes so the event loop never blocks on ffmpeg.
+    """
+
+    def __init__(self, target_sr: int = 22050):
+        self.target_sr = target_sr
+        self._proc = None
+        self._reader = None
+        self._pcm = bytearray()
+        self._stderr = b""
+
+    async def start(self):
+        import asyncio
+
+        self._proc = await asyncio.create_subprocess_exec(
+            ensure_ffmpeg(),
+            "-hide_banner", "-loglevel", "error",
+            # start decoding as soon as the container header is in,
+            # instead of buffering seconds of audio for format probing
+            "-probesize", "4096", "-analyzeduration", "0",
+            "-i", "pipe:0",
+            "-f", "f32le", "-acodec", "pcm_f32le",
+            "-ac", "1", "-ar", str(self.target_sr),
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self._reader = asyncio.ensure_future(self._drain_stdout())
+
+    async def _drain_stdout(self):
+        while True:
+            chunk = await self._proc.stdout.read(65536)
+            if not chunk:
+                break
+            self._pcm.extend(chunk)
+
+    async def feed(self, data: bytes):
+        self._proc.stdin.write(data)
+        await self._proc.stdin.drain()
+
+    def read_available(self) -> np.ndarray:
+        """
+        All complete samples decoded since the last call.
+        """
+        n = len(self._pcm) // 4 * 4
+        out = np.frombuffer(bytes(self._pcm[:n]), dtype="<f4")
+        del self._pcm[:n]
+        return out
+
+    async def close(self) -> np.ndarray:
+        """
+        Flush ffmpeg and return the remaining samples.
+        Raises DecodeError if ffmpeg rejected the stream.
+        """
+        if self._proc.stdin and not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+        await self._reader
+        self._stderr = await self._proc.stderr.read()
+        code = await self._proc.wait()
+        if code != 0:
+            raise DecodeError(f"ffmpeg failed: {self._stderr.decode(errors='ignore')[:600]}")
+        return self.read_available()
+
+    def kill(self):
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
@@ -1,6 +1,12 @@
+import base64
+import os
+import warnings
+
 import numpy as np
 import librosa
-from scipy.ndimage import median_filter
+
+from metrics import stage
+from songLibrary import default_library, note_name_to_midi
 
 
 
@@ -17,6 +23,13 @@ SONGS = {
     "happy_birthday": HAPPY_BIRTHDAY_NOTES,
 }
 
+# Compiled registry the judger reads from (songs/*.json, MIDI/MusicXML, $SONGS_DIR).
+# Built-in SONGS fill in anything that has no file.
+SONG_LIBRARY = default_library()
+for _key, _notes in SONGS.items():
+    if _key not in SONG_LIBRARY:
+        SONG_LIBRARY.register(_key, _notes)
+
 
 NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
@@ -69,6 +82,391 @@ def correct_violin_register(freq_hz, low_ok=200.0):
             return c
     return freq_hz
 
+
+########################################
+# VECTORIZED FRAME -> SEGMENT HELPERS
+########################################
+
+def midi_to_note_name(midi):
+    """
+    62 -> "D4" (same spelling as hz_to_note_info).
+    """
+    midi = int(midi)
+    return f"{NOTE_NAMES[midi % 12]}{(midi // 12) - 1}"
+
+def correct_violin_register_array(f0_hz, low_ok=200.0):
+    """
+    Array version of correct_violin_register.
+    Frames that are NaN or <= 0 are passed through untouched.
+    """
+    f0_hz = np.asarray(f0_hz, dtype=float)
+    out = f0_hz.copy()
+    undecided = ~np.isnan(f0_hz) & (f0_hz > 0)
+    for mult in (1, 2, 3, 4):
+        hit = undecided & (f0_hz * mult >= low_ok)
+        out[hit] = f0_hz[hit] * mult
+        undecided &= ~hit
+    return out
+
+def hz_to_midi_cents(freq_hz):
+    """
+    Array version of the math in hz_to_note_info.
+    Returns (midi_round int array, cents_off float array). Input must be > 0.
+    """
+    midi_exact = 69 + 12 * np.log2(np.asarray(freq_hz, dtype=float) / 440.0)
+    midi_round = np.rint(midi_exact)
+    cents_off = (midi_exact - midi_round) * 100.0
+    return midi_round.astype(np.int64), cents_off
+
+class Segments:
+    """
+    Note segments as parallel arrays (struct of arrays) instead of one dict
+    per segment: midi (int16), start_s / end_s (float64) and cents (float32,
+    the segment's mean offset from its note). Indexing with a slice or a
+    boolean mask gives another Segments; to_dicts() gives the
+    [{"note", "start_s", "end_s", "dur_s"}, ...] form of analyze_violin_notes.
+    """
+    __slots__ = ("midi", "start_s", "end_s", "cents")
+
+    def __init__(self, midi=(), start_s=(), end_s=(), cents=()):
+        self.midi = np.asarray(midi, dtype=np.int16)
+        self.start_s = np.asarray(start_s, dtype=np.float64)
+        self.end_s = np.asarray(end_s, dtype=np.float64)
+        self.cents = np.asarray(cents, dtype=np.float32)
+
+    @classmethod
+    def concat(cls, parts):
+        parts = list(parts)
+        if not parts:
+            return cls()
+        return cls(*(np.concatenate([getattr(p, f) for p in parts]) for f in cls.__slots__))
+
+    def __len__(self):
+        return self.midi.size
+
+    def __getitem__(self, idx):
+        return Segments(self.midi[idx], self.start_s[idx], self.end_s[idx], self.cents[idx])
+
+    @property
+    def dur_s(self):
+        return self.end_s - self.start_s
+
+    def note_names(self):
+        return [midi_to_note_name(m) for m in self.midi.tolist()]
+
+    def to_dicts(self):
+        return [
+            {"note": n, "start_s": a, "end_s": b, "dur_s": b - a}
+            for n, a, b in zip(self.note_names(), self.start_s.tolist(), self.end_s.tolist())
+        ]
+
+    def columns(self):
+        """
+        {"note": [...], "midi": [...], "start_s": [...], "end_s": [...], "cents": [...]}
+        (columnar JSON, see responseFormat).
+        """
+        return {
+            "note": self.note_names(),
+            "midi": self.midi.tolist(),
+            "start_s": self.start_s.tolist(),
+            "end_s": self.end_s.tolist(),
+            "cents": self.cents.round(1).tolist(),
+        }
+
+
+def frames_to_segments(
+    times,
+    f0_smooth,
+    low_ok_for_register=200.0,
+    note_change_cents_tolerance=40,
+    min_segment_len_sec=0.05,
+):
+    """
+    frames_to_segment_arrays(...).to_dicts(): a list of
+    {"note", "start_s", "end_s", "dur_s"} dicts.
+    """
+    return frames_to_segment_arrays(
+        times,
+        f0_smooth,
+        low_ok_for_register=low_ok_for_register,
+        note_change_cents_tolerance=note_change_cents_tolerance,
+        min_segment_len_sec=min_segment_len_sec,
+    ).to_dicts()
+
+
+def frames_to_segment_arrays(
+    times,
+    f0_smooth,
+    low_ok_for_register=200.0,
+    note_change_cents_tolerance=40,
+    min_segment_len_sec=0.05,
+):
+    """
+    Turn a smoothed per-frame pitch track (NaN = unvoiced) into note segments
+    (a Segments).
+
+    A segment starts on a voiced frame and keeps absorbing following frames
+    while they have the same MIDI note and stay within the cents tolerance of
+    the segment's FIRST frame. Segments shorter than min_segment_len_sec are
+    dropped.
+
+    Done with array ops: runs of contiguous voiced frames with the same MIDI
+    note are found by run-length encoding; a run whose cents spread fits in the
+    tolerance is one segment. Only the (rare) runs with a wider spread are
+    walked frame by frame, so output matches the original per-frame loop.
+    """
+    times = np.asarray(times)
+    f0_adj = correct_violin_register_array(f0_smooth, low_ok=low_ok_for_register)
+
+    voiced_idx = np.flatnonzero(~np.isnan(f0_adj) & (f0_adj > 0))
+    if voiced_idx.size == 0:
+        return Segments()
+
+    midi, cents = hz_to_midi_cents(f0_adj[voiced_idx])
+
+    # run boundaries: a gap in voiced frames or a MIDI change
+    is_run_start = np.ones(voiced_idx.size, dtype=bool)
+    is_run_start[1:] = (np.diff(voiced_idx) != 1) | (np.diff(midi) != 0)
+    run_starts = np.flatnonzero(is_run_start)
+    run_ends = np.append(run_starts[1:], voiced_idx.size)
+
+    spread = np.maximum.reduceat(cents, run_starts) - np.minimum.reduceat(cents, run_starts)
+    wide_runs = np.flatnonzero(spread > note_change_cents_tolerance)
+
+    # runs too wide for the shortcut: greedy split against each segment's first frame
+    extra_starts = []
+    for r in wide_runs:
+        ref = cents[run_starts[r]]
+        for k in range(run_starts[r] + 1, run_ends[r]):
+            if abs(cents[k] - ref) > note_change_cents_tolerance:
+                extra_starts.append(k)
+                ref = cents[k]
+
+    seg_starts = run_starts
+    if extra_starts:
+        seg_starts = np.union1d(run_starts, np.asarray(extra_starts, dtype=run_starts.dtype))
+    seg_last = np.append(seg_starts[1:], voiced_idx.size) - 1
+
+    start_s = times[voiced_idx[seg_starts]]
+    end_s = times[voiced_idx[seg_last]]
+    keep = (end_s - start_s) >= min_segment_len_sec
+    mean_cents = np.add.reduceat(cents, seg_starts) / (seg_last - seg_starts + 1)
+
+    return Segments(midi[seg_starts][keep], start_s[keep], end_s[keep], mean_cents[keep])
+
+def load_mono(audio, sr=None):
+    """
+    Path -> (y, sr) via librosa at the file's own rate.
+    Array -> returned as-is (mixed down if 2-D); `sr` is required then.
+    """
+    if isinstance(audio, np.ndarray):
+        if sr is None:
+            raise ValueError("sr is required when passing an audio array")
+        y = audio if audio.ndim == 1 else librosa.to_mono(audio)
+        return y.astype(np.float32, copy=False), sr
+    with stage("load"):
+        return librosa.load(audio, sr=None, mono=True)
+
+########################################
+# ANALYSIS RATE POLICY
+########################################
+# pyin/yin cost grows with the number of samples, and a violin's pitch (plus
+# the first few harmonics YIN needs) sits far below 11 kHz. With a policy
+# set, uploads are decoded straight to a lower rate and frame/hop are scaled
+# so frames keep the same duration as 4096/512 samples at 22050 Hz.
+#
+# ANALYSIS_SR env var: "native" (default; analyse at the decoded/file rate
+# with fixed 4096/512 frames, the original behaviour), "auto" (lowest of
+# ANALYSIS_RATES that keeps NYQUIST_HEADROOM harmonics of the band's top
+# note below Nyquist) or a rate in Hz. See BENCHMARKS.md for the accuracy cost.
+
+ANALYSIS_SR = os.environ.get("ANALYSIS_SR", "native")
+ANALYSIS_RATES = (11025, 16000, 22050)
+NYQUIST_HEADROOM = 3
+REF_SR, REF_FRAME_LENGTH, REF_HOP_LENGTH = 22050, 4096, 512
+DECODE_SR = 22050  # upload decode rate when the policy is "native"
+
+
+def analysis_rate(fmax_note, policy=None):
+    """
+    Sample rate to analyse a band topping out at `fmax_note` at,
+    or None for "native" (keep whatever rate the audio has).
+    """
+    policy = ANALYSIS_SR if policy is None else policy
+    if policy == "native":
+        return None
+    if policy == "auto":
+        fmax_hz = librosa.note_to_hz(fmax_note)
+        for rate in ANALYSIS_RATES:
+            if rate / 2 >= NYQUIST_HEADROOM * fmax_hz:
+                return rate
+        return ANALYSIS_RATES[-1]
+    return int(policy)
+
+
+def frames_for_rate(sr):
+    """
+    (frame_length, hop_length) lasting as long as 4096/512 samples at 22050 Hz.
+    """
+    scale = sr / REF_SR
+    return 2 * int(round(REF_FRAME_LENGTH * scale / 2)), max(1, int(round(REF_HOP_LENGTH * scale)))
+
+
+def to_analysis_rate(y, sr, analysis_sr):
+    """
+    (y, sr, frame_length, hop_length) ready for track_pitch: resampled to
+    `analysis_sr` if needed (a no-op when the upload was decoded at that
+    rate already). analysis_sr=None keeps the old fixed 4096/512 frames.
+    """
+    if analysis_sr is None:
+        return y, sr, REF_FRAME_LENGTH, REF_HOP_LENGTH
+    if sr != analysis_sr:
+        with stage("load"):
+            y = librosa.resample(y, orig_sr=sr, target_sr=analysis_sr, res_type="soxr_hq")
+        sr = analysis_sr
+    return (y, sr) + frames_for_rate(sr)
+
+########################################
+# PITCH TRACKING BACKENDS
+########################################
+# Each backend takes (y, sr, fmin_hz, fmax_hz, frame_length, hop_length) and
+# returns (f0, voiced_flag, voiced_prob) with one value per frame, like pyin.
+
+def track_pitch_pyin(y, sr, fmin_hz, fmax_hz, frame_length=4096, hop_length=512):
+    """
+    Probabilistic YIN. Best accuracy, but by far the most CPU per second of audio.
+    """
+    return librosa.pyin(
+        y,
+        fmin=fmin_hz,
+        fmax=fmax_hz,
+        sr=sr,
+        frame_length=frame_length,
+        hop_length=hop_length,
+    )
+
+def track_pitch_yin(
+    y,
+    sr,
+    fmin_hz,
+    fmax_hz,
+    frame_length=4096,
+    hop_length=512,
+    silence_db=35.0,
+    max_jump_semitones=2,
+):
+    """
+    Plain YIN plus a lightweight Viterbi smoother on a semitone grid.
+
+    - YIN gives one f0 per frame but no voicing decision, so frames quieter
+      than `silence_db` below the loudest frame are treated as unvoiced.
+    - Viterbi over semitone states (local transitions only) removes isolated
+      octave / subharmonic jumps. Frames where YIN lands within a semitone of
+      the decoded path keep their exact f0 (so cents info survives); the rest
+      are snapped to the decoded note.
+    """
+    f0 = librosa.yin(
+        y,
+        fmin=fmin_hz,
+        fmax=fmax_hz,
+        sr=sr,
+        frame_length=frame_length,
+        hop_length=hop_length,
+    )
+
+    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
+    rms_db = librosa.amplitude_to_db(rms, ref=np.max)[: len(f0)]
+    voiced_flag = rms_db > -silence_db
+    voiced_prob = voiced_flag.astype(float)
+
+    if not np.any(voiced_flag):
+        return np.full_like(f0, np.nan), voiced_flag, voiced_prob
+
+    # Viterbi on a semitone grid between fmin and fmax
+    midi_lo = int(np.floor(librosa.hz_to_midi(fmin_hz)))
+    midi_hi = int(np.ceil(librosa.hz_to_midi(fmax_hz)))
+    states = np.arange(midi_lo, midi_hi + 1)
+    midi_est = librosa.hz_to_midi(f0)
+
+    emission = np.exp(-0.5 * (states[:, None] - midi_est[None, :]) ** 2)
+    emission[:, ~voiced_flag] = 1.0  # unvoiced frames carry no evidence
+    emission /= emission.sum(axis=0, keepdims=True)
+
+    transition = librosa.sequence.transition_local(
+        len(states), 2 * max_jump_semitones + 1, window="triangle", wrap=False
+    )
+    path = librosa.sequence.viterbi(emission, transition)
+    decoded_midi = states[path]
+
+    f0_out = np.where(
+        np.abs(midi_est - decoded_midi) <= 1.0,
+        f0,
+        librosa.midi_to_hz(decoded_midi),
+    )
+    f0_out[~voiced_flag] = np.nan
+    return f0_out, voiced_flag, voiced_prob
+
+
+PITCH_BACKENDS = {
+    "pyin": track_pitch_pyin,
+    "yin": track_pitch_yin,
+}
+
+
+def track_pitch(
+    y,
+    sr,
+    fmin_note="C3",
+    fmax_note="A6",
+    frame_length=4096,
+    hop_length=512,
+    voiced_prob_threshold=0.3,
+    pitch_backend="pyin",
+):
+    """
+    Steps 2-4 of analyze_violin_notes on an in-memory signal.
+    Returns (times, f0_smooth): frame times in seconds and the smoothed pitch
+    in Hz, NaN where the frame is not confidently voiced.
+    """
+    # 2. Estimate pitch curve (pyin by default, see PITCH_BACKENDS)
+    if pitch_backend not in PITCH_BACKENDS:
+        raise ValueError(f"Unknown pitch_backend '{pitch_backend}'. Available: {list(PITCH_BACKENDS.keys())}")
+    with stage(pitch_backend):
+        f0, voiced_flag, voiced_prob = PITCH_BACKENDS[pitch_backend](
+            y,
+            sr,
+            fmin_hz=librosa.note_to_hz(fmin_note),
+            fmax_hz=librosa.note_to_hz(fmax_note),
+            frame_length=frame_length,
+            hop_length=hop_length,
+        )
+    # time for each frame
+    times = librosa.frames_to_time(
+        np.arange(len(f0)),
+        sr=sr,
+        hop_length=hop_length
+    )
+
+    # 3. Keep only confidently voiced frames (rest -> NaN)
+    conf_mask = (voiced_flag == True) & (voiced_prob >= voiced_prob_threshold)
+    f0_clean = np.where(conf_mask, f0, np.nan)
+
+    # 4. Smooth pitch with median filter to reduce jitter/vibrato splits.
+    f0_smooth = f0_clean.copy()
+    valid_idx = ~np.isnan(f0_clean)
+    if np.any(valid_idx):
+        from scipy.ndimage import median_filter  # heavy import, only needed in workers
+
+        with stage("smoothing"):
+            tmp = f0_clean.copy()
+            tmp[~valid_idx] = 0.0
+            tmp_filtered = median_filter(tmp, size=5)
+            tmp_filtered[~valid_idx] = np.nan
+            f0_smooth = tmp_filtered
+
+    return times, f0_smooth
+
+
 def analyze_violin_notes(
     audio_path,
     fmin_note="C3",
@@ -79,9 +477,15 @@ def analyze_violin_notes(
     min_segment_len_sec=0.05,
     note_change_cents_tolerance=40,
     low_ok_for_register=200.0,
+    pitch_backend="pyin",
+    sr=None,
+    executor=None,
+    as_arrays=False,
+    with_contour=False,
 ):
     """
-    Take an audio file path (wav/webm/etc), extract monophonic pitch over time,
+    Take an audio file path (wav/webm/etc) or an already-decoded mono array
+    (pass its sample rate as `sr`), extract monophonic pitch over time,
     smooth it, merge it into note segments, and return a list of segments.
 
     Returns a list like:
@@ -91,124 +495,356 @@ def analyze_violin_notes(
       { "note": "E4", "start_s": 0.80, "end_s": 1.30, "dur_s": 0.50 },
       ...
     ]
+
+    pitch_backend picks the f0 estimator from PITCH_BACKENDS:
+    "pyin" (most accurate, slowest) or "yin" (YIN + Viterbi smoothing, much cheaper).
+
+    executor: long clips are split at silences and their regions tracked in
+    parallel on it (see track_pitch_split). None = split_executor(), i.e.
+    ANALYSIS_SPLIT_WORKERS threads, or serial when that is 0.
+
+    as_arrays=True returns the same segments as one Segments (parallel
+    arrays, plus mean cents per segment) instead of a list of dicts.
+    with_contour=True returns (segments, contour): the smoothed pitch track
+    as an encode_contour() dict (see resample_contour).
     """
 
     # 1. Load audio (mono, keep original sr)
-    y, sr = librosa.load(audio_path, sr=None, mono=True)
+    y, sr = load_mono(audio_path, sr=sr)
 
-    # 2. Estimate pitch curve using pyin
-    f0, voiced_flag, voiced_prob = librosa.pyin(
+    # 2-4. Pitch curve -> confident frames only -> median smoothed
+    times, f0_smooth = track_pitch_split(
         y,
-        fmin=librosa.note_to_hz(fmin_note),
-        fmax=librosa.note_to_hz(fmax_note),
+        sr,
+        executor=executor,
+        fmin_note=fmin_note,
+        fmax_note=fmax_note,
         frame_length=frame_length,
         hop_length=hop_length,
+        voiced_prob_threshold=voiced_prob_threshold,
+        pitch_backend=pitch_backend,
     )
-    # time for each frame
-    times = librosa.frames_to_time(
-        np.arange(len(f0)),
-        sr=sr,
-        hop_length=hop_length
+
+    # 5-7. Register correction, same-note merging and blip filtering
+    with stage("segmentation"):
+        segments = frames_to_segment_arrays(
+            times,
+            f0_smooth,
+            low_ok_for_register=low_ok_for_register,
+            note_change_cents_tolerance=note_change_cents_tolerance,
+            min_segment_len_sec=min_segment_len_sec,
+        )
+    if not as_arrays:
+        segments = segments.to_dicts()
+    if with_contour:
+        return segments, encode_contour(contour_cents(f0_smooth, low_ok_for_register), hop_length / sr)
+    return segments
+
+
+########################################
+# PITCH CONTOUR (for drawing against the reference)
+########################################
+# The smoothed f0 track is kept next to the segments as int16 cents above
+# C-1 (MIDI note x 100, so A4 = 6900), register-corrected like the segments,
+# CONTOUR_UNVOICED where no pitch was found. Judge results carry it at the
+# full frame rate, base64-encoded so it survives the JSON result cache;
+# resample_contour() turns it into what a client asked for without
+# touching the audio again.
+
+CONTOUR_UNVOICED = -32768
+CONTOUR_FORMAT = "int16le-cents"
+
+
+def contour_cents(f0_smooth, low_ok_for_register=200.0):
+    """
+    Per-frame f0 (Hz, NaN = unvoiced) -> int16 cents, CONTOUR_UNVOICED for rests.
+    """
+    f0_adj = correct_violin_register_array(f0_smooth, low_ok=low_ok_for_register)
+    voiced = ~np.isnan(f0_adj) & (f0_adj > 0)
+    cents = np.full(f0_adj.shape, CONTOUR_UNVOICED, dtype=np.int16)
+    cents[voiced] = np.rint(6900 + 1200 * np.log2(f0_adj[voiced] / 440.0))
+    return cents
+
+
+def encode_contour(cents, hop_s):
+    return {"hop_s": hop_s, "cents": base64.b64encode(cents.astype("<i2").tobytes()).decode("ascii")}
+
+
+def resample_contour(contour, points_per_sec):
+    """
+    An encode_contour() dict -> the response form, downsampled to about
+    `points_per_sec` (median of the voiced frames in each group of frames):
+
+      {"format": "int16le-cents", "hop_s": 0.093, "start_s": 0.023,
+       "unvoiced": -32768, "cents": <bytes>}
+
+    Point i sits at start_s + i * hop_s. `cents` is raw bytes: base64 in
+    JSON responses, binary in msgpack ones (see responseFormat).
+    """
+    cents = np.frombuffer(base64.b64decode(contour["cents"]), dtype="<i2")
+    hop_s = contour["hop_s"]
+    factor = max(1, int(round(1.0 / (hop_s * points_per_sec))))
+    if factor > 1 and cents.size:
+        n = -(-cents.size // factor)
+        grid = np.full(n * factor, np.nan)
+        grid[:cents.size] = np.where(cents == CONTOUR_UNVOICED, np.nan, cents)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-unvoiced groups
+            med = np.nanmedian(grid.reshape(n, factor), axis=1)
+        cents = np.where(np.isnan(med), CONTOUR_UNVOICED, np.rint(med)).astype("<i2")
+    return {
+        "format": CONTOUR_FORMAT,
+        "hop_s": hop_s * factor,
+        "start_s": hop_s * (factor - 1) / 2,
+        "unvoiced": CONTOUR_UNVOICED,
+        "cents": cents.astype("<i2", copy=False).tobytes(),
+    }
+
+
+CONTOUR_MAX_HZ = 200.0
+
+
+def result_view(result, contour_hz=0):
+    """
+    A judge result as the endpoints send it: "contour" only when asked for
+    (contour_hz > 0 points per second, see resample_contour), else dropped.
+    """
+    view = {k: v for k, v in result.items() if k != "contour"}
+    if contour_hz > 0 and "contour" in result:
+        view["contour"] = resample_contour(result["contour"], contour_hz)
+    return view
+
+
+########################################
+# PARALLEL REGIONS (one long clip on several cores)
+########################################
+# pyin/yin run on one core, so a long upload's latency is its full serial
+# pitch-tracking time even when other cores are idle. Long clips are cut in
+# the middle of silences (librosa.effects.split) into regions of at least
+# SPLIT_MIN_REGION_SEC, each region is tracked with SPLIT_CONTEXT_SEC of
+# audio on both sides, and the regions' own frames are put back on the
+# whole clip's frame grid, so segmentation runs once over the merged track.
+# Cuts land in silence, where every frame is unvoiced anyway; the only
+# differences to the serial track come from pyin's Viterbi pass and yin's
+# loudness gate seeing one region instead of the whole clip.
+#
+# ANALYSIS_SPLIT_WORKERS env var: threads per process for the regions
+# (default 0 = serial). numpy's FFTs release the GIL, numba's Viterbi does
+# not, so yin scales better than pyin. Every AnalysisPool worker gets its
+# own threads: lower ANALYSIS_WORKERS when raising this.
+
+ANALYSIS_SPLIT_WORKERS = int(os.environ.get("ANALYSIS_SPLIT_WORKERS", 0))
+SPLIT_MIN_REGION_SEC = 8.0
+SPLIT_MIN_GAP_SEC = 0.25
+SPLIT_CONTEXT_SEC = 1.0
+SPLIT_TOP_DB = 30
+
+_SPLIT_EXECUTOR = None
+
+
+def split_executor():
+    """
+    This process's region thread pool, or None when ANALYSIS_SPLIT_WORKERS is 0.
+    """
+    global _SPLIT_EXECUTOR
+    if ANALYSIS_SPLIT_WORKERS <= 0:
+        return None
+    if _SPLIT_EXECUTOR is None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        _SPLIT_EXECUTOR = ThreadPoolExecutor(ANALYSIS_SPLIT_WORKERS, thread_name_prefix="split")
+    return _SPLIT_EXECUTOR
+
+
+def silence_cuts(
+    y,
+    sr,
+    hop_length=512,
+    min_region_sec=SPLIT_MIN_REGION_SEC,
+    min_gap_sec=SPLIT_MIN_GAP_SEC,
+    top_db=SPLIT_TOP_DB,
+):
+    """
+    Region boundaries [0, c1, ..., len(y)] in samples. Every inner cut is
+    the middle of a silence of at least min_gap_sec, rounded to a whole
+    hop, and every region is at least min_region_sec long.
+    """
+    min_region = int(min_region_sec * sr)
+    if y.size < 2 * min_region:
+        return [0, y.size]
+    intervals = librosa.effects.split(y, top_db=top_db, hop_length=hop_length)
+    cuts = [0]
+    for (_, gap_start), (gap_end, _) in zip(intervals[:-1], intervals[1:]):
+        if gap_end - gap_start < min_gap_sec * sr:
+            continue
+        cut = (gap_start + gap_end) // 2 // hop_length * hop_length
+        if cut - cuts[-1] >= min_region and y.size - cut >= min_region:
+            cuts.append(cut)
+    cuts.append(y.size)
+    return cuts
+
+
+def _track_region(window, sr, track_kwargs):
+    return track_pitch(window, sr, **track_kwargs)[1]
+
+
+def track_pitch_split(y, sr, executor=None, context_sec=SPLIT_CONTEXT_SEC, **track_kwargs):
+    """
+    track_pitch with the clip's silence-separated regions (silence_cuts)
+    tracked in parallel on `executor` and merged in order. Serial, and the
+    same as track_pitch, for short clips or without an executor
+    (None = split_executor()).
+    """
+    executor = executor or split_executor()
+    hop_length = track_kwargs.get("hop_length", 512)
+    cuts = silence_cuts(y, sr, hop_length) if executor is not None else [0, y.size]
+    if len(cuts) < 3:
+        return track_pitch(y, sr, **track_kwargs)
+
+    context = -(-int(context_sec * sr) // hop_length) * hop_length
+    n_frames = 1 + y.size // hop_length
+    jobs = []
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        w0 = max(0, a - context)
+        window = y[w0:min(y.size, b + context)]
+        jobs.append((w0 // hop_length, a // hop_length, b // hop_length if b < y.size else n_frames,
+                     executor.submit(_track_region, window, sr, track_kwargs)))
+
+    # region threads have no job context: time the whole parallel pass here
+    f0_smooth = np.empty(n_frames)
+    with stage(track_kwargs.get("pitch_backend", "pyin")):
+        for first_frame, core_lo, core_hi, fut in jobs:
+            f0_smooth[core_lo:core_hi] = fut.result()[core_lo - first_frame: core_hi - first_frame]
+    times = librosa.frames_to_time(np.arange(n_frames), sr=sr, hop_length=hop_length)
+    return times, f0_smooth
+
+
+########################################
+# BLOCK STREAMING (long recordings, bounded memory)
+########################################
+# pyin/yin memory grows with clip length (yin's frame matrix alone is
+# frame_length x frames), so a 20-minute rehearsal recording blows up a
+# worker. In block mode the audio arrives as chunks (decoding.open_blocks)
+# and is analysed in windows of block_sec plus context_sec on both sides;
+# each window contributes only its core frames, so the pitch track matches
+# the whole-clip one except for small Viterbi / median-filter differences
+# at the block edges.
+
+def iter_windows(chunks, hop_length, block_samples, context_samples):
+    """
+    Regroup an iterator of sample arrays into overlapping analysis windows.
+
+    Yields (window, first_frame, core_lo, core_hi): window[0] is the sample
+    at first_frame * hop_length, and the window owns the (centered) global
+    frames core_lo <= k < core_hi. Block and context are rounded to whole
+    hops so every window sits on the same frame grid as the whole clip.
+    """
+    block = max(1, block_samples // hop_length) * hop_length
+    context = -(-context_samples // hop_length) * hop_length
+    buf = np.zeros(0, dtype=np.float32)
+    buf_start = 0      # global index of buf[0]
+    block_start = 0    # first sample of the next core block
+
+    for chunk in chunks:
+        buf = np.concatenate([buf, np.asarray(chunk, dtype=np.float32)])
+        while buf_start + buf.size >= block_start + block + context:
+            w0 = max(0, block_start - context)
+            yield (
+                buf[w0 - buf_start: block_start + block + context - buf_start],
+                w0 // hop_length,
+                block_start // hop_length,
+                (block_start + block) // hop_length,
+            )
+            block_start += block
+            drop = max(0, block_start - context) - buf_start
+            buf, buf_start = buf[drop:], buf_start + drop
+
+    total = buf_start + buf.size
+    if total > 0 and total >= block_start:
+        w0 = max(0, block_start - context)
+        yield buf[w0 - buf_start:], w0 // hop_length, block_start // hop_length, 1 + total // hop_length
+
+
+def analyze_violin_notes_blocks(
+    chunks,
+    sr,
+    fmin_note="C3",
+    fmax_note="A6",
+    frame_length=4096,
+    hop_length=512,
+    voiced_prob_threshold=0.3,
+    min_segment_len_sec=0.05,
+    note_change_cents_tolerance=40,
+    low_ok_for_register=200.0,
+    pitch_backend="pyin",
+    block_sec=60.0,
+    context_sec=2.0,
+    executor=None,
+    as_arrays=False,
+    with_contour=False,
+):
+    """
+    analyze_violin_notes over an iterator of mono chunks at `sr`, with peak
+    memory set by block_sec + 2 * context_sec instead of the clip length.
+
+    Frames are merged into segments as they come in. Every segment but the
+    last one found so far is final (frames_to_segments is a left-to-right
+    scan and the frame after it already started something new), so only
+    the frames from the end of the last final segment on are kept for the
+    next block. Each block is split at silences like analyze_violin_notes
+    (`executor`, see track_pitch_split). as_arrays, with_contour: see
+    analyze_violin_notes (the contour is 2 bytes per frame, kept whole).
+    """
+    seg_kwargs = dict(
+        low_ok_for_register=low_ok_for_register,
+        note_change_cents_tolerance=note_change_cents_tolerance,
+        min_segment_len_sec=min_segment_len_sec,
     )
+    parts = []
+    contour_parts = []
+    pend_t = np.zeros(0)
+    pend_f0 = np.zeros(0)
 
-    # 3. Keep only confidently voiced frames (rest -> NaN)
-    conf_mask = (voiced_flag == True) & (voiced_prob >= voiced_prob_threshold)
-    f0_clean = np.where(conf_mask, f0, np.nan)
+    for window, first_frame, core_lo, core_hi in iter_windows(
+        chunks, hop_length, int(block_sec * sr), int(context_sec * sr)
+    ):
+        _, f0_smooth = track_pitch_split(
+            window,
+            sr,
+            executor=executor,
+            fmin_note=fmin_note,
+            fmax_note=fmax_note,
+            frame_length=frame_length,
+            hop_length=hop_length,
+            voiced_prob_threshold=voiced_prob_threshold,
+            pitch_backend=pitch_backend,
+        )
+        core = f0_smooth[core_lo - first_frame: core_hi - first_frame]
+        if with_contour:
+            contour_parts.append(contour_cents(core, low_ok_for_register))
+        pend_t = np.concatenate([pend_t, librosa.frames_to_time(np.arange(core_lo, core_lo + core.size), sr=sr, hop_length=hop_length)])
+        pend_f0 = np.concatenate([pend_f0, core])
 
-    # 4. Smooth pitch with median filter to reduce jitter/vibrato splits.
-    f0_smooth = f0_clean.copy()
-    valid_idx = ~np.isnan(f0_clean)
-    if np.any(valid_idx):
-        tmp = f0_clean.copy()
-        tmp[~valid_idx] = 0.0
-        tmp_filtered = median_filter(tmp, size=5)
-        tmp_filtered[~valid_idx] = np.nan
-        f0_smooth = tmp_filtered
-
-    # 5. Convert each frame freq -> corrected pitch -> note info dict
-    frame_notes = []
-    for t, raw_freq in zip(times, f0_smooth):
-        if np.isnan(raw_freq):
-            frame_notes.append(None)
-        else:
-            adj_freq = correct_violin_register(raw_freq, low_ok=low_ok_for_register)
-            frame_notes.append(hz_to_note_info(adj_freq))
-
-    # 6. Merge consecutive frames that represent "the same note"
-    segments = []
-    if any(n is not None for n in frame_notes):
-        curr_start_t = None
-        curr_end_t = None
-        curr_ref_note = None      
-        curr_note_name = None     
-
-        def is_same_note(prev_ref, curr_candidate, tolerance_cents):
-            if prev_ref is None or curr_candidate is None:
-                return False
-            midi_ref, cents_ref = prev_ref
-            if curr_candidate["midi"] != midi_ref:
-                return False
-            cents_diff = abs(curr_candidate["cents_off"] - cents_ref)
-            return cents_diff <= tolerance_cents
-
-        for t, n in zip(times, frame_notes):
-            if n is None:
-                if curr_start_t is not None:
-                    segments.append({
-                        "note": curr_note_name,
-                        "start_s": curr_start_t,
-                        "end_s": curr_end_t
-                    })
-                    curr_start_t = None
-                    curr_end_t = None
-                    curr_ref_note = None
-                    curr_note_name = None
-                continue
-
-            if curr_start_t is None:
-                # start new segment
-                curr_start_t = t
-                curr_end_t = t
-                curr_ref_note = (n["midi"], n["cents_off"])
-                curr_note_name = n["note"]
-            else:
-                # same vs new note?
-                if is_same_note(curr_ref_note, n, note_change_cents_tolerance):
-                    curr_end_t = t
-                else:
-                    # end previous segment
-                    segments.append({
-                        "note": curr_note_name,
-                        "start_s": curr_start_t,
-                        "end_s": curr_end_t
-                    })
-                    # start new one
-                    curr_start_t = t
-                    curr_end_t = t
-                    curr_ref_note = (n["midi"], n["cents_off"])
-                    curr_note_name = n["note"]
-
-        # close trailing open segment
-        if curr_start_t is not None:
-            segments.append({
-                "note": curr_note_name,
-                "start_s": curr_start_t,
-                "end_s": curr_end_t
-            })
-
-    # 7. Filter out tiny blips (bow squeaks, coughs, partial frames)
-    cleaned_segments = []
-    for seg in segments:
-        dur_s = seg["end_s"] - seg["start_s"]
-        if dur_s >= min_segment_len_sec:
-            cleaned_segments.append({
-                "note": seg["note"],
-                "start_s": seg["start_s"],
-                "end_s": seg["end_s"],
-                "dur_s": dur_s
-            })
-
-    return cleaned_segments
+        with stage("segmentation"):
+            found = frames_to_segment_arrays(pend_t, pend_f0, **seg_kwargs)
+        if len(found) > 1:
+            parts.append(found[:-1])
+            keep = pend_t > found.end_s[-2]
+            pend_t, pend_f0 = pend_t[keep], pend_f0[keep]
+        # leading unvoiced frames can't belong to a segment
+        voiced = np.flatnonzero(~np.isnan(pend_f0))
+        start = voiced[0] if voiced.size else pend_f0.size
+        pend_t, pend_f0 = pend_t[start:], pend_f0[start:]
+
+    with stage("segmentation"):
+        parts.append(frames_to_segment_arrays(pend_t, pend_f0, **seg_kwargs))
+    segments = Segments.concat(parts)
+    if not as_arrays:
+        segments = segments.to_dicts()
+    if with_contour:
+        cents = np.concatenate(contour_parts) if contour_parts else np.zeros(0, dtype=np.int16)
+        return segments, encode_contour(cents, hop_length / sr)
+    return segments
 
 
 ########################################
@@ -219,9 +855,11 @@ def segments_to_note_sequence(cleaned_segments):
     """
     Take cleaned_segments like:
        [{"note":"D4","start_s":0.0,"end_s":0.4,"dur_s":0.4}, ...]
-    and reduce to just the ordered notes:
+    (or a Segments) and reduce to just the ordered notes:
        ["D4","D4","E4","D4","G4","F#4", ...]
     """
+    if isinstance(cleaned_segments, Segments):
+        return cleaned_segments.note_names()
     return [seg["note"] for seg in cleaned_segments]
 
 
@@ -244,52 +882,308 @@ def score_player(player_notes, target_notes):
     return correct / L
 
 
+def align_notes(
+    player_midi,
+    target_midi,
+    player_durations=None,
+    target_beats=None,
+    timing_weight=0.0,
+    band=None,
+):
+    """
+    Edit-distance alignment of the player's notes against the target melody,
+    so one extra or missed note only costs that note instead of shifting
+    everything after it.
+
+    Costs: substitution 1, missed target note (deletion) 1, extra player note
+    (insertion) 1. With `player_durations` (seconds per detected note), an
+    extra note costs min(1, dur / median dur), so short blips between real
+    notes are cheap. With `target_beats` too and timing_weight > 0, a matched
+    note also pays timing_weight * (how far its relative length is off, capped
+    at one octave of ratio).
+
+    DP runs row by row in NumPy inside a Sakoe-Chiba band around the
+    (length-scaled) diagonal: the within-row deletion chain is resolved with a
+    running minimum, so each row is a handful of array ops.
+
+    Returns:
+    {
+      "accuracy": 0.92,   # 1 - cost / len(target), floored at 0
+      "cost": 2.0,
+      "matches": 23, "substitutions": 1, "insertions": 1, "deletions": 1
+    }
+    """
+    p = np.asarray(player_midi, dtype=np.int64)
+    t = np.asarray(target_midi, dtype=np.int64)
+    n, m = len(p), len(t)
+
+    if m == 0:
+        return {"accuracy": 0.0, "cost": float(n), "matches": 0,
+                "substitutions": 0, "insertions": n, "deletions": 0}
+
+    # per-player-note insertion cost
+    ins_cost = np.ones(n)
+    if player_durations is not None and n > 0:
+        d = np.asarray(player_durations, dtype=float)
+        ref = np.median(d)
+        if ref > 0:
+            ins_cost = np.minimum(1.0, d / ref)
+
+    # optional timing term for matched notes: relative lengths, tempo-free
+    rel_p = rel_t = None
+    if timing_weight > 0 and player_durations is not None and target_beats is not None and n > 0:
+        d = np.asarray(player_durations, dtype=float)
+        b = np.asarray(target_beats, dtype=float)
+        rel_p = np.maximum(d / max(np.median(d), 1e-9), 1e-9)
+        rel_t = np.maximum(b / max(np.median(b), 1e-9), 1e-9)
+
+    def sub_cost(i, js):
+        """cost of pairing player note i with target notes js (0-based)"""
+        c = (p[i] != t[js]).astype(float)
+        if rel_p is not None:
+            c += timing_weight * np.minimum(1.0, np.abs(np.log2(rel_p[i] / rel_t[js])))
+        return c
+
+    if band is None:
+        band = max(8, int(np.ceil(0.1 * max(n, m))))
+    band = max(band, int(np.ceil(m / max(n, 1))) + 1)  # consecutive rows must overlap
+    cols = np.arange(m + 1)
+
+    # D[i, j] = cost of aligning player[:i] with target[:j]. Only the band is
+    # stored: row i keeps columns lo[i]..lo[i]+width-1, everything else is inf.
+    width = 2 * band + 2
+    lo = np.zeros(n + 1, dtype=np.int64)
+    D = np.full((n + 1, width), np.inf)
+    D[0, : min(width, m + 1)] = cols[:width]  # all target notes missed so far
+
+    def band_row(i, a, b):
+        """columns a..b of row i (inf outside its band)"""
+        out = np.full(b - a + 1, np.inf)
+        s, e = max(a, lo[i]), min(b, lo[i] + width - 1)
+        if s <= e:
+            out[s - a:e - a + 1] = D[i, s - lo[i]:e - lo[i] + 1]
+        return out
+
+    def cell(i, j):
+        k = j - lo[i]
+        return D[i, k] if 0 <= k < width else np.inf
+
+    for i in range(1, n + 1):
+        center = i * m / n
+        a = max(0, int(np.floor(center - band)))
+        b = min(m, a + width - 1, int(np.ceil(center + band)))
+        lo[i] = a
+        js = cols[a:b + 1]
+
+        row = band_row(i - 1, a, b) + ins_cost[i - 1]  # extra player note
+        if b >= 1:
+            k0 = 1 if a == 0 else 0
+            diag = band_row(i - 1, max(a - 1, 0), b - 1)[-(len(js) - k0):] if len(js) > k0 else np.zeros(0)
+            row[k0:] = np.minimum(row[k0:], diag + sub_cost(i - 1, js[k0:] - 1))  # match / substitution
+        # missed target notes along the row: row[j] = min_k<=j (row[k] + (j - k))
+        D[i, : len(js)] = np.minimum.accumulate(row - js) + js
+
+    # traceback for the operation counts
+    matches = subs = ins = dels = 0
+    i, j = n, m
+    while i > 0 or j > 0:
+        here = cell(i, j)
+        if i > 0 and j > 0 and abs(here - (cell(i - 1, j - 1) + sub_cost(i - 1, j - 1))) < 1e-9:
+            if p[i - 1] == t[j - 1]:
+                matches += 1
+            else:
+                subs += 1
+            i, j = i - 1, j - 1
+        elif i > 0 and abs(here - (cell(i - 1, j) + ins_cost[i - 1])) < 1e-9:
+            ins += 1
+            i -= 1
+        else:
+            dels += 1
+            j -= 1
+
+    cost = float(cell(n, m))
+    return {
+        "accuracy": max(0.0, 1.0 - cost / m),
+        "cost": cost,
+        "matches": matches,
+        "substitutions": subs,
+        "insertions": ins,
+        "deletions": dels,
+    }
+
+
+def score_player_aligned(player_notes, target_notes, player_durations=None, target_beats=None, timing_weight=0.0):
+    """
+    Alignment-based accuracy (see align_notes), 0.0-1.0. Note names in, like score_player.
+    """
+    if len(player_notes) == 0:
+        return 0.0
+    return align_notes(
+        [note_name_to_midi(n) for n in player_notes],
+        [note_name_to_midi(n) for n in target_notes],
+        player_durations=player_durations,
+        target_beats=target_beats,
+        timing_weight=timing_weight,
+    )["accuracy"]
+
+
 ########################################
 # HIGH-LEVEL HELPER FOR ONE PLAYER
 ########################################
 
-def analyze_single_player(audio_path, song_key="happy_birthday"):
+# analyze_violin_notes' defaults: the whole violin range
+FULL_BAND = {"fmin_note": "C3", "fmax_note": "A6", "low_ok_for_register": 200.0}
+
+
+def song_pitch_band(song_key, margin_semitones=3):
     """
-    High-level API for the frontend.
+    Pitch search settings derived from the song's own note range.
 
-    1. Run pitch analysis on the player's audio.
-    2. Convert to note sequence.
-    3. Compare with the reference melody for `song_key`.
-    4. Return a dict of results that the frontend can display.
+    HAPPY_BIRTHDAY_NOTES only spans C4-B4, so searching C3-A6 wastes most of
+    pyin's state space. The band is [lowest - margin, highest + margin], and
+    the register-correction threshold sits at the bottom of that band
+    (anything lower is treated as a subharmonic).
+
+    Returns kwargs for analyze_violin_notes:
+    { "fmin_note": "A3", "fmax_note": "D5", "low_ok_for_register": 220.0 }
+    """
+    song = SONG_LIBRARY.get(song_key)
+    midi_lo = song.lowest - margin_semitones
+    midi_hi = song.highest + margin_semitones
+
+    return {
+        "fmin_note": midi_to_note_name(midi_lo),
+        "fmax_note": midi_to_note_name(midi_hi),
+        "low_ok_for_register": float(librosa.midi_to_hz(midi_lo)),
+    }
+
+
+def prepare_song(song_key, song_aware_band=True):
+    """
+    Song-specific setup, computed once and shared by every take of that song
+    (see analyze_batch). Small plain dict, so it pickles cheaply to workers.
 
-    Returns:
     {
-      "notes":    ["D4","D4","E4",...],
-      "accuracy": 0.82,          # fraction 0..1
-      "score":    823            # e.g. accuracy * 1000
+      "song_key":     "happy_birthday",
+      "target_notes": ["D4","D4","E4",...],
+      "target_midi":  [62, 62, 64, ...],
+      "target_beats": [0.75, 0.25, 1.0, ...],
+      "band":         { "fmin_note": ..., "fmax_note": ..., "low_ok_for_register": ... },
+      "analysis_sr":  11025,       # or None, see analysis_rate()
+      "song_digest":  "3f0a...",   # CompiledSong.digest, for result-cache keys
     }
+    Raises ValueError for unknown song keys (see SONG_LIBRARY).
     """
+    compiled = SONG_LIBRARY.get(song_key)
 
-    # 1. detect note segments from audio
-    segments = analyze_violin_notes(
-        audio_path,
-        fmin_note="C3",
-        fmax_note="A6",
-        frame_length=4096,
-        hop_length=512,
+    if song_aware_band:
+        band = song_pitch_band(song_key)
+    else:
+        band = dict(FULL_BAND)
+
+    return {
+        "song_key": song_key,
+        "target_notes": list(compiled.note_names),
+        "target_midi": compiled.midi.tolist(),
+        "target_beats": compiled.beats.tolist(),
+        "band": band,
+        "analysis_sr": analysis_rate(band["fmax_note"]),
+        "song_digest": compiled.digest,
+    }
+
+
+SCORERS = ("alignment", "position")
+
+
+def judge_prepared(audio_path, song, pitch_backend="pyin", sr=None, scorer="alignment"):
+    """
+    analyze_single_player with the song setup already done (see prepare_song).
+    """
+    if scorer not in SCORERS:
+        raise ValueError(f"Unknown scorer '{scorer}'. Available: {list(SCORERS)}")
+    band = song["band"]
+    y, sr = load_mono(audio_path, sr=sr)
+    y, sr, frame_length, hop_length = to_analysis_rate(y, sr, song.get("analysis_sr"))
+
+    # 1. detect note segments (and keep the pitch contour) from audio
+    segments, contour = analyze_violin_notes(
+        y,
+        fmin_note=band["fmin_note"],
+        fmax_note=band["fmax_note"],
+        frame_length=frame_length,
+        hop_length=hop_length,
+        voiced_prob_threshold=0.3,
+        min_segment_len_sec=0.05,
+        note_change_cents_tolerance=40,
+        low_ok_for_register=band["low_ok_for_register"],
+        pitch_backend=pitch_backend,
+        sr=sr,
+        as_arrays=True,
+        with_contour=True,
+    )
+
+    result = score_segments(segments, song, scorer)
+    result["contour"] = contour
+    return result
+
+
+def judge_blocks(chunks, song, sr, pitch_backend="pyin", scorer="alignment", block_sec=60.0):
+    """
+    judge_prepared for long recordings: `chunks` is an iterator of mono
+    arrays at `sr` (decoding.open_blocks, ideally at song["analysis_sr"]),
+    analysed block by block with bounded memory (analyze_violin_notes_blocks).
+    """
+    if scorer not in SCORERS:
+        raise ValueError(f"Unknown scorer '{scorer}'. Available: {list(SCORERS)}")
+    band = song["band"]
+    if song.get("analysis_sr"):
+        frame_length, hop_length = frames_for_rate(sr)
+    else:
+        frame_length, hop_length = REF_FRAME_LENGTH, REF_HOP_LENGTH
+
+    segments, contour = analyze_violin_notes_blocks(
+        chunks,
+        sr,
+        fmin_note=band["fmin_note"],
+        fmax_note=band["fmax_note"],
+        frame_length=frame_length,
+        hop_length=hop_length,
         voiced_prob_threshold=0.3,
         min_segment_len_sec=0.05,
         note_change_cents_tolerance=40,
-        low_ok_for_register=200.0,
+        low_ok_for_register=band["low_ok_for_register"],
+        pitch_backend=pitch_backend,
+        block_sec=block_sec,
+        as_arrays=True,
+        with_contour=True,
     )
+    result = score_segments(segments, song, scorer)
+    result["contour"] = contour
+    return result
 
+
+def score_segments(segments, song, scorer="alignment"):
+    """
+    Steps 2-4 of judge_prepared: segments (a Segments) -> {"notes", "accuracy", "score"}.
+    """
     # 2. flatten to note sequence like ["D4","D4","E4",...]
     player_notes = segments_to_note_sequence(segments)
 
-    # 3. get the official target notes (ground truth)
-    if song_key not in SONGS:
-        raise ValueError(f"Unknown song_key '{song_key}'. Available: {list(SONGS.keys())}")
-    target_notes = SONGS[song_key]
-
-    # 4. score (0.0-1.0)
-    accuracy_ratio = score_player(player_notes, target_notes)
+    # 3. score (0.0-1.0)
+    with stage("scoring"):
+        if scorer == "alignment":
+            if player_notes:
+                accuracy_ratio = align_notes(
+                    segments.midi.tolist(),
+                    song["target_midi"],
+                    player_durations=segments.dur_s,
+                )["accuracy"]
+            else:
+                accuracy_ratio = 0.0
+        else:
+            accuracy_ratio = score_player(player_notes, song["target_notes"])
 
-    # 5. turn that into a 'score' number for fun / leaderboards
+    # 4. turn that into a 'score' number for fun / leaderboards
     score_points = int(round(accuracy_ratio * 1000))
 
     return {
@@ -299,18 +1193,146 @@ def analyze_single_player(audio_path, song_key="happy_birthday"):
     }
 
 
+def analyze_single_player(
+    audio_path,
+    song_key="happy_birthday",
+    pitch_backend="pyin",
+    song_aware_band=True,
+    sr=None,
+    scorer="alignment",
+):
+    """
+    High-level API for the frontend.
 
-if __name__ == "__main__":
-    TEST_FILE = "happy_birthday_violin_test.wav"  # change this to any clip you want
-    TEST_FILE_WRONG = "happy_birthday_wrong_test.wav"
+    `audio_path` may also be a decoded mono float array, with `sr` set
+    (see decoding.decode_to_array), so no temp files are needed.
 
+    1. Run pitch analysis on the player's audio.
+    2. Convert to note sequence.
+    3. Compare with the reference melody for `song_key`.
+    4. Return a dict of results that the frontend can display.
+
+    Returns:
+    {
+      "notes":    ["D4","D4","E4",...],
+      "accuracy": 0.82,          # fraction 0..1
+      "score":    823,           # e.g. accuracy * 1000
+      "contour":  {"hop_s": 0.023, "cents": "<base64 int16>"}  # see resample_contour
+    }
+
+    pitch_backend: "pyin" (default) or "yin" for a much cheaper estimate,
+    see PITCH_BACKENDS and benchmarks/pitch_backends.py.
+    song_aware_band: search only around the song's notes (song_pitch_band)
+    instead of the full C3-A6 violin range.
+    scorer: "alignment" (default, align_notes: tolerant of extra/missed notes)
+    or "position" (the original index-by-index score_player).
+    """
+    song = prepare_song(song_key, song_aware_band=song_aware_band)
+    return judge_prepared(audio_path, song, pitch_backend=pitch_backend, sr=sr, scorer=scorer)
 
-    result = analyze_single_player(TEST_FILE, song_key="happy_birthday")
-    result2 = analyze_single_player(TEST_FILE_WRONG,song_key="happy_birthday")
-    print("Detected notes:", result["notes"])
-    print("Accuracy:", round(result["accuracy"] * 100, 1), "%")
-    print("Score:", result["score"])
 
-    print("Detected notes:", result2["notes"])
-    print("Accuracy:", round(result2["accuracy"] * 100, 1), "%")
-    print("Score:", result2["score"])
\ No newline at end of file
+########################################
+# SONG IDENTIFICATION
+########################################
+
+def identify_song(audio_path, pitch_backend="pyin", sr=None, top_k=5):
+    """
+    Guess which library song a recording is, without a song_key.
+
+    The take is analysed over the full violin range (the song, and so its
+    band, is unknown), then its interval n-grams are looked up in
+    SONG_LIBRARY.interval_index(), so any key / octave matches.
+
+    Returns:
+    {
+      "notes":      ["D4","E4","D4",...],
+      "song_key":   "happy_birthday",       # best match, or None
+      "candidates": [ {"song_key", "title", "score", "matched"}, ... ]
+    }
+    """
+    y, sr = load_mono(audio_path, sr=sr)
+    y, sr, frame_length, hop_length = to_analysis_rate(y, sr, analysis_rate(FULL_BAND["fmax_note"]))
+    segments = analyze_violin_notes(
+        y, frame_length=frame_length, hop_length=hop_length, pitch_backend=pitch_backend, sr=sr, as_arrays=True,
+    )
+    player_notes = segments_to_note_sequence(segments)
+
+    with stage("song_lookup"):
+        candidates = SONG_LIBRARY.interval_index().query(
+            segments.midi.tolist(),
+            top_k=top_k,
+        )
+    return {
+        "notes": player_notes,
+        "song_key": candidates[0]["song_key"] if candidates else None,
+        "candidates": candidates,
+    }
+
+
+########################################
+# BATCH JUDGING (multiplayer rounds, leaderboard recomputation)
+########################################
+
+def _judge_batch_item(audio, song, pitch_backend):
+    if isinstance(audio, tuple):
+        y, sr = audio
+        return judge_prepared(y, song, pitch_backend=pitch_backend, sr=sr)
+    return judge_prepared(audio, song, pitch_backend=pitch_backend)
+
+
+def analyze_batch(
+    recordings,
+    song_key="happy_birthday",
+    pitch_backend="pyin",
+    song_aware_band=True,
+    max_workers=None,
+    executor=None,
+):
+    """
+    Judge many takes of one song in parallel across cores.
+
+    recordings: {player_id: audio} or an iterable of (player_id, audio) pairs,
+    where audio is a file path or a (y, sr) tuple.
+
+    Yields (player_id, result) in COMPLETION order, so callers can stream
+    results as they finish. A take that fails yields {"error": "..."} instead
+    of stopping the batch. The song setup (prepare_song) is computed once.
+
+    Pass `executor` to reuse an existing pool; otherwise a ProcessPoolExecutor
+    with `max_workers` processes is created for this batch.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    song = prepare_song(song_key, song_aware_band=song_aware_band)
+    items = recordings.items() if isinstance(recordings, dict) else recordings
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(_judge_batch_item, audio, song, pitch_backend): player_id
+            for player_id, audio in items
+        }
+        for fut in as_completed(futures):
+            player_id = futures[fut]
+            try:
+                yield player_id, fut.result()
+            except Exception as e:
+                yield player_id, {"error": str(e)}
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    # demo on synthetic takes (no recordings in the repo); full suite: python -m benchmarks.suite
+    from benchmarks.synth import render_song
+
+    for label, wrong_note_rate in (("clean take", 0.0), ("with wrong notes", 0.2)):
+        y, sr, _ = render_song("happy_birthday", wrong_note_rate=wrong_note_rate)
+        result = analyze_single_player(y, song_key="happy_birthday", sr=sr)
+        print(f"[{label}]")
+        print("Detected notes:", result["notes"])
+        print("Accuracy:", round(result["accuracy"] * 100, 1), "%")
+        print("Score:", result["score"])
@@ -0,0 +1,239 @@
+"""
+Shared service layer behind both FastAPI apps (app.py and server.py).
+
+One AnalysisService owns the process pool (workerPool.AnalysisPool, decode +
+pitch tracking off the event loop), the result cache (resultCache) and the
+metrics middleware, and serves the game endpoints from one APIRouter:
+
+  POST /analyzeSinglePlayer   POST /identifySong   POST /analyzeBatch
+  WS   /ws/judge              GET  /cacheStats     GET  /ready   GET /metrics
+
+The POST endpoints take an optional `encoding` form field: json (default),
+columnar or msgpack (see responseFormat). The judge endpoints also take
+`contour_hz`: > 0 adds the player's pitch contour at about that many
+points per second (gameJudger.resample_contour), from the same analysis
+(and cache entry) as the score.
+
+Usage:
+
+    service = AnalysisService(imports_sec=IMPORTS_SEC)
+    app = FastAPI(lifespan=service.lifespan)
+    service.mount(app)
+
+App-specific endpoints (e.g. the transcriber in app.py) reuse the same pool
+and cache through service.cached_job(), and can run as background jobs
+through service.attach_jobs(jobQueue.JobQueue(...)).
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from gameJudger import ANALYSIS_SR, CONTOUR_MAX_HZ, SONG_LIBRARY, prepare_song, result_view
+from liveJudge import serve_live_judge
+from metrics import REGISTRY, pool_samples, track_requests
+from responseFormat import STREAM_MEDIA_TYPES, check_encoding, render
+from resultCache import ResultCache
+from workerPool import ANALYSIS_BLOCK_SEC, AnalysisPool, dispatch, identify_upload, judge_upload, stream_batch
+
+log = logging.getLogger("gameService")
+
+
+def check_contour_hz(contour_hz):
+    if not 0 <= contour_hz <= CONTOUR_MAX_HZ:
+        raise HTTPException(status_code=400, detail=f"contour_hz must be between 0 (off) and {CONTOUR_MAX_HZ:g}")
+
+
+class AnalysisService:
+    def __init__(self, warm_ups=(), imports_sec=None, pool=None, cache=None):
+        # CPU-heavy work (pyin, beat tracking, music21) runs here, off the event loop
+        self.pool = pool or AnalysisPool(warm_ups=warm_ups)
+        # repeated uploads of the same bytes + params skip analysis entirely
+        self.cache = cache or ResultCache.from_env()
+        self.imports_sec = imports_sec
+        self.jobs = None
+        self.router = self._build_router()
+
+    def attach_jobs(self, jobs):
+        """
+        Serve a jobQueue.JobQueue's endpoints and start/stop it with the app.
+        Call before mount().
+        """
+        self.jobs = jobs
+        self.router.include_router(jobs.router)
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        # spawn + warm up workers in the background; /ready says 503 until done
+        warm = asyncio.create_task(self.pool.start_in_background())
+        if self.jobs is not None:
+            await self.jobs.start()  # resumed jobs wait for the pool to be ready
+        yield
+        if self.jobs is not None:
+            await self.jobs.stop()
+        self.pool.shutdown()
+        if warm.done() and not warm.cancelled():
+            warm.exception()  # already reported in /ready
+
+    def mount(self, app):
+        app.middleware("http")(track_requests)
+        app.include_router(self.router)
+
+    ########################################
+    # JOBS
+    ########################################
+
+    async def cached_job(self, kind, raw_bytes, fn, *args, **params):
+        """
+        fn(raw_bytes, *args) in the pool, answered from the cache when the
+        same bytes + kind + params were seen before. Returns (value, cached).
+        """
+        cache_key = self.cache.make_key(raw_bytes, kind, **params)
+        value = await self.cache.get_async(cache_key)
+        if value is not None:
+            return value, True
+        value = await dispatch(self.pool, fn, raw_bytes, *args)
+        await self.cache.put_async(cache_key, value)
+        return value, False
+
+    async def judge(self, raw_bytes, song_key):
+        """
+        Decode + score one take. Returns (result dict, clip seconds, cached).
+        """
+        # the song's digest keeps results of an edited melody apart; unknown
+        # keys are answered with 400 by the worker (and never cached)
+        digest = SONG_LIBRARY.get(song_key).digest if song_key in SONG_LIBRARY else None
+        (result, dur_sec), cached = await self.cached_job(
+            "analyzeSinglePlayer", raw_bytes, judge_upload, song_key,
+            song_key=song_key, song_digest=digest, analysis_sr=ANALYSIS_SR, block_sec=ANALYSIS_BLOCK_SEC,
+        )
+        return result, dur_sec, cached
+
+    async def identify(self, raw_bytes, top_k):
+        (result, _), _ = await self.cached_job(
+            "identifySong", raw_bytes, identify_upload, top_k,
+            top_k=top_k, library=SONG_LIBRARY.digest(), analysis_sr=ANALYSIS_SR,
+        )
+        return result
+
+    def ready_body(self):
+        return {
+            "ready": self.pool.ready,
+            "startup": {"imports_sec": self.imports_sec, "pool": self.pool.startup},
+        }
+
+    ########################################
+    # ENDPOINTS
+    ########################################
+
+    def _build_router(self):
+        router = APIRouter()
+        service = self
+
+        @router.post("/analyzeSinglePlayer")
+        async def analyze_single_player_endpoint(
+            song_key: str = Form(...),
+            player_audio: UploadFile = File(...),
+            encoding: str = Form("json"),
+            contour_hz: float = Form(0),
+        ):
+            # decode the upload (webm/opus) in memory and score it, in a pool worker
+            check_encoding(encoding)
+            check_contour_hz(contour_hz)
+            raw_bytes = await player_audio.read()
+            result, dur_sec, cached = await service.judge(raw_bytes, song_key)
+
+            # debug details only at LOG_LEVEL=DEBUG
+            log.debug(
+                "analyzeSinglePlayer song_key=%s filename=%s bytes=%d duration=%.3fs cached=%s notes=%s accuracy=%s score=%s",
+                song_key, player_audio.filename, len(raw_bytes), dur_sec, cached,
+                result.get("notes"), result.get("accuracy"), result.get("score"),
+            )
+            view = result_view(result, contour_hz)
+            return render({
+                key: view[key] for key in ("notes", "accuracy", "score", "contour") if key in view
+            }, encoding)
+
+        @router.post("/identifySong")
+        async def identify_song_endpoint(
+            player_audio: UploadFile = File(...),
+            top_k: int = Form(5),
+            encoding: str = Form("json"),
+        ):
+            """
+            "Which song is this?" - no song_key needed. Returns the detected notes,
+            the best-matching song_key (or null) and up to top_k ranked candidates.
+            """
+            check_encoding(encoding)
+            if not 1 <= top_k <= 50:
+                raise HTTPException(status_code=400, detail="top_k must be between 1 and 50")
+            return render(await service.identify(await player_audio.read(), top_k), encoding)
+
+        @router.post("/analyzeBatch")
+        async def analyze_batch_endpoint(
+            song_key: str = Form(...),
+            player_audio: list[UploadFile] = File(...),
+            player_ids: list[str] | None = Form(default=None),
+            encoding: str = Form("json"),
+            contour_hz: float = Form(0),
+        ):
+            """
+            Judge several takes of one song (multiplayer round / re-scoring).
+            Streams NDJSON (or msgpack objects), one per player, in the order
+            they finish. player_ids defaults to the uploaded filenames.
+            """
+            check_encoding(encoding)
+            check_contour_hz(contour_hz)
+            try:
+                song = prepare_song(song_key)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if player_ids and len(player_ids) != len(player_audio):
+                raise HTTPException(status_code=400, detail="player_ids must match player_audio one-to-one")
+
+            ids = player_ids or [f.filename or str(i) for i, f in enumerate(player_audio)]
+            uploads = [(pid, await f.read()) for pid, f in zip(ids, player_audio)]
+
+            return StreamingResponse(
+                stream_batch(service.pool, uploads, song, cache=service.cache, encoding=encoding, contour_hz=contour_hz),
+                media_type=STREAM_MEDIA_TYPES[encoding],
+            )
+
+        @router.websocket("/ws/judge")
+        async def live_judge_ws(
+            websocket: WebSocket,
+            song_key: str = "happy_birthday",
+            format: str = "webm",
+            sr: int = 22050,
+            contour_hz: float = 0,
+        ):
+            """
+            Live judging while the player plays; see liveJudge.serve_live_judge.
+            """
+            contour_hz = min(max(contour_hz, 0.0), CONTOUR_MAX_HZ)
+            await serve_live_judge(websocket, service.pool, song_key, fmt=format, sr=sr, contour_hz=contour_hz)
+
+        @router.get("/cacheStats")
+        def cache_stats():
+            return service.cache.stats()
+
+        @router.get("/ready")
+        def ready():
+            """
+            Readiness probe: 503 until every analysis worker has warmed up.
+            Reports startup timing (module imports, pool start, per-worker warm-up stages).
+            """
+            return JSONResponse(status_code=200 if service.pool.ready else 503, content=service.ready_body())
+
+        @router.get("/metrics")
+        def metrics():
+            """
+            Prometheus text format: request counters/latency, per-stage analysis
+            histograms, audio seconds processed, pool queue depth, cache hits.
+            """
+            body = REGISTRY.render(pool_samples(service.pool, service.cache))
+            return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+        return router
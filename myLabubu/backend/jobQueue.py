@@ -0,0 +1,462 @@
+"""
+Background jobs for long analysis requests: submit now, fetch the result later.
+
+/api/transcribe-and-transpose holds the HTTP connection open through the
+whole pipeline, which runs into proxy timeouts on long clips. As a job:
+
+  POST /api/transcribe-jobs          202 {"job_id", "status_url", "events_url", "result_url"}
+  GET  /api/jobs/{job_id}            status + the pipeline stage it is in (poll this)
+  GET  /api/jobs/{job_id}/events     the same as server-sent events, until it finishes
+  GET  /api/jobs/{job_id}/result     the result (202 while not finished), `encoding` as in responseFormat
+
+Jobs run on the service's AnalysisPool and wait (instead of answering 503)
+while it is busy, keeping at most one job per worker in flight so direct
+requests still get through. Every job is a row in a SQLite table, upload
+included until it has run, so jobs queued or running when the server stops
+run again after a restart. Workers write the stage they enter (metrics.stage)
+straight into the row. Finished jobs are deleted JOB_TTL_SEC later.
+
+Several server processes on one host (uvicorn --workers) can share JOB_DB:
+every unfinished job has an owner ("host:pid") and only its owner runs it.
+A process takes over (with an atomic compare-and-swap on the owner) only
+jobs whose owner has exited or released them, at startup and then every
+ORPHAN_CHECK_SEC.
+
+Config (env vars):
+  JOB_DB            SQLite file (default: <tempdir>/analysis_jobs.sqlite3)
+  JOB_TTL_SEC       how long finished jobs and their results are kept (default 3600)
+  JOB_MAX_PENDING   queued + running jobs before submissions get 503 (default 64)
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from metrics import watch_stages
+from responseFormat import check_encoding, render
+from workerPool import JobError, PoolSaturated
+
+log = logging.getLogger("jobQueue")
+
+# seconds between status reads for /events
+EVENTS_POLL_SEC = 0.5
+# seconds between looks for jobs left behind by exited processes
+ORPHAN_CHECK_SEC = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    status      TEXT NOT NULL,              -- queued | running | done | error
+    stage       TEXT,
+    stages      TEXT NOT NULL DEFAULT '[]', -- JSON, stages entered so far
+    created     REAL NOT NULL,
+    updated     REAL NOT NULL,
+    expires     REAL,                       -- set once finished
+    upload      BLOB,                       -- dropped once the job has run
+    args        TEXT NOT NULL,              -- JSON
+    cache_key   TEXT,
+    result      TEXT,                       -- JSON
+    error       TEXT,
+    status_code INTEGER,
+    owner       TEXT                        -- "host:pid" running it, NULL = up for grabs
+);
+CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires);
+"""
+
+_STATUS_COLUMNS = "id, kind, status, stage, stages, created, updated, expires, error, status_code"
+FINISHED = ("done", "error")
+
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")  # workers write progress while the server reads
+    return db
+
+
+def owner_alive(owner):
+    """
+    Whether the process behind an owner tag ("host:pid") is still running.
+    Owners on other hosts can't be checked and count as alive.
+    """
+    if owner is None:
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+########################################
+# WORKER SIDE
+########################################
+
+def run_job(db_path, job_id, fn, *args):
+    """
+    Pool side of a job: fn(*args), writing every stage it enters into the
+    job's row so /api/jobs/{id} can show progress while it runs.
+    """
+    db = _connect(db_path)
+    entered = []
+
+    def on_stage(name):
+        if entered and entered[-1] == name:
+            return
+        entered.append(name)
+        try:
+            db.execute(
+                "UPDATE jobs SET stage = ?, stages = ?, updated = ? WHERE id = ?",
+                (name, json.dumps(entered), time.time(), job_id),
+            )
+        except sqlite3.Error:
+            pass  # progress is best effort; the result is what counts
+
+    try:
+        with watch_stages(on_stage):
+            return fn(*args)
+    finally:
+        db.close()
+
+
+########################################
+# SERVER SIDE
+########################################
+
+class JobStore:
+    def __init__(self, path, owner=None):
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._conn = None  # opened on first use: pool workers import the app module too
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get("JOB_DB") or os.path.join(tempfile.gettempdir(), "analysis_jobs.sqlite3"))
+
+    @property
+    def _db(self):
+        if self._conn is None:
+            self._conn = _connect(self.path)
+            self._conn.executescript(_SCHEMA)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:  # table from before owners
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _changed(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).rowcount
+
+    def create(self, kind, upload, args, cache_key=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, created, updated, upload, args, cache_key, owner)"
+            " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, now, now, upload, json.dumps(args), cache_key, self.owner),
+        )
+        return job_id
+
+    def create_done(self, kind, args, cache_key, result, ttl_sec):
+        """
+        A job answered without running (result cache hit): stored finished,
+        without its upload.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, created, updated, expires, args, cache_key, result, owner)"
+            " VALUES (?, ?, 'done', ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, now, now, now + ttl_sec, json.dumps(args), cache_key, json.dumps(result), self.owner),
+        )
+        return job_id
+
+    def status(self, job_id):
+        rows = self._execute(f"SELECT {_STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(zip(_STATUS_COLUMNS.split(", "), rows[0]))
+        job["job_id"] = job.pop("id")
+        job["stages"] = json.loads(job["stages"])
+        for key in ("error", "status_code", "expires"):
+            if job[key] is None:
+                del job[key]
+        return job
+
+    def input(self, job_id):
+        """
+        (kind, upload, args, cache_key) of a job that has not run yet.
+        """
+        rows = self._execute("SELECT kind, upload, args, cache_key FROM jobs WHERE id = ?", (job_id,))
+        kind, upload, args, cache_key = rows[0]
+        return kind, upload, json.loads(args), cache_key
+
+    def result(self, job_id):
+        rows = self._execute("SELECT result FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0][0]) if rows and rows[0][0] is not None else None
+
+    def claim(self, job_id):
+        """
+        queued -> running for a job this process owns. False if it is no
+        longer ours (another process took it over) or not queued any more.
+        """
+        return self._changed(
+            "UPDATE jobs SET status = 'running', updated = ? WHERE id = ? AND owner = ? AND status = 'queued'",
+            (time.time(), job_id, self.owner),
+        ) == 1
+
+    def finish(self, job_id, ttl_sec, result=None, error=None, status_code=None):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = ?, stage = NULL, updated = ?, expires = ?, upload = NULL,"
+            " result = ?, error = ?, status_code = ? WHERE id = ?",
+            (
+                "error" if error is not None else "done", now, now + ttl_sec,
+                None if result is None else json.dumps(result), error, status_code, job_id,
+            ),
+        )
+
+    def adopt_orphans(self):
+        """
+        Take over unfinished jobs whose owner has exited or released them,
+        requeued. Each one is swapped to this owner only if its owner is
+        still the one we saw dead, so two processes never adopt the same job.
+        Returns the adopted job ids, oldest first.
+        """
+        rows = self._execute(
+            "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running') AND owner IS NOT ? ORDER BY created",
+            (self.owner,),
+        )
+        adopted = []
+        for job_id, owner in rows:
+            if owner_alive(owner):
+                continue
+            if self._changed(
+                "UPDATE jobs SET owner = ?, status = 'queued', stage = NULL, stages = '[]', updated = ?"
+                " WHERE id = ? AND owner IS ? AND status IN ('queued', 'running')",
+                (self.owner, time.time(), job_id, owner),
+            ):
+                adopted.append(job_id)
+        return adopted
+
+    def release(self):
+        """
+        Requeue this process's unfinished jobs with no owner, for whichever
+        process looks for orphans next (or this one after a restart).
+        """
+        self._execute(
+            "UPDATE jobs SET owner = NULL, status = 'queued', stage = NULL, stages = '[]'"
+            " WHERE owner = ? AND status IN ('queued', 'running')",
+            (self.owner,),
+        )
+
+    def purge_expired(self, now=None):
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE expires < ?", (now or time.time(),)).rowcount
+
+
+class JobQueue:
+    def __init__(self, pool, cache=None, store=None, ttl_sec=None, max_pending=None):
+        self.pool = pool
+        self.cache = cache
+        self.store = store or JobStore.from_env()
+        self.ttl_sec = float(os.environ.get("JOB_TTL_SEC", 3600)) if ttl_sec is None else ttl_sec
+        self.max_pending = int(os.environ.get("JOB_MAX_PENDING", 64)) if max_pending is None else max_pending
+        self.kinds = {}     # kind -> (fn, tables)
+        self._tasks = {}    # job_id -> asyncio.Task
+        # every store call from the event loop runs here: an upload insert
+        # holds the store's lock for its whole size
+        self._db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-db")
+        self._slots = None
+        self._cleanup = None
+        self.router = self._build_router()
+
+    def register(self, kind, fn, tables=()):
+        """
+        Jobs of `kind` run fn(upload, *args) in the pool. `tables`: result
+        fields kept column-wise (see responseFormat.render).
+        """
+        self.kinds[kind] = (fn, tuple(tables))
+
+    async def start(self):
+        """
+        Purge expired jobs, adopt the ones exited processes left unfinished
+        and start the cleanup loop (TTL purge + orphan adoption).
+        """
+        self._slots = asyncio.Semaphore(max(self.pool.max_workers, 1))
+        await self._db(self.store.purge_expired)
+        await self._adopt()
+        self._cleanup = asyncio.create_task(self._purge_loop())
+
+    async def stop(self):
+        """
+        Stop this process's jobs and release them; they stay in the table
+        and run again in the next process that starts or looks for orphans.
+        """
+        tasks = list(self._tasks.values())
+        if self._cleanup is not None:
+            tasks.append(self._cleanup)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._db(self.store.release)
+
+    async def submit(self, kind, upload, args, cache_key=None):
+        """
+        Queue fn(upload, *args) for `kind`; answered from the result cache
+        right away (without storing the upload) when `cache_key` is already
+        in it. Returns the job status.
+        """
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        if len(self._tasks) >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many jobs waiting, retry shortly.",
+                headers={"Retry-After": "10"},
+            )
+        cached = await self.cache.get_async(cache_key) if self.cache is not None and cache_key else None
+        if cached is not None:
+            job_id = await self._db(self.store.create_done, kind, args, cache_key, cached, self.ttl_sec)
+        else:
+            job_id = await self._db(self.store.create, kind, upload, args, cache_key)
+            self._spawn(job_id)
+        return await self._db(self.store.status, job_id)
+
+    async def _db(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._db_thread, functools.partial(fn, *args, **kwargs),
+        )
+
+    def _spawn(self, job_id):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _adopt(self):
+        for job_id in await self._db(self.store.adopt_orphans):
+            if job_id not in self._tasks:
+                self._spawn(job_id)
+
+    async def _run(self, job_id):
+        async with self._slots:
+            if not await self._db(self.store.claim, job_id):
+                return  # taken over by another process meanwhile
+            kind, upload, args, cache_key = await self._db(self.store.input, job_id)
+            fn, _ = self.kinds[kind]
+            while True:
+                try:
+                    result = await self.pool.run(
+                        run_job, self.store.path, job_id, fn, upload, *args, name=fn.__name__,
+                    )
+                    break
+                except PoolSaturated:  # also PoolWarming: a job waits instead of failing
+                    await asyncio.sleep(0.5)
+                except JobError as e:
+                    await self._db(self.store.finish, job_id, self.ttl_sec, error=e.detail, status_code=e.status_code)
+                    return
+                except Exception as e:
+                    log.exception("job %s (%s) failed", job_id, kind)
+                    await self._db(
+                        self.store.finish, job_id, self.ttl_sec, error=f"{type(e).__name__}: {e}", status_code=500,
+                    )
+                    return
+        if self.cache is not None and cache_key:
+            await self.cache.put_async(cache_key, result)
+        await self._db(self.store.finish, job_id, self.ttl_sec, result=result)
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(min(ORPHAN_CHECK_SEC, max(self.ttl_sec, 1.0)))
+            removed = await self._db(self.store.purge_expired)
+            if removed:
+                log.debug("purged %d expired jobs", removed)
+            await self._adopt()
+
+    def links(self, job):
+        base = f"/api/jobs/{job['job_id']}"
+        return {**job, "status_url": base, "events_url": f"{base}/events", "result_url": f"{base}/result"}
+
+    ########################################
+    # ENDPOINTS
+    ########################################
+
+    def _build_router(self):
+        router = APIRouter()
+        queue = self
+
+        def status_or_404(job_id):
+            job = queue.store.status(job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail="Unknown or expired job")
+            return job
+
+        @router.get("/api/jobs/{job_id}")
+        def job_status(job_id: str):
+            return queue.links(status_or_404(job_id))
+
+        @router.get("/api/jobs/{job_id}/events")
+        async def job_events(job_id: str):
+            """
+            Server-sent events: a "progress" event whenever the status or
+            stage changes, then one "done" or "error" event.
+            """
+            if await queue._db(queue.store.status, job_id) is None:
+                raise HTTPException(status_code=404, detail="Unknown or expired job")
+
+            async def events():
+                last = None
+                while True:
+                    job = await queue._db(queue.store.status, job_id)
+                    if job is None:
+                        yield f"event: error\ndata: {json.dumps({'detail': 'Unknown or expired job'})}\n\n"
+                        return
+                    job.pop("updated")
+                    body = json.dumps(job)
+                    if body != last:
+                        event = job["status"] if job["status"] in FINISHED else "progress"
+                        yield f"event: {event}\ndata: {body}\n\n"
+                        last = body
+                    if job["status"] in FINISHED:
+                        return
+                    await asyncio.sleep(EVENTS_POLL_SEC)
+
+            return StreamingResponse(
+                events(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        @router.get("/api/jobs/{job_id}/result")
+        def job_result(job_id: str, encoding: str = "json"):
+            check_encoding(encoding)
+            job = status_or_404(job_id)
+            if job["status"] == "error":
+                raise HTTPException(status_code=job.get("status_code") or 500, detail=job.get("error"))
+            if job["status"] != "done":
+                return JSONResponse(status_code=202, content=queue.links(job))
+            _, tables = queue.kinds.get(job["kind"], (None, ()))
+            return render(queue.store.result(job_id), encoding, tables=tables)
+
+        return router
@@ -0,0 +1,286 @@
+"""
+Real-time judging while the player is still playing.
+
+The client streams audio over a WebSocket; every `update_sec` of new audio
+the tail of the take is re-analysed (same pitch tracking + segment merging
+as analyze_violin_notes) and notes that can no longer change are pushed out
+together with a running score.
+
+Notes near the live edge are held back (`guard_sec`) because the segment may
+still be growing, and every window starts `context_sec` before the last
+committed note so pyin has the same context it would have offline. Windows
+are capped at `max_window_sec`, so a long stretch without a committed note
+(or before the first one) doesn't resend the whole buffer every update.
+
+When the take ends, the final result comes from workerPool.judge_samples()
+over the whole buffer: the same path (and block mode) as judge_upload, i.e.
+exactly what /analyzeSinglePlayer returns for the same samples. Live notes
+are a preview; the final message is authoritative.
+"""
+import asyncio
+import logging
+import os
+
+import numpy as np
+
+from decoding import DecodeError, StreamingDecoder
+from gameJudger import (
+    DECODE_SR, frames_to_segment_arrays, prepare_song, result_view, score_player_aligned,
+    to_analysis_rate, track_pitch,
+)
+from metrics import count_audio, stage
+from responseFormat import encode
+from workerPool import JobError, PoolSaturated, judge_samples
+
+log = logging.getLogger("liveJudge")
+
+# longest take we keep in memory per connection
+LIVE_MAX_SECONDS = float(os.environ.get("LIVE_MAX_SECONDS", 600))
+
+
+########################################
+# POOL JOBS (run in AnalysisPool workers)
+########################################
+
+def window_segments(y, sr, song, offset_s):
+    """
+    Segments (gameJudger.Segments) for one analysis window, with times
+    shifted by `offset_s` so they are relative to the start of the take.
+    Same settings as judge_prepared.
+    """
+    band = song["band"]
+    y, sr, frame_length, hop_length = to_analysis_rate(y, sr, song.get("analysis_sr"))
+    times, f0_smooth = track_pitch(
+        y,
+        sr,
+        fmin_note=band["fmin_note"],
+        fmax_note=band["fmax_note"],
+        frame_length=frame_length,
+        hop_length=hop_length,
+        voiced_prob_threshold=0.3,
+    )
+    with stage("segmentation"):
+        return frames_to_segment_arrays(
+            times + offset_s,
+            f0_smooth,
+            low_ok_for_register=band["low_ok_for_register"],
+            note_change_cents_tolerance=40,
+            min_segment_len_sec=0.05,
+        )
+
+
+def judge_array(y, sr, song):
+    count_audio(len(y) / sr)  # windows overlap; the take is counted once, here
+    return judge_samples(y, sr, song)
+
+
+########################################
+# PER-CONNECTION STATE
+########################################
+
+class LiveJudge:
+    def __init__(self, song, sr=22050, update_sec=0.5, context_sec=2.0, guard_sec=0.4, max_window_sec=10.0):
+        self.song = song
+        self.sr = sr
+        self.update_sec = update_sec
+        self.context_sec = context_sec
+        self.guard_sec = guard_sec
+        self.max_window_sec = max_window_sec
+
+        self._chunks = []
+        self.n_samples = 0
+        self._last_update_at = 0
+        self.committed_until = -1.0  # end of the last committed note (s)
+        self.window_floor = -1.0     # notes must start after this to be committed (s)
+        self.notes = []
+
+    @property
+    def duration_s(self):
+        return self.n_samples / self.sr
+
+    def append(self, samples):
+        """
+        Add decoded samples. Returns True when a window update is due.
+        """
+        if samples.size == 0:
+            return False
+        if self.duration_s + samples.size / self.sr > LIVE_MAX_SECONDS:
+            raise ValueError(f"Take longer than {LIVE_MAX_SECONDS:.0f}s")
+        self._chunks.append(np.asarray(samples, dtype=np.float32))
+        self.n_samples += samples.size
+        return (self.n_samples - self._last_update_at) >= self.update_sec * self.sr
+
+    def audio(self):
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0] if self._chunks else np.zeros(0, dtype=np.float32)
+
+    def next_window(self):
+        """
+        (samples, offset_s) to analyse now: from context_sec before the last
+        committed note, or only the last max_window_sec of the take. A capped
+        window's first context_sec is context only: a note starting there
+        may be cut off, so commit() skips it.
+        """
+        self._last_update_at = self.n_samples
+        start = max(0, int((self.committed_until - self.context_sec) * self.sr))
+        capped = self.n_samples - int(self.max_window_sec * self.sr)
+        self.window_floor = -1.0
+        if capped > start:
+            start = capped
+            self.window_floor = start / self.sr + self.context_sec
+        return self.audio()[start:], start / self.sr
+
+    def commit(self, segments):
+        """
+        Keep segments that start after the last committed note and end before
+        the guard zone at the live edge. Returns the newly committed ones.
+        """
+        live_edge = self.duration_s - self.guard_sec
+        after = max(self.committed_until, self.window_floor)
+        new = segments[(segments.start_s > after) & (segments.end_s < live_edge)]
+        new = [
+            {"note": n, "start_s": a, "end_s": b}
+            for n, a, b in zip(new.note_names(), new.start_s.tolist(), new.end_s.tolist())
+        ]
+        if new:
+            self.notes.extend(new)
+            self.committed_until = new[-1]["end_s"]
+        return new
+
+    def progress(self):
+        # scored against the part of the melody the player should have reached
+        notes = [n["note"] for n in self.notes]
+        accuracy = score_player_aligned(
+            notes,
+            self.song["target_notes"][: max(len(notes), 1)],
+            player_durations=[n["end_s"] - n["start_s"] for n in self.notes],
+        )
+        return {
+            "type": "progress",
+            "elapsed_s": self.duration_s,
+            "notes_so_far": len(notes),
+            "running_accuracy": accuracy,
+            "running_score": int(round(accuracy * 1000)),
+        }
+
+
+########################################
+# WEBSOCKET SESSION
+########################################
+
+LIVE_FORMATS = ("webm", "f32le", "s16le")
+
+
+def _pcm_to_float(data, fmt):
+    if fmt == "f32le":
+        return np.frombuffer(data[: len(data) // 4 * 4], dtype="<f4")
+    return np.frombuffer(data[: len(data) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+
+
+async def serve_live_judge(websocket, pool, song_key, fmt="webm", sr=22050, contour_hz=0):
+    """
+    One live judging session.
+
+    Client -> server: binary audio chunks, then the text message "end".
+      fmt="webm":  MediaRecorder webm/opus chunks (decoded by a per-connection ffmpeg)
+      fmt="f32le" / "s16le": raw mono PCM at `sr`
+    Server -> client (JSON):
+      {"type": "note", "note": "D4", "start_s": 0.0, "end_s": 0.42}
+      {"type": "progress", "elapsed_s": ..., "notes_so_far": ..., "running_accuracy": ..., "running_score": ...}
+      {"type": "final", "notes": [...], "accuracy": ..., "score": ...}
+      {"type": "error", "detail": "..."}
+    contour_hz > 0 adds the whole take's pitch contour to "final"
+    (gameJudger.resample_contour; "cents" base64-encoded).
+    """
+    await websocket.accept()
+
+    try:
+        song = prepare_song(song_key)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1008)
+        return
+    if fmt not in LIVE_FORMATS:
+        await websocket.send_json({"type": "error", "detail": f"Unknown format '{fmt}'. Available: {list(LIVE_FORMATS)}"})
+        await websocket.close(code=1008)
+        return
+    if fmt != "webm" and sr <= 0:
+        await websocket.send_json({"type": "error", "detail": f"Invalid sample rate {sr} for raw PCM."})
+        await websocket.close(code=1008)
+        return
+
+    decoder = None
+    if fmt == "webm":
+        sr = song.get("analysis_sr") or DECODE_SR  # decoded straight to the analysis rate
+        decoder = StreamingDecoder(target_sr=sr)
+        await decoder.start()
+
+    judge = LiveJudge(song, sr=sr)
+    update_task = None
+
+    async def update():
+        # live notes are only a preview: a failed update is skipped (the next
+        # one covers its audio), only the final result can fail the session
+        y, offset_s = judge.next_window()
+        try:
+            segments = await pool.run(window_segments, y, judge.sr, song, offset_s)
+            for n in judge.commit(segments):
+                await websocket.send_json({"type": "note", **n})
+            await websocket.send_json(judge.progress())
+        except PoolSaturated:
+            pass
+        except Exception as e:
+            log.warning("live preview update failed: %s: %s", type(e).__name__, e)
+
+    try:
+        while True:
+            msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect":
+                return
+            if msg.get("text") is not None:
+                if msg["text"].strip().lower() == "end":
+                    break
+                continue
+
+            data = msg.get("bytes") or b""
+            if decoder is not None:
+                await decoder.feed(data)
+                samples = decoder.read_available()
+            else:
+                samples = _pcm_to_float(data, fmt)
+
+            if judge.append(samples) and (update_task is None or update_task.done()):
+                if update_task is not None and not update_task.cancelled() and update_task.exception():
+                    log.warning("live preview update failed: %r", update_task.exception())
+                update_task = asyncio.ensure_future(update())
+
+        if decoder is not None:
+            judge.append(await decoder.close())
+            decoder = None
+        if update_task is not None:
+            await update_task
+
+        # authoritative result over the whole take (same as /analyzeSinglePlayer)
+        for _ in range(20):
+            try:
+                result = await pool.run(judge_array, judge.audio(), judge.sr, song)
+                break
+            except PoolSaturated:
+                await asyncio.sleep(0.5)
+        else:
+            raise JobError(503, "Analysis workers are busy, retry shortly.")
+
+        final = encode({"type": "final", **result_view(result, contour_hz)})
+        await websocket.send_text(final.decode("utf-8"))
+        await websocket.close()
+
+    except (DecodeError, JobError, ValueError) as e:
+        detail = e.detail if isinstance(e, JobError) else str(e)
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=1011)
+    finally:
+        if update_task is not None and not update_task.done():
+            update_task.cancel()
+        if decoder is not None:
+            decoder.kill()
@@ -0,0 +1,256 @@
+"""
+Per-stage timers and Prometheus-style metrics.
+
+Worker side: analysis code wraps its expensive steps in `with stage("pyin"):`.
+Inside a pool job (see AnalysisPool.run / run_timed) the timings are collected
+and shipped back with the result; outside a job stage() only costs two
+perf_counter() calls. watch_stages() additionally reports each stage as it
+starts (jobQueue progress).
+
+Server side: REGISTRY keeps counters and histograms in plain dicts and
+renders them in the Prometheus text format for GET /metrics (no
+prometheus_client dependency).
+
+Stages: decode, transcode, load, pyin, yin, smoothing, segmentation, onsets,
+scoring, song_lookup, music21_build, key_analysis, export.
+
+Config (env vars):
+  LOG_LEVEL   level for the backend loggers (default INFO; DEBUG prints
+              per-request details, WARNING or OFF silences them)
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds; analysis stages range from sub-ms scoring to multi-second pyin
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+REQUEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def configure_logging():
+    """
+    Root logging setup for the FastAPI apps, driven by LOG_LEVEL.
+    """
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    if level == "OFF":
+        logging.disable(logging.CRITICAL)
+        return
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+########################################
+# WORKER SIDE
+########################################
+
+# {"stages": [(name, sec), ...], "audio_sec": float} while a job runs, else None
+_JOB = contextvars.ContextVar("analysis_job", default=None)
+
+# callback(name) run whenever a stage starts (job queue progress), else None
+_STAGE_HOOK = contextvars.ContextVar("stage_hook", default=None)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the enclosed block as analysis stage `name` of the current job.
+    """
+    hook = _STAGE_HOOK.get()
+    if hook is not None:
+        hook(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+def record_stage(name, seconds):
+    """
+    Add an already-measured stage time (e.g. summed over streamed chunks).
+    """
+    job = _JOB.get()
+    if job is not None:
+        job["stages"].append((name, seconds))
+
+
+def count_audio(seconds):
+    """
+    Add `seconds` of input audio to the current job's audio-processed total.
+    """
+    job = _JOB.get()
+    if job is not None:
+        job["audio_sec"] += float(seconds)
+
+
+@contextmanager
+def watch_stages(callback):
+    """
+    Call callback(name) at the start of every stage() inside the block.
+    """
+    token = _STAGE_HOOK.set(callback)
+    try:
+        yield
+    finally:
+        _STAGE_HOOK.reset(token)
+
+
+def run_timed(fn, *args):
+    """
+    Pool job wrapper: fn(*args) -> (result, job timings). Exceptions from
+    fn propagate unchanged; their timings are dropped.
+    """
+    job = {"stages": [], "audio_sec": 0.0}
+    token = _JOB.set(job)
+    try:
+        return fn(*args), job
+    finally:
+        _JOB.reset(token)
+
+
+########################################
+# SERVER SIDE
+########################################
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)   # per bucket, not cumulative
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}     # name -> {labels tuple: value}
+        self._histograms = {}   # name -> {labels tuple: Histogram}
+        self._help = {}
+
+    def inc(self, name, value=1, help="", **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=STAGE_BUCKETS, help="", **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def record_job(self, job_name, timings):
+        """
+        Fold one finished pool job (see run_timed) into the registry.
+        """
+        for name, sec in timings["stages"]:
+            self.observe("analysis_stage_seconds", sec, help="Time spent per analysis stage.", stage=name)
+        if timings["audio_sec"]:
+            self.inc(
+                "analysis_audio_seconds_total", timings["audio_sec"],
+                help="Seconds of input audio analysed.", job=job_name,
+            )
+
+    def render(self, samples=()):
+        """
+        Prometheus text exposition (format 0.0.4). `samples` are
+        (name, type, help, value) tuples read at scrape time, e.g. queue depth.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for upper, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels(key + (('le', f'{upper:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{_labels(key)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(key)} {hist.count}")
+
+        for name, kind, help, value in samples:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+# one registry per server process
+REGISTRY = MetricsRegistry()
+
+
+def pool_samples(pool, cache=None):
+    """
+    Scrape-time samples for an AnalysisPool (and optionally a ResultCache).
+    """
+    samples = [
+        ("analysis_pool_ready", "gauge", "1 once every analysis worker has warmed up.", int(pool.ready)),
+        ("analysis_pool_workers", "gauge", "Analysis worker processes.", max(pool.max_workers, 1)),
+        ("analysis_pool_in_flight", "gauge", "Jobs running or queued in the analysis pool.", pool.in_flight),
+        ("analysis_pool_capacity", "gauge", "Jobs the pool accepts before answering 503.", pool.capacity),
+    ]
+    if cache is not None:
+        stats = cache.stats()
+        samples += [
+            ("result_cache_hits_total", "counter", "Result cache hits.", stats["hits"]),
+            ("result_cache_misses_total", "counter", "Result cache misses.", stats["misses"]),
+            ("result_cache_memory_bytes", "gauge", "Bytes held by the memory tier.", stats["memory_bytes"]),
+        ]
+    return samples
+
+
+async def track_requests(request, call_next):
+    """
+    HTTP middleware: request counter + latency histogram per route template
+    (so /analyzeSinglePlayer is one series no matter what is uploaded).
+    """
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REGISTRY.inc(
+            "http_requests_total", help="HTTP requests by route and status.",
+            method=request.method, path=path, status=status,
+        )
+        REGISTRY.observe(
+            "http_request_seconds", time.perf_counter() - t0, buckets=REQUEST_BUCKETS,
+            help="HTTP request latency by route.", method=request.method, path=path,
+        )
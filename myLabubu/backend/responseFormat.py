@@ -0,0 +1,100 @@
+"""
+Response encodings for the analysis endpoints (`encoding` form field).
+
+  json      the original shape: one object per note / candidate / player
+  columnar  every list of records becomes one object of arrays, e.g.
+            "notes": {"note": ["D", ...], "octave": [4, ...], "duration_q": [1.0, ...]}
+  msgpack   the columnar shape as MessagePack (application/msgpack)
+
+Binary fields (bytes, e.g. the pitch contour) go out base64-encoded in the
+JSON encodings and as raw msgpack bin in msgpack.
+
+Workers keep tables column-wise (gameJudger.Segments, Score.note_columns);
+`tables` names the top-level fields that arrive that way, and plain json
+turns them back into records. /analyzeBatch sends one NDJSON line per
+player, or one MessagePack object per player (a plain msgpack stream).
+"""
+import base64
+import json
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+RESPONSE_ENCODINGS = ("json", "columnar", "msgpack")
+
+MEDIA_TYPES = {"json": "application/json", "columnar": "application/json", "msgpack": "application/msgpack"}
+STREAM_MEDIA_TYPES = {"json": "application/x-ndjson", "columnar": "application/x-ndjson", "msgpack": "application/msgpack"}
+
+
+def check_encoding(encoding):
+    if encoding not in RESPONSE_ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding '{encoding}'. Available: {list(RESPONSE_ENCODINGS)}")
+
+
+def to_columns(rows, keys):
+    """
+    [{"a": 1, "b": 2}, ...] -> {"a": [1, ...], "b": [2, ...]} (keys fixed,
+    so an empty table keeps its shape).
+    """
+    return {k: [r[k] for r in rows] for k in keys}
+
+
+def to_rows(columns):
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+
+def columnar(value):
+    """
+    `value` with every non-empty list of same-keyed dicts turned into columns.
+    """
+    if isinstance(value, dict):
+        return {k: columnar(v) for k, v in value.items()}
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        keys = list(value[0])
+        if all(list(v) == keys for v in value):
+            return {k: columnar([v[k] for v in value]) for k in keys}
+        return [columnar(v) for v in value]
+    return value
+
+
+def _bytes_to_base64(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json(payload):
+    # same settings as starlette's JSONResponse
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_bytes_to_base64,
+    ).encode("utf-8")
+
+
+def encode(payload, encoding="json", tables=()):
+    """
+    Response body bytes for `payload` in `encoding`.
+    """
+    if encoding == "json":
+        if tables:
+            payload = {k: to_rows(v) if k in tables else v for k, v in payload.items()}
+        return _json(payload)
+    payload = columnar(payload)
+    if encoding == "columnar":
+        return _json(payload)
+    import msgpack
+
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def render(payload, encoding="json", tables=()):
+    return Response(encode(payload, encoding, tables), media_type=MEDIA_TYPES[encoding])
+
+
+def encode_line(payload, encoding="json"):
+    """
+    One streamed record: an NDJSON line, or one self-delimiting msgpack object.
+    """
+    if encoding == "msgpack":
+        return encode(payload, encoding)
+    return encode(payload, encoding) + b"\n"
@@ -0,0 +1,248 @@
+"""
+Content-addressed cache for analysis results.
+
+Players resubmit the same take and the frontend retries on flaky networks,
+so identical audio bytes show up again and again. Results are keyed by a
+hash of the raw upload plus every parameter that changes the output.
+
+Two tiers:
+  - memory: LRU, bounded by the encoded size of the stored results
+  - disk (optional): one JSON file per entry, oldest evicted first. Several
+    processes may share the directory: a key missing from this process's
+    index is still looked up on disk, and an entry another process evicted
+    is a miss. Each process only evicts the entries it knows of (scanned at
+    startup, written or read since), so RESULT_CACHE_DISK_MB is a
+    per-process bound.
+
+Endpoints use get_async / put_async, which run the disk tier in the event
+loop's default executor; only the in-memory LRU is touched on the loop.
+
+Config (env vars):
+  RESULT_CACHE_MB        memory tier size (default 64, 0 disables caching)
+  RESULT_CACHE_DIR       enables the disk tier in this directory
+  RESULT_CACHE_DISK_MB   disk tier size (default 512)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# bump when analysis/scoring changes so stale disk entries stop matching
+# (song edits don't need it: judge/identify keys carry the song library digest)
+CACHE_VERSION = 6
+
+
+class ResultCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()       # memory tier + counters
+        self._disk_lock = threading.Lock()  # disk index (file IO happens outside it)
+        self._mem = OrderedDict()   # key -> encoded bytes, LRU order
+        self._mem_bytes = 0
+        self._disk = OrderedDict()  # key -> file size, oldest first
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+
+        if self.enabled and self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    @classmethod
+    def from_env(cls):
+        mb = float(os.environ.get("RESULT_CACHE_MB", 64))
+        disk_mb = float(os.environ.get("RESULT_CACHE_DISK_MB", 512))
+        return cls(
+            max_bytes=int(mb * 1024 * 1024),
+            disk_dir=os.environ.get("RESULT_CACHE_DIR") or None,
+            disk_max_bytes=int(disk_mb * 1024 * 1024),
+        )
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(raw_bytes: bytes, kind: str, **params) -> str:
+        """
+        sha256 over the upload bytes + endpoint kind + sorted params.
+        """
+        h = hashlib.sha256()
+        h.update(raw_bytes)
+        h.update(json.dumps([CACHE_VERSION, kind, params], sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    ########################################
+    # PUBLIC API
+    ########################################
+
+    def get(self, key):
+        """
+        Cached value or None. Disk hits are promoted to the memory tier.
+        """
+        if not self.enabled:
+            return None
+        blob = self._mem_get(key)
+        if blob is None and self.disk_dir:
+            blob = self._disk_get(key)
+        return self._count(blob)
+
+    def put(self, key, value):
+        """
+        Store a JSON-serializable value in both tiers.
+        """
+        if not self.enabled:
+            return
+        blob = self._encode_put(key, value)
+        if self.disk_dir:
+            self._disk_write(key, blob)
+
+    async def get_async(self, key):
+        """
+        get() for async code: a disk-tier lookup runs in the default executor.
+        """
+        if not self.enabled:
+            return None
+        blob = self._mem_get(key)
+        if blob is None and self.disk_dir:
+            blob = await asyncio.get_running_loop().run_in_executor(None, self._disk_get, key)
+        return self._count(blob)
+
+    async def put_async(self, key, value):
+        """
+        put() for async code: the disk write runs in the default executor.
+        """
+        if not self.enabled:
+            return
+        blob = self._encode_put(key, value)
+        if self.disk_dir:
+            await asyncio.get_running_loop().run_in_executor(None, self._disk_write, key, blob)
+
+    def stats(self):
+        with self._disk_lock:
+            disk = {"disk_entries": len(self._disk), "disk_bytes": self._disk_bytes}
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self._mem),
+                "memory_bytes": self._mem_bytes,
+                **disk,
+            }
+
+    ########################################
+    # MEMORY TIER
+    ########################################
+
+    def _mem_get(self, key):
+        with self._lock:
+            blob = self._mem.get(key)
+            if blob is not None:
+                self._mem.move_to_end(key)
+                self.memory_hits += 1
+            return blob
+
+    def _count(self, blob):
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(blob)
+
+    def _encode_put(self, key, value):
+        blob = json.dumps(value, separators=(",", ":")).encode()
+        with self._lock:
+            self._mem_put(key, blob)
+        return blob
+
+    def _mem_put(self, key, blob):
+        """(caller holds self._lock)"""
+        if len(blob) > self.max_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        self._mem[key] = blob
+        self._mem_bytes += len(blob)
+        while self._mem_bytes > self.max_bytes:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+
+    ########################################
+    # DISK TIER
+    ########################################
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _scan_disk(self):
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    st = os.stat(os.path.join(root, name))
+                    entries.append((st.st_mtime, name[:-5], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _disk_get(self, key):
+        """
+        Disk-tier blob or None; a hit is promoted to the memory tier.
+        Keys missing from this process's index are still looked up on disk:
+        other workers sharing the directory may have written them.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.utime(path)
+        except OSError:  # never written, or evicted (possibly by another process)
+            with self._disk_lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._disk_lock:
+            self._disk_bytes += len(blob) - self._disk.pop(key, 0)
+            self._disk[key] = len(blob)
+        with self._lock:
+            self._mem_put(key, blob)
+            self.disk_hits += 1
+        return blob
+
+    def _disk_write(self, key, blob):
+        if len(blob) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)  # atomic, so readers never see half a file
+
+        evicted = []
+        with self._disk_lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(blob)
+            self._disk_bytes += len(blob)
+            while self._disk_bytes > self.disk_max_bytes:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
@@ -0,0 +1,433 @@
+"""
+Small score model + MusicXML / Standard MIDI File writers for the transcriber.
+
+The transcriber only ever produces one treble-clef line in 4/4 with a tempo
+and a key, so instead of building a music21 Stream (and paying for its
+import, makeMeasures/makeNotation and two temp-file writes per export) the
+notes are kept as plain events and written straight to in-memory strings /
+bytes here. music21 is still used when SCORE_WRITER=music21 (see app.py).
+
+  Score(events, bpm, tonic="D", mode="major")
+  events: NoteEvent(midi, quarter_length); midi=None is a rest
+"""
+import base64
+import os
+import re
+import struct
+
+import numpy as np
+
+# "fast" (this module) or "music21" (the old Stream-based export in app.py)
+SCORE_WRITER = os.environ.get("SCORE_WRITER", "fast")
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+_STEP_TO_PC = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_TONIC_RE = re.compile(r"^([A-Ga-g])([#b\-♯♭]*)$")
+
+# tonic spelling per pitch class, as music21's key analysis reports it
+MAJOR_TONICS = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'A-', 'A', 'B-', 'B']
+MINOR_TONICS = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']
+
+# circle of fifths position of every tonic name
+_MAJOR_FIFTHS = {
+    "C-": -7, "G-": -6, "D-": -5, "A-": -4, "E-": -3, "B-": -2, "F": -1, "C": 0,
+    "G": 1, "D": 2, "A": 3, "E": 4, "B": 5, "F#": 6, "C#": 7,
+}
+_MINOR_FIFTHS = {
+    "A-": -7, "E-": -6, "B-": -5, "F": -4, "C": -3, "G": -2, "D": -1, "A": 0,
+    "E": 1, "B": 2, "F#": 3, "C#": 4, "G#": 5, "D#": 6, "A#": 7,
+}
+_SHARP_ORDER = "FCGDAEB"
+
+# Krumhansl-Kessler profiles (same values as music21's KrumhanslSchmuckler)
+_KK_MAJOR = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+_KK_MINOR = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# single-glyph durations (quarter lengths), longest first: (ql, type, dots)
+_NOTE_TYPES = [
+    (4.0, "whole", 0), (3.0, "half", 1), (2.0, "half", 0), (1.5, "quarter", 1),
+    (1.0, "quarter", 0), (0.75, "eighth", 1), (0.5, "eighth", 0), (0.375, "16th", 1),
+    (0.25, "16th", 0), (0.1875, "32nd", 1), (0.125, "32nd", 0),
+]
+
+XML_DIVISIONS = 96       # per quarter: exact for 32nds and triplets
+MIDI_TICKS = 480         # per quarter
+MIDI_VELOCITY = 90
+
+
+class NoteEvent:
+    __slots__ = ("midi", "quarter_length")
+
+    def __init__(self, midi, quarter_length):
+        self.midi = midi
+        self.quarter_length = float(quarter_length)
+
+    @property
+    def is_rest(self):
+        return self.midi is None
+
+    def __repr__(self):
+        name = "rest" if self.midi is None else midi_to_name(self.midi)
+        return f"NoteEvent({name}, {self.quarter_length})"
+
+
+class Score:
+    def __init__(self, events, bpm, tonic="C", mode="major", beats_per_bar=4):
+        self.events = events
+        self.bpm = float(bpm)
+        self.tonic = tonic
+        self.mode = mode
+        self.beats_per_bar = beats_per_bar
+
+    @property
+    def key_text(self):
+        return f"{self.tonic} {self.mode}"
+
+    @property
+    def fifths(self):
+        return key_fifths(self.tonic, self.mode)
+
+    def notes_list(self):
+        """
+        [{"note": "F#", "octave": 4, "duration_q": 1.0}, ...] for notes only
+        (the transcriber's JSON "notes"; sharps, like librosa.hz_to_note).
+        """
+        return [
+            {"note": NOTE_NAMES[e.midi % 12], "octave": e.midi // 12 - 1, "duration_q": e.quarter_length}
+            for e in self.events if e.midi is not None
+        ]
+
+    def note_columns(self):
+        """
+        notes_list() column-wise: {"note": [...], "octave": [...], "duration_q": [...]}
+        (see responseFormat), without a dict per note.
+        """
+        notes = [e for e in self.events if e.midi is not None]
+        midi = np.fromiter((e.midi for e in notes), dtype=np.int64, count=len(notes))
+        return {
+            "note": np.asarray(NOTE_NAMES)[midi % 12].tolist(),
+            "octave": (midi // 12 - 1).tolist(),
+            "duration_q": [e.quarter_length for e in notes],
+        }
+
+    def transposed(self, semitones, tonic=None, mode=None):
+        """
+        New Score shifted by `semitones`. The key moves along unless an
+        explicit target tonic/mode is given.
+        """
+        mode = mode or self.mode
+        if tonic is None:
+            pc = (tonic_to_pc(self.tonic) + semitones) % 12
+            tonic = (MAJOR_TONICS if mode == "major" else MINOR_TONICS)[pc]
+        events = [
+            NoteEvent(None if e.midi is None else e.midi + semitones, e.quarter_length)
+            for e in self.events
+        ]
+        return Score(events, self.bpm, tonic=tonic, mode=mode, beats_per_bar=self.beats_per_bar)
+
+
+########################################
+# PITCH / KEY HELPERS
+########################################
+
+def midi_to_name(midi):
+    return f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}"
+
+
+def normalize_tonic(name):
+    """
+    "Bb" / "B♭" / "b-" -> "B-",  "f#" -> "F#" (music21-style names).
+    Raises ValueError for anything else.
+    """
+    m = _TONIC_RE.match(name.strip())
+    if not m:
+        raise ValueError(f"Unknown key tonic '{name}'")
+    step, acc = m.groups()
+    acc = acc.replace("♯", "#").replace("♭", "-").replace("b", "-")
+    return step.upper() + acc
+
+
+def tonic_to_pc(name):
+    tonic = normalize_tonic(name)
+    return (_STEP_TO_PC[tonic[0]] + tonic.count("#") - tonic.count("-")) % 12
+
+
+def parse_key_text(text):
+    """
+    "Bb major" / "f# minor" / "D" -> ("B-", "major") etc.
+    """
+    parts = text.split()
+    if not parts:
+        raise ValueError("Empty key")
+    mode = parts[1].lower() if len(parts) > 1 else "major"
+    if mode not in ("major", "minor"):
+        raise ValueError(f"Unknown key mode '{parts[1]}'. Available: ['major', 'minor']")
+    return normalize_tonic(parts[0]), mode
+
+
+def key_fifths(tonic, mode):
+    """
+    Key signature as sharps (+) / flats (-), e.g. ("D", "major") -> 2.
+    Unusual spellings fall back to the enharmonic key (E# major -> F major).
+    """
+    table = _MAJOR_FIFTHS if mode == "major" else _MINOR_FIFTHS
+    name = normalize_tonic(tonic)
+    if name not in table:
+        name = (MAJOR_TONICS if mode == "major" else MINOR_TONICS)[tonic_to_pc(name)]
+    return table[name]
+
+
+def transpose_semitones(from_key_text, to_key_text):
+    """
+    Semitone shift between two tonics, both taken in the same octave
+    (same as music21 Interval(Pitch(from), Pitch(to))): D -> C is -2, B -> C is -11.
+    """
+    f, _ = parse_key_text(from_key_text)
+    t, _ = parse_key_text(to_key_text)
+    f_midi = _STEP_TO_PC[f[0]] + f.count("#") - f.count("-")
+    t_midi = _STEP_TO_PC[t[0]] + t.count("#") - t.count("-")
+    return t_midi - f_midi
+
+
+def spell(midi, fifths):
+    """
+    (step, alter, octave) for a MIDI note: sharps in sharp keys and C major,
+    flats in flat keys.
+    """
+    pc = midi % 12
+    octave = midi // 12 - 1
+    if fifths >= 0 or pc in (0, 2, 4, 5, 7, 9, 11):
+        name = NOTE_NAMES[pc]
+        return name[0], (1 if len(name) > 1 else 0), octave
+    # black key in a flat key: the white key above, flattened
+    return NOTE_NAMES[pc + 1], -1, octave
+
+
+def _key_alters(fifths):
+    alters = {s: 0 for s in "CDEFGAB"}
+    if fifths > 0:
+        for s in _SHARP_ORDER[:fifths]:
+            alters[s] = 1
+    elif fifths < 0:
+        for s in _SHARP_ORDER[::-1][:-fifths]:
+            alters[s] = -1
+    return alters
+
+
+def detect_key(events):
+    """
+    Krumhansl-Schmuckler key estimate: duration-weighted pitch-class histogram
+    correlated with every rotation of the major/minor profiles.
+    Returns (tonic, mode); ("C", "major") when there are no notes.
+    """
+    hist = np.zeros(12)
+    for e in events:
+        if e.midi is not None:
+            hist[e.midi % 12] += e.quarter_length
+    if not hist.any():
+        return "C", "major"
+
+    best = None
+    h = hist - hist.mean()
+    for mode, profile, tonics in (("major", _KK_MAJOR, MAJOR_TONICS), ("minor", _KK_MINOR, MINOR_TONICS)):
+        # row i = profile rotated so its tonic sits on pitch class i
+        rot = np.stack([np.roll(profile, i) for i in range(12)])
+        p = rot - profile.mean()
+        r = (p @ h) / np.sqrt((p ** 2).sum(axis=1) * (h ** 2).sum())
+        i = int(np.argmax(r))
+        if best is None or r[i] > best[0]:
+            best = (r[i], tonics[i], mode)
+    return best[1], best[2]
+
+
+########################################
+# DURATIONS
+########################################
+
+def split_duration(ql):
+    """
+    Break a quarter length into writable glyphs, e.g. 2.5 -> [(2.0, "half", 0), (0.5, "eighth", 0)].
+    """
+    out = []
+    left = ql
+    for length, typ, dots in _NOTE_TYPES:
+        while left >= length - 1e-9:
+            out.append((length, typ, dots))
+            left -= length
+    if left > 1e-6 and out:
+        # finer than a 32nd: fold the rest into the last glyph's duration
+        length, typ, dots = out[-1]
+        out[-1] = (length + left, typ, dots)
+    elif left > 1e-6:
+        out.append((left, "32nd", 0))
+    return out
+
+
+def _bars(score):
+    """
+    Events cut at barlines: list of measures, each a list of
+    (midi, quarter_length, tie_start, tie_stop).
+    """
+    bar = float(score.beats_per_bar)
+    measures = [[]]
+    pos = 0.0
+    for e in score.events:
+        left = e.quarter_length
+        first = True
+        while left > 1e-9:
+            room = bar - pos
+            take = min(left, room)
+            last = left - take <= 1e-9
+            measures[-1].append((e.midi, take, e.midi is not None and not last, e.midi is not None and not first))
+            pos += take
+            left -= take
+            first = False
+            if pos >= bar - 1e-9:
+                measures.append([])
+                pos = 0.0
+    if not measures[-1] and len(measures) > 1:
+        measures.pop()
+    return measures
+
+
+########################################
+# MUSICXML
+########################################
+
+def _note_xml(out, midi, length, typ, dots, tie_start, tie_stop, accidental, fifths):
+    div = int(round(length * XML_DIVISIONS))
+    out.append("      <note>\n")
+    if midi is None:
+        out.append("        <rest/>\n")
+    else:
+        step, alter, octave = spell(midi, fifths)
+        out.append(f"        <pitch>\n          <step>{step}</step>\n")
+        if alter:
+            out.append(f"          <alter>{alter}</alter>\n")
+        out.append(f"          <octave>{octave}</octave>\n        </pitch>\n")
+    out.append(f"        <duration>{div}</duration>\n")
+    if tie_stop:
+        out.append('        <tie type="stop"/>\n')
+    if tie_start:
+        out.append('        <tie type="start"/>\n')
+    out.append(f"        <voice>1</voice>\n        <type>{typ}</type>\n")
+    out.append("        <dot/>\n" * dots)
+    if accidental:
+        out.append(f"        <accidental>{accidental}</accidental>\n")
+    if tie_start or tie_stop:
+        out.append("        <notations>\n")
+        if tie_stop:
+            out.append('          <tied type="stop"/>\n')
+        if tie_start:
+            out.append('          <tied type="start"/>\n')
+        out.append("        </notations>\n")
+    out.append("      </note>\n")
+
+
+def to_musicxml(score, title="Transcription"):
+    """
+    MusicXML 4.0 (partwise) text for a Score.
+    """
+    fifths = score.fifths
+    key_alters = _key_alters(fifths)
+    out = [
+        '<?xml version="1.0" encoding="utf-8"?>\n',
+        '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+        '"http://www.musicxml.org/dtds/partwise.dtd">\n',
+        '<score-partwise version="4.0">\n',
+        f"  <work>\n    <work-title>{title}</work-title>\n  </work>\n",
+        "  <identification>\n    <encoding>\n      <software>scoreWriter</software>\n"
+        "    </encoding>\n  </identification>\n",
+        '  <part-list>\n    <score-part id="P1">\n      <part-name>Violin</part-name>\n'
+        "    </score-part>\n  </part-list>\n",
+        '  <part id="P1">\n',
+    ]
+
+    measures = _bars(score)
+    for num, measure in enumerate(measures, start=1):
+        out.append(f'    <measure number="{num}">\n')
+        if num == 1:
+            out.append(
+                f"      <attributes>\n        <divisions>{XML_DIVISIONS}</divisions>\n"
+                f"        <key>\n          <fifths>{fifths}</fifths>\n          <mode>{score.mode}</mode>\n        </key>\n"
+                f"        <time>\n          <beats>{score.beats_per_bar}</beats>\n          <beat-type>4</beat-type>\n        </time>\n"
+                "        <clef>\n          <sign>G</sign>\n          <line>2</line>\n        </clef>\n"
+                "      </attributes>\n"
+                '      <direction placement="above">\n        <direction-type>\n'
+                f"          <metronome>\n            <beat-unit>quarter</beat-unit>\n"
+                f"            <per-minute>{round(score.bpm)}</per-minute>\n          </metronome>\n"
+                f'        </direction-type>\n        <sound tempo="{score.bpm:.4g}"/>\n      </direction>\n'
+            )
+
+        # accidentals: shown when a step's alteration differs from what the
+        # key signature / earlier notes in this measure imply
+        state = {}
+        for midi, ql, tie_start, tie_stop in measure:
+            glyphs = split_duration(ql)
+            for gi, (length, typ, dots) in enumerate(glyphs):
+                accidental = None
+                if midi is not None and gi == 0 and not tie_stop:
+                    step, alter, octave = spell(midi, fifths)
+                    current = state.get((step, octave), key_alters[step])
+                    if alter != current:
+                        accidental = {1: "sharp", -1: "flat", 0: "natural"}[alter]
+                        state[(step, octave)] = alter
+                is_rest = midi is None
+                _note_xml(
+                    out, midi, length, typ, dots,
+                    tie_start=not is_rest and (tie_start or gi < len(glyphs) - 1),
+                    tie_stop=not is_rest and (tie_stop or gi > 0),
+                    accidental=accidental, fifths=fifths,
+                )
+        if num == len(measures):
+            out.append('      <barline location="right">\n        <bar-style>light-heavy</bar-style>\n      </barline>\n')
+        out.append("    </measure>\n")
+
+    out.append("  </part>\n</score-partwise>\n")
+    return "".join(out)
+
+
+########################################
+# STANDARD MIDI FILE
+########################################
+
+def _varlen(n):
+    out = [n & 0x7F]
+    n >>= 7
+    while n:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    return bytes(reversed(out))
+
+
+def to_midi(score):
+    """
+    Format-0 Standard MIDI File bytes (one track, channel 1). Every event is
+    its own note, like the music21 export of the untied transcription.
+    """
+    track = bytearray()
+    track += b"\x00\xff\x51\x03" + struct.pack(">I", int(round(60_000_000 / score.bpm)))[1:]
+    track += b"\x00\xff\x58\x04" + bytes([score.beats_per_bar, 2, 24, 8])
+    track += b"\x00\xff\x59\x02" + struct.pack(">bB", score.fifths, 1 if score.mode == "minor" else 0)
+
+    pending = 0  # ticks since the last written event
+    for e in score.events:
+        ticks = int(round(e.quarter_length * MIDI_TICKS))
+        if e.midi is None or not 0 <= e.midi <= 127:
+            pending += ticks
+            continue
+        track += _varlen(pending) + bytes([0x90, e.midi, MIDI_VELOCITY])
+        track += _varlen(ticks) + bytes([0x80, e.midi, 0])
+        pending = 0
+    track += _varlen(pending) + b"\xff\x2f\x00"
+
+    header = b"MThd" + struct.pack(">IHHH", 6, 0, 1, MIDI_TICKS)
+    return header + b"MTrk" + struct.pack(">I", len(track)) + bytes(track)
+
+
+def export_score(score):
+    """
+    (musicxml text, base64 MIDI) - same shape as app.export_stream().
+    """
+    return to_musicxml(score), base64.b64encode(to_midi(score)).decode("ascii")
@@ -0,0 +1,144 @@
+"""
+"Which song is this?" lookup over a SongLibrary.
+
+Melodies are indexed by their interval n-grams (semitone steps between
+consecutive notes), so the same tune played in any key hits the same
+entries. Repeated notes are collapsed first: the judger's frames usually
+merge detached repeats into one segment, so a query rarely contains them.
+
+The index is an inverted file stored in three flat arrays:
+  keys      int64   sorted distinct n-gram codes
+  starts    int64   postings of keys[i] are songs[starts[i]:starts[i+1]]
+  songs     int32   song indices (each song at most once per n-gram)
+A query is one np.searchsorted over its own n-grams plus a bincount over
+the matching postings: cost grows with the number of hits, not with the
+size of the catalog.
+"""
+import numpy as np
+
+# intervals are clipped to +-MAX_STEP semitones and packed base (2*MAX_STEP+1)
+MAX_STEP = 24
+_BASE = 2 * MAX_STEP + 1
+
+
+def collapse_repeats_midi(midi):
+    """
+    [62, 62, 64, 62] -> [62, 64, 62]
+    """
+    midi = np.asarray(midi, dtype=np.int16)
+    if midi.size < 2:
+        return midi
+    keep = np.empty(midi.size, dtype=bool)
+    keep[0] = True
+    keep[1:] = midi[1:] != midi[:-1]
+    return midi[keep]
+
+
+def interval_ngrams(midi, n=4):
+    """
+    Integer codes of all interval n-grams of a melody (after collapsing repeats).
+    A melody of k distinct-in-a-row notes has max(k - n, 0) n-grams.
+    """
+    steps = np.diff(collapse_repeats_midi(midi)).clip(-MAX_STEP, MAX_STEP).astype(np.int64) + MAX_STEP
+    if steps.size < n:
+        return np.zeros(0, dtype=np.int64)
+    codes = np.zeros(steps.size - n + 1, dtype=np.int64)
+    for k in range(n):
+        codes = codes * _BASE + steps[k:steps.size - n + 1 + k]
+    return codes
+
+
+class IntervalIndex:
+    def __init__(self, n=4):
+        self.n = n
+        self.song_keys = []
+        self.titles = []
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.starts = np.zeros(1, dtype=np.int64)
+        self.songs = np.zeros(0, dtype=np.int32)
+        self.idf = np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def build(cls, library, n=4):
+        """
+        Index every song of a SongLibrary.
+        """
+        index = cls(n=n)
+        n_songs = len(library)
+        index.song_keys = library.keys()
+        index.titles = [library.song_at(i).title for i in range(n_songs)]
+
+        # 1. (n-gram, song) pairs, each pair once
+        codes, owners = [], []
+        for i in range(n_songs):
+            c = np.unique(interval_ngrams(library.song_at(i).midi, n))
+            codes.append(c)
+            owners.append(np.full(c.size, i, dtype=np.int32))
+        if not codes or not sum(c.size for c in codes):
+            return index
+        codes = np.concatenate(codes)
+        owners = np.concatenate(owners)
+
+        # 2. sort by n-gram -> postings lists
+        order = np.lexsort((owners, codes))
+        codes, owners = codes[order], owners[order]
+        index.keys, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        index.starts = np.append(first, codes.size).astype(np.int64)
+        index.songs = owners
+
+        # 3. rare n-grams say more about the song than common ones
+        index.idf = np.log1p(n_songs / counts).astype(np.float32)
+        return index
+
+    def __len__(self):
+        return len(self.song_keys)
+
+    def query(self, midi, top_k=5):
+        """
+        Rank songs for a played melody (MIDI numbers, any key).
+
+        Score is the idf-weighted share of the query's n-grams found in the
+        song (0..1), so a clip of any part of a song can score 1.0.
+        Returns up to top_k dicts, best first:
+          {"song_key": ..., "title": ..., "score": 0.83, "matched": 14}
+        Songs sharing no n-gram with the query are never returned.
+        """
+        q = np.unique(interval_ngrams(midi, self.n))
+        if q.size == 0 or self.keys.size == 0:
+            return []
+
+        # 1. which query n-grams exist in the catalog
+        pos = np.searchsorted(self.keys, q).clip(max=self.keys.size - 1)
+        pos = pos[self.keys[pos] == q]
+        if pos.size == 0:
+            return []
+
+        # 2. gather postings of every hit n-gram (vectorized ranges)
+        lo, hi = self.starts[pos], self.starts[pos + 1]
+        lens = hi - lo
+        flat = np.repeat(lo - np.cumsum(lens) + lens, lens) + np.arange(lens.sum())
+        weights = np.repeat(self.idf[pos], lens)
+
+        # 3. vote: idf mass of the query's n-grams that each song contains
+        n_songs = len(self.song_keys)
+        owners = self.songs[flat]
+        votes = np.bincount(owners, weights=weights, minlength=n_songs)
+        matched = np.bincount(owners, minlength=n_songs)
+        # n-grams found nowhere still count against the query (weighted as the rarest)
+        q_mass = np.sum(self.idf[pos]) + (q.size - pos.size) * np.log1p(n_songs)
+        scores = votes / q_mass
+
+        candidates = np.flatnonzero(matched)
+        if candidates.size > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        return [
+            {
+                "song_key": self.song_keys[i],
+                "title": self.titles[i],
+                "score": float(scores[i]),
+                "matched": int(matched[i]),
+            }
+            for i in candidates
+        ]
@@ -0,0 +1,294 @@
+"""
+Song registry: reference melodies compiled once into integer arrays.
+
+Songs come from files in songs/ (plus $SONGS_DIR if set):
+  - *.json   compact format: {"key", "title", "notes": ["D4", ...] or "midi": [62, ...], "beats": [...]}
+  - *.mid / *.midi / *.musicxml / *.xml / *.mxl   parsed with music21 (optional dependency)
+and from code via SongLibrary.register() (gameJudger registers the built-in SONGS).
+
+Every melody is stored in a handful of flat arrays shared by the whole
+library (CSR style: song i owns positions offsets[i]:offsets[i+1]):
+  midi       int8     MIDI note numbers
+  beats      float32  note lengths in beats (1.0 when the source has none)
+  intervals  int8     midi[k+1] - midi[k] inside each song (transposition-free fingerprint)
+Lookups by key are one dict hit; CompiledSong objects are views, not copies.
+interval_index() serves "which song is this?" queries (see songIndex).
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from songIndex import IntervalIndex
+
+SONGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "songs")
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+_STEP_TO_PC = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_NOTE_RE = re.compile(r"^([A-Ga-g])([#b♯♭x]*)(-?\d+)$")
+
+
+def note_name_to_midi(name):
+    """
+    "D4" -> 62, "F#4" -> 66, "Bb3" -> 58. Cheap parser (no librosa import).
+    """
+    m = _NOTE_RE.match(name.strip())
+    if not m:
+        raise ValueError(f"Bad note name '{name}'")
+    step, acc, octave = m.groups()
+    alter = acc.count("#") + acc.count("♯") + 2 * acc.count("x") - acc.count("b") - acc.count("♭")
+    return _STEP_TO_PC[step.upper()] + alter + 12 * (int(octave) + 1)
+
+
+def midi_to_name(midi):
+    midi = int(midi)
+    return f"{NOTE_NAMES[midi % 12]}{(midi // 12) - 1}"
+
+
+class CompiledSong:
+    """
+    Read-only view of one song inside a SongLibrary.
+    """
+    __slots__ = ("key", "title", "index", "midi", "beats", "intervals", "lowest", "highest", "_names", "_digest")
+
+    def __init__(self, key, title, index, midi, beats, intervals):
+        self.key = key
+        self.title = title
+        self.index = index
+        self.midi = midi
+        self.beats = beats
+        self.intervals = intervals
+        self.lowest = int(midi.min()) if midi.size else 0
+        self.highest = int(midi.max()) if midi.size else 0
+        self._names = None
+        self._digest = None
+
+    @property
+    def note_names(self):
+        """
+        ["D4", "D4", "E4", ...] (sharps, like the judger's detected notes).
+        """
+        if self._names is None:
+            self._names = tuple(midi_to_name(m) for m in self.midi)
+        return self._names
+
+    @property
+    def digest(self):
+        """
+        Hash of the notes and beats: changes whenever the melody is edited
+        (part of the result-cache key of every judged take).
+        """
+        if self._digest is None:
+            self._digest = _digest(self.midi, self.beats)
+        return self._digest
+
+    def __len__(self):
+        return int(self.midi.size)
+
+    def __repr__(self):
+        return f"CompiledSong({self.key!r}, {len(self)} notes, {midi_to_name(self.lowest)}-{midi_to_name(self.highest)})"
+
+
+class SongLibrary:
+    def __init__(self):
+        self._pending = {}   # key -> (title, midi list, beats list), not compiled yet
+        self._order = []     # keys in compile order
+        self._index = {}     # key -> song index
+        self._songs = []     # CompiledSong per index
+        self._interval_index = None
+        self._digest = None
+
+        self.midi = np.zeros(0, dtype=np.int8)
+        self.beats = np.zeros(0, dtype=np.float32)
+        self.intervals = np.zeros(0, dtype=np.int8)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    ########################################
+    # ADDING SONGS
+    ########################################
+
+    def register(self, key, notes, beats=None, title=None):
+        """
+        Add (or replace) a melody. `notes` are names ("D4") or MIDI ints.
+        """
+        midi = [note_name_to_midi(n) if isinstance(n, str) else int(n) for n in notes]
+        if not midi:
+            raise ValueError(f"Song '{key}' has no notes")
+        if any(m < 0 or m > 127 for m in midi):
+            raise ValueError(f"Song '{key}' has notes outside MIDI range")
+        if beats is None:
+            beats = [1.0] * len(midi)
+        if len(beats) != len(midi):
+            raise ValueError(f"Song '{key}': {len(midi)} notes but {len(beats)} beats")
+        self._pending[key] = (title or key, midi, [float(b) for b in beats])
+
+    def load_file(self, path):
+        """
+        Register one song file. Returns its key.
+        """
+        base, ext = os.path.splitext(path)
+        ext = ext.lower()
+        if ext == ".json":
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            key = data.get("key") or os.path.basename(base)
+            notes = data.get("notes") or data.get("midi")
+            self.register(key, notes, beats=data.get("beats"), title=data.get("title"))
+            return key
+        if ext in (".mid", ".midi", ".musicxml", ".xml", ".mxl"):
+            key = os.path.basename(base)
+            midi, beats, title = _parse_with_music21(path)
+            self.register(key, midi, beats=beats, title=title or key)
+            return key
+        raise ValueError(f"Unsupported song file '{path}'")
+
+    def load_dir(self, path):
+        """
+        Register every supported file in a directory. Returns the loaded keys.
+        """
+        keys = []
+        if not os.path.isdir(path):
+            return keys
+        for name in sorted(os.listdir(path)):
+            if os.path.splitext(name)[1].lower() in (".json", ".mid", ".midi", ".musicxml", ".xml", ".mxl"):
+                keys.append(self.load_file(os.path.join(path, name)))
+        return keys
+
+    ########################################
+    # LOOKUP
+    ########################################
+
+    def get(self, key):
+        """
+        CompiledSong for `key` (O(1)). Raises ValueError for unknown keys.
+        """
+        self._compile()
+        i = self._index.get(key)
+        if i is None:
+            avail = self.keys()
+            shown = avail[:20] + (["..."] if len(avail) > 20 else [])
+            raise ValueError(f"Unknown song_key '{key}'. Available: {shown}")
+        return self._songs[i]
+
+    def __contains__(self, key):
+        return key in self._index or key in self._pending
+
+    def __len__(self):
+        self._compile()
+        return len(self._songs)
+
+    def keys(self):
+        self._compile()
+        return list(self._order)
+
+    def song_at(self, index):
+        self._compile()
+        return self._songs[index]
+
+    def digest(self):
+        """
+        Hash of every song (keys, titles, notes, beats), for results that
+        depend on the whole library (identification).
+        """
+        self._compile()
+        if self._digest is None:
+            self._digest = _digest(json.dumps([self._order, [s.title for s in self._songs]]).encode(),
+                                   self.offsets, self.midi, self.beats)
+        return self._digest
+
+    def interval_index(self, n=4):
+        """
+        IntervalIndex over every song, rebuilt only after the library changes.
+        """
+        self._compile()
+        if self._interval_index is None or self._interval_index.n != n:
+            self._interval_index = IntervalIndex.build(self, n=n)
+        return self._interval_index
+
+    ########################################
+    # COMPILATION
+    ########################################
+
+    def _compile(self):
+        """
+        Fold pending registrations into the flat arrays (once per batch of adds).
+        """
+        if not self._pending:
+            return
+
+        entries = {k: (s.title, self.midi[self.offsets[s.index]:self.offsets[s.index + 1]].tolist(),
+                       self.beats[self.offsets[s.index]:self.offsets[s.index + 1]].tolist())
+                   for k, s in zip(self._order, self._songs)}
+        for key, entry in self._pending.items():
+            if key not in entries:
+                self._order.append(key)
+            entries[key] = entry
+        self._pending = {}
+
+        lengths = np.array([len(entries[k][1]) for k in self._order], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.midi = np.array([m for k in self._order for m in entries[k][1]], dtype=np.int8)
+        self.beats = np.array([b for k in self._order for b in entries[k][2]], dtype=np.float32)
+
+        # intervals inside each song; the slot after a song's last note is unused (0)
+        self.intervals = np.zeros_like(self.midi)
+        if self.midi.size > 1:
+            self.intervals[:-1] = np.diff(self.midi.astype(np.int16)).clip(-127, 127).astype(np.int8)
+            self.intervals[self.offsets[1:] - 1] = 0
+
+        self._index = {k: i for i, k in enumerate(self._order)}
+        self._interval_index = None
+        self._digest = None
+        self._songs = []
+        for i, k in enumerate(self._order):
+            a, b = self.offsets[i], self.offsets[i + 1]
+            self._songs.append(CompiledSong(
+                k, entries[k][0], i,
+                self.midi[a:b], self.beats[a:b], self.intervals[a:max(a, b - 1)],
+            ))
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else np.ascontiguousarray(part).tobytes())
+    return h.hexdigest()[:16]
+
+
+def _parse_with_music21(path):
+    """
+    Melody line of a MIDI / MusicXML file: top note of every note/chord, in order.
+    """
+    try:
+        from music21 import converter
+    except ImportError as e:
+        raise ValueError(f"music21 is needed to load '{path}'") from e
+
+    score = converter.parse(path)
+    midi, beats = [], []
+    for el in score.flatten().notes:
+        pitches = getattr(el, "pitches", None) or [el.pitch]
+        midi.append(max(p.midi for p in pitches))
+        beats.append(float(el.quarterLength) or 1.0)
+    title = score.metadata.title if score.metadata is not None else None
+    return midi, beats, title
+
+
+_default = None
+
+
+def default_library():
+    """
+    Process-wide library loaded from songs/ and $SONGS_DIR on first use.
+    """
+    global _default
+    if _default is None:
+        lib = SongLibrary()
+        lib.load_dir(SONGS_DIR)
+        extra = os.environ.get("SONGS_DIR")
+        if extra:
+            lib.load_dir(extra)
+        _default = lib
+    return _default
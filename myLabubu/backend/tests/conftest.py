@@ -0,0 +1,12 @@
+"""
+The backend modules import each other as top-level names (from gameJudger
+import ...), so the tests need myLabubu/backend on sys.path wherever pytest
+starts from.
+
+    cd myLabubu/backend
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,85 @@
+"""
+align_notes (banded NumPy DP) against a plain full-matrix edit distance with
+the same costs.
+"""
+import numpy as np
+import pytest
+
+from gameJudger import align_notes
+
+
+def reference_cost(p, t, player_durations=None, target_beats=None, timing_weight=0.0):
+    n, m = len(p), len(t)
+    ins = [1.0] * n
+    if player_durations is not None and n > 0:
+        ref = float(np.median(player_durations))
+        if ref > 0:
+            ins = [min(1.0, d / ref) for d in player_durations]
+    rel_p = rel_t = None
+    if timing_weight > 0 and player_durations is not None and target_beats is not None and n > 0:
+        rel_p = [max(d / max(float(np.median(player_durations)), 1e-9), 1e-9) for d in player_durations]
+        rel_t = [max(b / max(float(np.median(target_beats)), 1e-9), 1e-9) for b in target_beats]
+
+    D = [[0.0] * (m + 1) for _ in range(n + 1)]
+    for j in range(m + 1):
+        D[0][j] = float(j)
+    for i in range(1, n + 1):
+        D[i][0] = D[i - 1][0] + ins[i - 1]
+        for j in range(1, m + 1):
+            sub = float(p[i - 1] != t[j - 1])
+            if rel_p is not None:
+                sub += timing_weight * min(1.0, abs(np.log2(rel_p[i - 1] / rel_t[j - 1])))
+            D[i][j] = min(D[i - 1][j - 1] + sub, D[i - 1][j] + ins[i - 1], D[i][j - 1] + 1.0)
+    return D[n][m]
+
+
+def played(rng, target, edits):
+    """`target` with `edits` random substitutions / extra notes / missed notes."""
+    out = list(target)
+    for _ in range(edits):
+        k = int(rng.integers(0, len(out) + 1))
+        op = rng.random()
+        if op < 0.33 and k < len(out):
+            out[k] = int(rng.integers(55, 90))
+        elif op < 0.66:
+            out.insert(k, int(rng.integers(55, 90)))
+        elif k < len(out):
+            del out[k]
+    return out
+
+
+def check_counts(res, n, m):
+    assert res["matches"] + res["substitutions"] + res["insertions"] == n
+    assert res["matches"] + res["substitutions"] + res["deletions"] == m
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_full_band_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(250):
+        n, m = int(rng.integers(0, 25)), int(rng.integers(1, 25))
+        p = rng.integers(60, 66, n).tolist()
+        t = rng.integers(60, 66, m).tolist()
+        kwargs = {}
+        if rng.random() < 0.5 and n:
+            kwargs["player_durations"] = rng.uniform(0.05, 1.0, n).tolist()
+            if rng.random() < 0.5:
+                kwargs["target_beats"] = rng.choice([0.5, 1.0, 2.0], m).tolist()
+                kwargs["timing_weight"] = float(rng.uniform(0.1, 1.0))
+        res = align_notes(p, t, band=n + m + 1, **kwargs)
+        assert res["cost"] == pytest.approx(reference_cost(p, t, **kwargs), abs=1e-9)
+        check_counts(res, n, m)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_default_band_on_played_takes(seed):
+    # a take is the song with a few mistakes: the optimal path stays near the
+    # diagonal, so the default band gives the exact full-DP cost
+    rng = np.random.default_rng(100 + seed)
+    for _ in range(250):
+        target = rng.integers(55, 90, int(rng.integers(5, 120))).tolist()
+        p = played(rng, target, int(rng.integers(0, max(2, len(target) // 10))))
+        durations = rng.uniform(0.1, 0.8, len(p)).tolist()
+        res = align_notes(p, target, player_durations=durations)
+        assert res["cost"] == pytest.approx(reference_cost(p, target, player_durations=durations), abs=1e-9)
+        check_counts(res, len(p), len(target))
@@ -0,0 +1,86 @@
+"""
+frames_to_segments (vectorized) against the original per-frame loop of
+analyze_violin_notes steps 5-7, on random pitch tracks.
+"""
+import numpy as np
+import pytest
+
+from gameJudger import correct_violin_register, frames_to_segment_arrays, frames_to_segments, hz_to_note_info
+
+
+def reference_segments(times, f0_smooth, low_ok_for_register=200.0, note_change_cents_tolerance=40, min_segment_len_sec=0.05):
+    # steps 5-7 of the original analyze_violin_notes, unchanged
+    frame_notes = []
+    for t, raw_freq in zip(times, f0_smooth):
+        if np.isnan(raw_freq):
+            frame_notes.append(None)
+        else:
+            adj_freq = correct_violin_register(raw_freq, low_ok=low_ok_for_register)
+            frame_notes.append(hz_to_note_info(adj_freq))
+
+    segments = []
+    curr = None  # [note_name, start_t, end_t, (midi, cents)]
+    for t, n in zip(times, frame_notes):
+        if n is None:
+            if curr is not None:
+                segments.append(curr)
+                curr = None
+            continue
+        if curr is not None:
+            midi_ref, cents_ref = curr[3]
+            if n["midi"] == midi_ref and abs(n["cents_off"] - cents_ref) <= note_change_cents_tolerance:
+                curr[2] = t
+                continue
+            segments.append(curr)
+        curr = [n["note"], t, t, (n["midi"], n["cents_off"])]
+    if curr is not None:
+        segments.append(curr)
+
+    return [
+        {"note": name, "start_s": a, "end_s": b, "dur_s": b - a}
+        for name, a, b, _ in segments
+        if b - a >= min_segment_len_sec
+    ]
+
+
+def random_track(rng, hop_s=512 / 22050):
+    """
+    Held notes with vibrato, slow drifts past the tolerance, octave-down
+    errors, rests and single-frame blips: every branch of the segmenter.
+    """
+    f0 = []
+    while len(f0) < rng.integers(50, 400):
+        n = int(rng.integers(1, 40))
+        kind = rng.random()
+        if kind < 0.2:
+            f0.extend([np.nan] * n)
+            continue
+        hz = 440.0 * 2 ** ((rng.integers(45, 95) - 69) / 12)
+        cents = rng.normal(0, 8, n) + 20 * np.sin(np.arange(n) * rng.uniform(0.1, 0.8))
+        if kind < 0.35:
+            cents += np.linspace(0, rng.uniform(-120, 120), n)  # glide
+        track = hz * 2 ** (cents / 1200)
+        if kind > 0.9:
+            track /= rng.choice([2, 3, 4])  # subharmonic guess
+        f0.extend(track.tolist())
+    f0 = np.asarray(f0)
+    return np.arange(f0.size) * hop_s, f0
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_matches_reference_loop(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(500):
+        times, f0 = random_track(rng)
+        kwargs = dict(
+            low_ok_for_register=float(rng.choice([150.0, 200.0, 300.0])),
+            note_change_cents_tolerance=float(rng.choice([20, 40, 60])),
+            min_segment_len_sec=float(rng.choice([0.0, 0.05, 0.1])),
+        )
+        assert frames_to_segments(times, f0, **kwargs) == reference_segments(times, f0, **kwargs)
+
+
+def test_unvoiced_track():
+    times = np.arange(10) * 0.02
+    assert frames_to_segments(times, np.full(10, np.nan)) == []
+    assert len(frames_to_segment_arrays(times, np.full(10, np.nan))) == 0
@@ -0,0 +1,429 @@
+"""
+Process pool for the CPU-bound analysis endpoints.
+
+pyin / YIN / beat tracking / music21 are pure CPU work; running them inside
+an `async def` endpoint blocks the event loop for every other client. The
+endpoints hand that work to a pool of worker processes instead.
+
+Config (env vars):
+  ANALYSIS_WORKERS      worker processes (default: CPU count; 0 = run in a
+                        thread of this process, handy for local dev)
+  ANALYSIS_QUEUE_DEPTH  jobs allowed to wait for a free worker (default: 2 x workers)
+  ANALYSIS_MP_START     multiprocessing start method (default: spawn)
+  ANALYSIS_BLOCK_SEC    judge long takes block by block (default 60 s, 0 = off)
+
+When workers + queue are full, new requests get a 503 with Retry-After
+instead of piling up behind each other. The same happens while the pool is
+still warming up after a (re)start; /ready reports when it is done.
+"""
+import asyncio
+import concurrent.futures
+import importlib
+import io
+import multiprocessing
+import os
+import time
+
+from fastapi import HTTPException
+
+from metrics import REGISTRY, count_audio, record_stage, run_timed, stage
+
+
+class PoolSaturated(Exception):
+    """All workers busy and the wait queue is full."""
+
+
+class PoolWarming(PoolSaturated):
+    """Workers are still starting up / warming up."""
+
+
+class JobError(Exception):
+    """
+    HTTP-style failure raised inside a worker.
+    (fastapi.HTTPException does not survive pickling back to the parent.)
+    """
+    def __init__(self, status_code, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+########################################
+# WORKER SIDE
+########################################
+
+# per-stage warm-up seconds of this worker, reported back through _ready()
+_WARM_UP_TIMINGS = {}
+
+
+def synthetic_clip(sr=22050, seconds=2.0):
+    """
+    A few seconds of violin-ish tones (D4, E4, F#4, G4) as float32 samples
+    and as WAV bytes, enough to reach every stage of every analysis path.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    hz = [293.66, 329.63, 369.99, 392.00]
+    n = int(sr * seconds / len(hz))
+    t = np.arange(n) / sr
+    env = np.minimum(1.0, np.minimum(t, t[::-1]) / 0.02)
+    y = np.concatenate([0.5 * env * np.sin(2 * np.pi * f * t) for f in hz]).astype(np.float32)
+    buf = io.BytesIO()
+    sf.write(buf, y, sr, format="WAV")
+    return y, sr, buf.getvalue()
+
+
+def _timed(name, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _WARM_UP_TIMINGS[name] = round(time.perf_counter() - t0, 4)
+
+
+def warm_up(extra=()):
+    """
+    Import librosa/numba and push a short synthetic clip through every
+    analysis path once (decode + /analyzeSinglePlayer scoring with pyin and
+    yin, beat/onset tracking, the song index), so imports and numba JIT
+    compilation happen before the first real request instead of during it.
+    `extra` are more zero-argument callables to run the same way (app.py
+    adds the transcriber). Timings end up in _WARM_UP_TIMINGS.
+    """
+    t0 = time.perf_counter()
+    importlib.import_module("librosa")
+    from gameJudger import SONG_LIBRARY, analyze_violin_notes, judge_prepared, prepare_song
+    _WARM_UP_TIMINGS["imports"] = round(time.perf_counter() - t0, 4)
+
+    y, sr, wav_bytes = _timed("synth", synthetic_clip)
+    song = prepare_song(SONG_LIBRARY.keys()[0])
+
+    _timed("pyin", analyze_violin_notes, y, sr=sr, pitch_backend="pyin")
+    _timed("yin", analyze_violin_notes, y, sr=sr, pitch_backend="yin")
+    _timed("judge", judge_prepared, y, song, sr=sr)
+    _timed("song_index", SONG_LIBRARY.interval_index)
+    try:
+        _timed("decode", _decode_upload, wav_bytes)
+    except JobError:
+        pass  # no ffmpeg here: the endpoints report it per request
+
+    for fn in extra:
+        _timed(getattr(fn, "__name__", repr(fn)), fn)
+    _WARM_UP_TIMINGS["total"] = round(time.perf_counter() - t0, 4)
+
+
+def init_worker(ffmpeg_slots, extra=()):
+    """
+    Pool initializer: share the pool-wide ffmpeg semaphore, then warm_up(extra).
+    """
+    from decoding import set_ffmpeg_slots
+
+    set_ffmpeg_slots(ffmpeg_slots)
+    warm_up(extra)
+
+
+def _ready():
+    return {"pid": os.getpid(), "warm_up": dict(_WARM_UP_TIMINGS)}
+
+
+def _decode_upload(raw_bytes, target_sr=22050):
+    from decoding import decode_to_array, DecodeError, FfmpegNotFound
+
+    try:
+        with stage("decode"):
+            y, sr = decode_to_array(raw_bytes, target_sr=target_sr)
+        count_audio(len(y) / sr)
+        return y, sr
+    except FfmpegNotFound as e:
+        raise JobError(500, str(e))
+    except DecodeError as e:
+        raise JobError(400, str(e))
+
+
+# judge uploads through decoding.open_blocks + gameJudger.judge_blocks, so
+# worker memory is bounded by this many seconds (+ context) of audio at a time;
+# takes shorter than one block give exactly the whole-clip result. 0 = off.
+ANALYSIS_BLOCK_SEC = float(os.environ.get("ANALYSIS_BLOCK_SEC", 60))
+
+
+def _decoded_blocks(raw_bytes, target_sr):
+    """
+    (sr, chunk iterator, counter) for block-mode judging; counter["samples"]
+    is the decoded length once the iterator is exhausted. Decode time goes
+    to the "decode" stage, errors become JobErrors like _decode_upload's.
+    """
+    from decoding import open_blocks, DecodeError, FfmpegNotFound
+
+    counter = {"samples": 0}
+    try:
+        sr, chunks = open_blocks(raw_bytes, target_sr=target_sr)
+    except FfmpegNotFound as e:
+        raise JobError(500, str(e))
+    except DecodeError as e:
+        raise JobError(400, str(e))
+
+    def timed():
+        it = iter(chunks)
+        spent = 0.0
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    chunk = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    spent += time.perf_counter() - t0
+                counter["samples"] += chunk.size
+                yield chunk
+        except FfmpegNotFound as e:
+            raise JobError(500, str(e))
+        except DecodeError as e:
+            raise JobError(400, str(e))
+        finally:
+            record_stage("decode", spent)
+            count_audio(counter["samples"] / sr)
+
+    return sr, timed(), counter
+
+
+def judge_upload(raw_bytes, song):
+    """
+    Pool job behind /analyzeSinglePlayer and /analyzeBatch: decode the upload
+    in memory and score it. `song` is a song_key or a gameJudger.prepare_song()
+    dict (batches prepare it once and share it).
+    Returns (result dict, clip duration in seconds).
+    """
+    from gameJudger import DECODE_SR, judge_blocks, prepare_song
+
+    try:
+        if isinstance(song, str):
+            song = prepare_song(song)
+    except ValueError as e:
+        raise JobError(400, str(e))
+
+    # decoded straight to the song's analysis rate (ANALYSIS_SR policy)
+    target_sr = song.get("analysis_sr") or DECODE_SR
+    if ANALYSIS_BLOCK_SEC > 0:
+        sr, chunks, counter = _decoded_blocks(raw_bytes, target_sr)
+        result = judge_blocks(chunks, song, sr, block_sec=ANALYSIS_BLOCK_SEC)
+        return result, float(counter["samples"] / sr)
+
+    y, sr = _decode_upload(raw_bytes, target_sr)
+    return judge_samples(y, sr, song), float(len(y) / sr)
+
+
+def judge_samples(y, sr, song):
+    """
+    The scoring half of judge_upload for audio that is already decoded (the
+    live judge's final result): resampled to the rate judge_upload decodes
+    to and judged the same way, block mode included, so the same samples
+    get the same result as an upload. `song` is a prepare_song() dict.
+    """
+    from decoding import resample
+    from gameJudger import DECODE_SR, judge_blocks, judge_prepared
+
+    target_sr = song.get("analysis_sr") or DECODE_SR
+    y = resample(y, sr, target_sr)
+    if ANALYSIS_BLOCK_SEC > 0:
+        return judge_blocks(iter([y]), song, target_sr, block_sec=ANALYSIS_BLOCK_SEC)
+    return judge_prepared(y, song, sr=target_sr)
+
+
+def identify_upload(raw_bytes, top_k=5):
+    """
+    Pool job behind /identifySong: decode the upload and look it up in the
+    song library. Returns (result dict, clip duration in seconds).
+    """
+    from gameJudger import DECODE_SR, FULL_BAND, analysis_rate, identify_song
+
+    y, sr = _decode_upload(raw_bytes, analysis_rate(FULL_BAND["fmax_note"]) or DECODE_SR)
+    return identify_song(y, sr=sr, top_k=top_k), float(len(y) / sr)
+
+
+########################################
+# SERVER SIDE
+########################################
+
+class AnalysisPool:
+    def __init__(self, max_workers=None, queue_depth=None, mp_start=None, warm_ups=()):
+        if max_workers is None:
+            max_workers = int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 1))
+        if queue_depth is None:
+            queue_depth = int(os.environ.get("ANALYSIS_QUEUE_DEPTH", 2 * max(max_workers, 1)))
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.mp_start = mp_start or os.environ.get("ANALYSIS_MP_START", "spawn")
+        self.warm_ups = tuple(warm_ups)
+        self.in_flight = 0
+        self.ready = False
+        self.startup = None
+        self._executor = None
+
+    @property
+    def capacity(self):
+        return max(self.max_workers, 1) + self.queue_depth
+
+    def start(self):
+        """
+        Create the executor and block until every worker has run warm_up().
+        Afterwards `ready` is True and `startup` holds the timings:
+          {"sec": 9.8, "workers": [{"pid": 123, "warm_up": {"pyin": 4.1, ...}}, ...]}
+        """
+        t0 = time.perf_counter()
+        if self.max_workers > 0:
+            from decoding import FFMPEG_MAX
+
+            ctx = multiprocessing.get_context(self.mp_start)
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=ctx,
+                initializer=init_worker,
+                initargs=(ctx.BoundedSemaphore(FFMPEG_MAX), self.warm_ups),
+            )
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._executor.submit(warm_up, self.warm_ups).result()
+
+        # workers spawn lazily; one ping per worker forces them all up now
+        pings = [self._executor.submit(_ready) for _ in range(max(self.max_workers, 1))]
+        workers = {}
+        for p in pings:
+            info = p.result()
+            workers[info["pid"]] = info
+        self.startup = {"sec": round(time.perf_counter() - t0, 3), "workers": list(workers.values())}
+        self.ready = True
+
+    async def start_in_background(self):
+        """
+        start() off the event loop, for lifespan handlers that want to answer
+        /ready (503) while the workers warm up. A failure stays visible in
+        `startup` and keeps `ready` False.
+        """
+        try:
+            await asyncio.to_thread(self.start)
+        except Exception as e:
+            self.startup = {"error": f"{type(e).__name__}: {e}"}
+            raise
+
+    def shutdown(self):
+        self.ready = False
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _job_done(self, loop):
+        # executor callback thread -> event loop (gone after shutdown)
+        def done():
+            self.in_flight -= 1
+        try:
+            loop.call_soon_threadsafe(done)
+        except RuntimeError:
+            pass  # loop already closed
+
+    async def run(self, fn, *args, name=None):
+        """
+        Run fn(*args) in the pool. Raises PoolSaturated when full and
+        PoolWarming before start() has finished. Stage timings of the job
+        go to metrics.REGISTRY, labelled `name` (default: fn's name).
+        """
+        job_name = name or getattr(fn, "__name__", "job")
+        if not self.ready or self.in_flight >= self.capacity:
+            REGISTRY.inc("analysis_jobs_rejected_total", help="Pool jobs refused with 503.", job=job_name)
+            raise PoolWarming() if not self.ready else PoolSaturated()
+
+        future = self._executor.submit(run_timed, fn, *args)
+        # counted until the worker is done with it, not until this coroutine
+        # is: a cancelled request (client gone) leaves a started job running
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: self._job_done(loop))
+        try:
+            result, timings = await asyncio.wrap_future(future)
+        except Exception as e:
+            outcome = "job_error" if isinstance(e, JobError) else "error"
+            REGISTRY.inc("analysis_jobs_total", help="Finished pool jobs.", job=job_name, outcome=outcome)
+            raise
+        REGISTRY.inc("analysis_jobs_total", help="Finished pool jobs.", job=job_name, outcome="ok")
+        REGISTRY.record_job(job_name, timings)
+        return result
+
+
+async def dispatch(pool, fn, *args):
+    """
+    pool.run() for endpoints: saturation / warm-up -> 503 + Retry-After,
+    JobError -> HTTPException with the worker's status/detail.
+    """
+    try:
+        return await pool.run(fn, *args)
+    except PoolWarming:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis workers are warming up, retry shortly.",
+            headers={"Retry-After": "5"},
+        )
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis workers are busy, retry shortly.",
+            headers={"Retry-After": "2"},
+        )
+    except JobError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+async def stream_batch(pool, uploads, song, cache=None, saturated_retries=20, encoding="json", contour_hz=0):
+    """
+    Judge many uploads of one song through the pool and yield one NDJSON line
+    (or msgpack object, see responseFormat.encode_line) per player as soon as
+    it finishes:
+
+      {"player_id": "p1", "notes": [...], "accuracy": 0.8, "score": 800}
+      {"player_id": "p2", "error": "ffmpeg failed: ...", "status": 400}
+
+    uploads: list of (player_id, raw_bytes); song: gameJudger.prepare_song().
+    A batch keeps at most one job per worker in flight, so single-player requests still
+    get through; if the pool is saturated anyway, the item waits and retries.
+    Results share cache entries with /analyzeSinglePlayer. contour_hz > 0
+    adds each player's pitch contour (gameJudger.result_view).
+    """
+    from gameJudger import ANALYSIS_SR, result_view
+    from responseFormat import encode_line
+
+    slots = asyncio.Semaphore(max(pool.max_workers, 1))
+
+    async def judge_one(player_id, raw):
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(
+                raw, "analyzeSinglePlayer", song_key=song["song_key"], song_digest=song["song_digest"],
+                analysis_sr=ANALYSIS_SR, block_sec=ANALYSIS_BLOCK_SEC,
+            )
+            cached = await cache.get_async(cache_key)
+            if cached is not None:
+                return {"player_id": player_id, **result_view(cached[0], contour_hz)}
+
+        async with slots:
+            for _ in range(saturated_retries + 1):
+                try:
+                    result, dur_sec = await pool.run(judge_upload, raw, song)
+                    break
+                except PoolSaturated:
+                    await asyncio.sleep(0.5)
+                except JobError as e:
+                    return {"player_id": player_id, "error": e.detail, "status": e.status_code}
+            else:
+                return {"player_id": player_id, "error": "Analysis workers are busy, retry shortly.", "status": 503}
+
+        if cache is not None:
+            await cache.put_async(cache_key, [result, dur_sec])
+        return {"player_id": player_id, **result_view(result, contour_hz)}
+
+    tasks = [asyncio.ensure_future(judge_one(pid, raw)) for pid, raw in uploads]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield encode_line(await fut, encoding)
+    finally:
+        for t in tasks:  # client went away: drop whatever hasn't started
+            t.cancel()